@@ -51,7 +51,9 @@ async function initSupabase() {
             
             // Clear gallery
             currentRecipes = [];
+            recipesNextCursor = null;
             galleryGrid.innerHTML = '';
+            galleryLoadMore.style.display = 'none';
         }
     });
 }
@@ -757,9 +759,13 @@ let timerInterval;
 let isPaused = false;
 let pausedTime = 0;
 let audioBlob = null;
+let liveSession = null; // Live transcription session for the current recording
+let displayedRecipeId = null; // Saved ID of the recipe shown in the record view
 
 // Gallery State
 let currentRecipes = [];
+let recipesNextCursor = null; // Cursor for the next page of the gallery (null on the last page)
+let recipesSearchQuery = '';
 let currentRecipeId = null;
 let isEditMode = false;
 let originalRecipeData = null;
@@ -817,6 +823,8 @@ const galleryGrid = document.getElementById('galleryGrid');
 const emptyState = document.getElementById('emptyState');
 const galleryLoadingCard = document.getElementById('galleryLoadingCard');
 const goToRecordBtn = document.getElementById('goToRecordBtn');
+const galleryLoadMore = document.getElementById('galleryLoadMore');
+const loadMoreRecipesBtn = document.getElementById('loadMoreRecipesBtn');
 
 // DOM Elements - Recipe Modal
 const recipeModal = document.getElementById('recipeModal');
@@ -880,6 +888,7 @@ goToRecordBtn.addEventListener('click', () => switchView('record'));
 // Event Listeners - Gallery
 searchBtn.addEventListener('click', searchRecipes);
 clearSearchBtn.addEventListener('click', clearSearch);
+loadMoreRecipesBtn.addEventListener('click', loadMoreRecipes);
 searchInput.addEventListener('keypress', (e) => {
     if (e.key === 'Enter') searchRecipes();
 });
@@ -921,6 +930,102 @@ uploadArea.addEventListener('drop', (e) => {
     }
 });
 
+// Live Transcription Functions
+// MediaRecorder chunks are streamed to the server while recording so the
+// transcript is ready as soon as the user stops. Any failure just falls back
+// to uploading the finished recording.
+function startLiveSession(mimeType, language) {
+    const session = { id: null, ok: true, blob: null, chain: null };
+
+    session.chain = fetch('/api/live/start', {
+        method: 'POST',
+        headers: getAuthHeaders(),
+        body: JSON.stringify({ mime_type: mimeType, language: language })
+    }).then(async (response) => {
+        if (!response.ok) throw new Error(`Live session unavailable (${response.status})`);
+        const data = await response.json();
+        session.id = data.session_id;
+        console.log('Live transcription session started:', session.id);
+    }).catch((error) => {
+        console.warn('Live transcription disabled for this recording:', error.message);
+        session.ok = false;
+    });
+
+    liveSession = session;
+}
+
+function sendLiveChunk(chunk) {
+    const session = liveSession;
+    if (!session || !session.ok) return;
+
+    // Chain uploads so chunks arrive in recording order
+    session.chain = session.chain.then(async () => {
+        if (!session.ok) return;
+        const response = await fetch(`/api/live/${session.id}/chunk`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/octet-stream', 'Authorization': `Bearer ${authToken}` },
+            body: chunk
+        });
+        if (!response.ok) throw new Error(`Chunk upload failed (${response.status})`);
+    }).catch((error) => {
+        console.warn('Live transcription stopped:', error.message);
+        session.ok = false;
+    });
+}
+
+function stopLiveSession(blob) {
+    const session = liveSession;
+    if (!session) return;
+
+    session.blob = blob;
+    session.chain = session.chain.then(() => {
+        if (!session.ok) return;
+        return fetch(`/api/live/${session.id}/stop`, {
+            method: 'POST',
+            headers: getAuthHeaders()
+        });
+    }).catch(() => {
+        session.ok = false;
+    });
+}
+
+function cancelLiveSession() {
+    const session = liveSession;
+    liveSession = null;
+    if (!session) return;
+
+    session.chain.then(() => {
+        if (session.id) {
+            fetch(`/api/live/${session.id}`, { method: 'DELETE', headers: getAuthHeaders() }).catch(() => {});
+        }
+    });
+}
+
+// Returns the /finish response, or null if the caller should upload the recording instead
+async function finishLiveSession(blob, outputLanguage) {
+    const session = liveSession;
+    if (!session || session.blob !== blob) return null;
+    liveSession = null;
+
+    try {
+        await session.chain;
+        if (!session.ok || !session.id) return null;
+
+        const response = await fetch(`/api/live/${session.id}/finish`, {
+            method: 'POST',
+            headers: getAuthHeaders(),
+            body: JSON.stringify({ output_language: outputLanguage })
+        });
+
+        // Session lost (e.g. server restarted): upload the recording instead
+        if (response.status === 404) return null;
+        return response;
+    } catch (error) {
+        console.warn('Live transcription finish failed, uploading instead:', error.message);
+        return null;
+    }
+}
+
 // Recording Functions
 function resetRecording() {
     if (mediaRecorder && mediaRecorder.state !== 'inactive') {
@@ -931,6 +1036,7 @@ function resetRecording() {
         mediaRecorder.stream.getTracks().forEach(track => track.stop());
     }
     
+    cancelLiveSession();
     clearInterval(timerInterval);
     audioChunks = [];
     audioBlob = null;
@@ -961,6 +1067,8 @@ async function startRecording() {
         
         mediaRecorder = new MediaRecorder(stream);
         audioChunks = [];
+        cancelLiveSession();
+        startLiveSession(mediaRecorder.mimeType || 'audio/webm', languageSelectRecord.value);
         recordingStartTime = Date.now();
         recordingDuration = 0;
         isPaused = false;
@@ -969,6 +1077,7 @@ async function startRecording() {
         mediaRecorder.ondataavailable = (event) => {
             if (event.data.size > 0) {
                 audioChunks.push(event.data);
+                sendLiveChunk(event.data);
                 console.log('Audio chunk received:', event.data.size, 'bytes');
             }
         };
@@ -985,6 +1094,7 @@ async function startRecording() {
             
             const mimeType = mediaRecorder.mimeType || 'audio/webm';
             audioBlob = new Blob(audioChunks, { type: mimeType });
+            stopLiveSession(audioBlob);
             console.log('Audio blob created:', audioBlob.size, 'bytes', 'type:', mimeType);
             
             if (audioBlob.size === 0) {
@@ -1135,6 +1245,7 @@ function handleFileUpload() {
             return;
         }
 
+        cancelLiveSession();
         audioBlob = file;
         uploadedFileName.textContent = `📎 ${file.name}`;
         uploadedFileName.classList.add('show');
@@ -1198,11 +1309,16 @@ async function transcribeAndGenerateRecipe() {
             headers['Authorization'] = `Bearer ${authToken}`;
         }
 
-        const response = await fetch('/api/process-recipe', {
-            method: 'POST',
-            headers: headers,
-            body: formData
-        });
+        // Recorded audio was already streamed: just finish the live session
+        let response = await finishLiveSession(audioBlob, formData.get('output_language') || 'en');
+
+        if (!response) {
+            response = await fetch('/api/process-recipe', {
+                method: 'POST',
+                headers: headers,
+                body: formData
+            });
+        }
 
         if (!response.ok) {
             const errorData = await response.json();
@@ -1218,7 +1334,24 @@ async function transcribeAndGenerateRecipe() {
             throw new Error(errorData.error || 'Failed to process audio');
         }
 
-        const data = await response.json();
+        let data = await response.json();
+
+        // Background job: follow its progress until the recipe is ready
+        if (response.status === 202 && data.job_id) {
+            const job = await waitForRecipeJob(data.job_id);
+
+            if (job.status !== 'succeeded') {
+                const jobError = job.error || {};
+                if (job.http_status === 402) {
+                    alert('Insufficient credits! Please purchase more credits to continue.');
+                    pricingModal.style.display = 'block';
+                    loadingCard.style.display = 'none';
+                    return;
+                }
+                throw new Error(jobError.error || 'Failed to process audio');
+            }
+            data = job.result;
+        }
         
         // Update credits display
         if (data.credits_remaining !== undefined && userCreditsSpan) {
@@ -1247,6 +1380,96 @@ async function transcribeAndGenerateRecipe() {
     }
 }
 
+// Recipe Job Progress
+const JOB_STAGE_MESSAGES = {
+    queued: 'Waiting for a free slot...',
+    decoding: 'Preparing audio...',
+    transcribing: 'Transcribing audio...',
+    extracting: 'Extracting recipe details...',
+    saving: 'Saving your recipe...'
+};
+
+function parseSseEvent(raw) {
+    const event = { type: 'message', data: '' };
+    raw.split('\n').forEach(line => {
+        if (line.startsWith('event:')) event.type = line.slice(6).trim();
+        else if (line.startsWith('data:')) event.data += line.slice(5).trim();
+    });
+    try {
+        event.data = event.data ? JSON.parse(event.data) : null;
+    } catch (e) {
+        event.data = null;
+    }
+    return event;
+}
+
+// Follow a recipe job over Server-Sent Events (fetch is used instead of
+// EventSource so the Authorization header can be sent). Recipe fields are
+// rendered as soon as Gemini writes them. Resolves with the final job
+// snapshot; falls back to polling if the stream drops.
+async function waitForRecipeJob(jobId) {
+    let partialRecipe = null;
+
+    try {
+        const response = await fetch(`/api/jobs/${jobId}/events`, { headers: getAuthHeaders() });
+        if (response.ok && response.body) {
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+                    const event = parseSseEvent(buffer.slice(0, boundary));
+                    buffer = buffer.slice(boundary + 2);
+
+                    if (event.type === 'progress' && event.data) {
+                        // Once the recipe is on screen, keep it there instead of the spinner
+                        if (!partialRecipe) {
+                            showLoading(JOB_STAGE_MESSAGES[event.data.stage] || 'Working on your recipe...');
+                        }
+                    } else if (event.type === 'field' && event.data) {
+                        partialRecipe = partialRecipe || {};
+                        const { kind, key, value } = event.data;
+                        if (kind === 'item') {
+                            // Arrays arrive element by element, then once more as a whole
+                            (partialRecipe[key] = partialRecipe[key] || []).push(value);
+                        } else {
+                            partialRecipe[key] = value;
+                        }
+                        displayRecipe(partialRecipe);
+                    } else if (event.type === 'done' && event.data) {
+                        return event.data;
+                    }
+                }
+            }
+        }
+    } catch (error) {
+        console.warn('Job event stream failed, polling instead:', error.message);
+    }
+
+    return pollRecipeJob(jobId);
+}
+
+async function pollRecipeJob(jobId) {
+    while (true) {
+        const response = await fetch(`/api/jobs/${jobId}`, { headers: getAuthHeaders() });
+        if (!response.ok) {
+            throw new Error('Lost track of your recipe job');
+        }
+        const job = await response.json();
+        if (job.status === 'succeeded' || job.status === 'failed') {
+            return job;
+        }
+        showLoading(JOB_STAGE_MESSAGES[job.stage] || 'Working on your recipe...');
+        await new Promise(resolve => setTimeout(resolve, 1500));
+    }
+}
+
 function showLoading(message) {
     loadingMessage.textContent = message;
     loadingCard.style.display = 'block';
@@ -1255,6 +1478,7 @@ function showLoading(message) {
 
 function displayRecipe(data) {
     let html = '';
+    displayedRecipeId = data.id || null;
 
     // Recipe Title
     if (data.recipe_name) {
@@ -1387,6 +1611,7 @@ function resetApp() {
     if (mediaRecorder && mediaRecorder.state !== 'inactive') {
         mediaRecorder.stop();
     }
+    cancelLiveSession();
     clearInterval(timerInterval);
     audioChunks = [];
     audioBlob = null;
@@ -1680,7 +1905,7 @@ async function generateRecipeImage() {
                 'Content-Type': 'application/json',
                 'Authorization': `Bearer ${authToken}`
             },
-            body: JSON.stringify({ recipe: recipeData })
+            body: JSON.stringify({ recipe: recipeData, recipe_id: displayedRecipeId })
         });
 
         const data = await response.json();
@@ -1690,6 +1915,8 @@ async function generateRecipeImage() {
         }
 
         if (data.success && data.image) {
+            showRecipeImage(recipeContent, data);
+
             // Create a download link for the generated image
             const link = document.createElement('a');
             link.download = data.filename;
@@ -1773,7 +2000,7 @@ async function generateRecipeImageFromModal() {
                 'Content-Type': 'application/json',
                 'Authorization': `Bearer ${authToken}`
             },
-            body: JSON.stringify({ recipe: recipeData })
+            body: JSON.stringify({ recipe: recipeData, recipe_id: currentRecipeId })
         });
 
         const data = await response.json();
@@ -1783,6 +2010,14 @@ async function generateRecipeImageFromModal() {
         }
 
         if (data.success && data.image) {
+            showRecipeImage(modalRecipeContent, data);
+            if (data.image_key) {
+                // The server saved it on the recipe; keep the gallery's copy in step
+                const galleryRecipe = currentRecipes.find(r => r.id === currentRecipeId);
+                if (galleryRecipe) galleryRecipe.image_key = data.image_key;
+                if (originalRecipeData) originalRecipeData.image_key = data.image_key;
+            }
+
             // Create a download link for the generated image
             const link = document.createElement('a');
             link.download = data.filename;
@@ -1806,6 +2041,31 @@ async function generateRecipeImageFromModal() {
     }
 }
 
+// Compressed variants of a stored image (see /api/images/<key>/<variant>)
+function imageVariantUrls(imageKey) {
+    const base = `/api/images/${encodeURIComponent(imageKey)}`;
+    return { full: `${base}/full`, preview: `${base}/preview`, thumb: `${base}/thumb` };
+}
+
+// The browser picks the smallest variant that fills the slot, in WebP/AVIF when it accepts them
+function recipeImageHtml(variants, className, sizes) {
+    return `
+        <picture class="${className}">
+            <img src="${variants.preview}"
+                 srcset="${variants.thumb} 320w, ${variants.preview} 1024w"
+                 sizes="${sizes}" alt="Recipe card" loading="lazy" decoding="async">
+        </picture>
+    `;
+}
+
+function showRecipeImage(container, data) {
+    container.querySelector('.recipe-image')?.remove();
+    const html = data.variants
+        ? recipeImageHtml(data.variants, 'recipe-image', '(max-width: 768px) 100vw, 720px')
+        : `<picture class="recipe-image"><img src="${data.image}" alt="Recipe card"></picture>`; // not stored, inlined
+    container.insertAdjacentHTML('afterbegin', html);
+}
+
 // Check browser support
 if (!navigator.mediaDevices || !navigator.mediaDevices.getUserMedia) {
     showError('Your browser does not support audio recording. Please use a modern browser like Chrome, Firefox, or Edge.');
@@ -1840,26 +2100,41 @@ function switchView(view) {
     }
 }
 
+// Fetch one page of recipes (newest first), after `cursor` if given
+async function fetchRecipesPage(searchQuery, cursor) {
+    const params = new URLSearchParams();
+    if (searchQuery) params.set('search', searchQuery);
+    if (cursor) params.set('cursor', cursor);
+    const query = params.toString();
+
+    const response = await fetch(query ? `/api/recipes?${query}` : '/api/recipes', {
+        headers: getAuthHeaders()
+    });
+    
+    if (!response.ok) {
+        throw new Error('Failed to load recipes');
+    }
+
+    return response.json();
+}
+
+function updateRecipeCount() {
+    const more = recipesNextCursor ? '+' : '';
+    recipeCount.textContent = `${currentRecipes.length}${more} recipe${currentRecipes.length !== 1 || more ? 's' : ''}`;
+    galleryLoadMore.style.display = recipesNextCursor ? 'block' : 'none';
+}
+
 async function loadRecipes(searchQuery = '') {
     try {
         galleryLoadingCard.style.display = 'block';
         galleryGrid.innerHTML = '';
+        galleryLoadMore.style.display = 'none';
         emptyState.style.display = 'none';
 
-        const url = searchQuery 
-            ? `/api/recipes?search=${encodeURIComponent(searchQuery)}`
-            : '/api/recipes';
-        
-        const response = await fetch(url, {
-            headers: getAuthHeaders()
-        });
-        
-        if (!response.ok) {
-            throw new Error('Failed to load recipes');
-        }
-
-        const data = await response.json();
+        recipesSearchQuery = searchQuery;
+        const data = await fetchRecipesPage(searchQuery, null);
         currentRecipes = data.recipes || [];
+        recipesNextCursor = data.next_cursor || null;
 
         galleryLoadingCard.style.display = 'none';
 
@@ -1868,7 +2143,7 @@ async function loadRecipes(searchQuery = '') {
             recipeCount.textContent = '0 recipes';
         } else {
             displayRecipeGallery(currentRecipes);
-            recipeCount.textContent = `${currentRecipes.length} recipe${currentRecipes.length !== 1 ? 's' : ''}`;
+            updateRecipeCount();
         }
 
     } catch (error) {
@@ -1886,8 +2161,29 @@ async function loadRecipes(searchQuery = '') {
     }
 }
 
-function displayRecipeGallery(recipes) {
-    galleryGrid.innerHTML = '';
+async function loadMoreRecipes() {
+    if (!recipesNextCursor) return;
+
+    loadMoreRecipesBtn.disabled = true;
+    try {
+        const data = await fetchRecipesPage(recipesSearchQuery, recipesNextCursor);
+        const recipes = data.recipes || [];
+        currentRecipes = currentRecipes.concat(recipes);
+        recipesNextCursor = data.next_cursor || null;
+        displayRecipeGallery(recipes, true);
+        updateRecipeCount();
+    } catch (error) {
+        console.error('Error loading more recipes:', error);
+        alert('Failed to load more recipes. Please try again.');
+    } finally {
+        loadMoreRecipesBtn.disabled = false;
+    }
+}
+
+function displayRecipeGallery(recipes, append = false) {
+    if (!append) {
+        galleryGrid.innerHTML = '';
+    }
 
     recipes.forEach(recipe => {
         const card = createRecipeGalleryCard(recipe);
@@ -1905,6 +2201,7 @@ function createRecipeGalleryCard(recipe) {
     card.onclick = () => openRecipeModal(recipe);
 
     card.innerHTML = `
+        ${recipe.image_key ? recipeImageHtml(imageVariantUrls(recipe.image_key), 'gallery-card-image', '(max-width: 768px) 100vw, 320px') : ''}
         <div class="gallery-card-header">
             <h3 class="gallery-card-title">${recipe.recipe_name || 'Untitled Recipe'}</h3>
             <span class="gallery-card-author">by ${recipe.author || 'Unknown'}</span>
@@ -1917,6 +2214,7 @@ function createRecipeGalleryCard(recipe) {
         <div class="gallery-card-description">
             ${recipe.description || 'No description available'}
         </div>
+        ${renderSearchHighlight(recipe.search)}
         <div class="gallery-card-footer">
             <span class="gallery-card-date">📅 ${formatDate(recipe.created_at)}</span>
         </div>
@@ -1925,6 +2223,44 @@ function createRecipeGalleryCard(recipe) {
     return card;
 }
 
+// Where a search matched, e.g. "ingredients: …1 tsp <mark>turmeric</mark>…"
+const SEARCH_FIELD_LABELS = {
+    recipe_name: 'Name',
+    author: 'Author',
+    description: 'Description',
+    ingredients: 'Ingredients',
+    instructions: 'Instructions',
+    tips: 'Tips'
+};
+
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+
+function renderSearchHighlight(search) {
+    // The name and description are already on the card; show the first other match
+    const highlight = search && (search.highlights || []).find(h => h.field !== 'recipe_name' && h.field !== 'description');
+    if (!highlight) return '';
+
+    let html = '';
+    let position = 0;
+    highlight.matches.forEach(([start, end]) => {
+        html += escapeHtml(highlight.text.slice(position, start));
+        html += `<mark>${escapeHtml(highlight.text.slice(start, end))}</mark>`;
+        position = end;
+    });
+    html += escapeHtml(highlight.text.slice(position));
+
+    return `
+        <div class="gallery-card-match">
+            <span class="gallery-card-match-field">${SEARCH_FIELD_LABELS[highlight.field] || highlight.field}:</span>
+            ${highlight.prefix ? '…' : ''}${html}${highlight.suffix ? '…' : ''}
+        </div>
+    `;
+}
+
 function searchRecipes() {
     const query = searchInput.value.trim();
     loadRecipes(query);
@@ -1974,6 +2310,11 @@ function closeModal() {
 function displayRecipeInModal(data, editable = false) {
     let html = '';
 
+    // Recipe card image, if one was generated for this recipe
+    if (!editable && data.image_key) {
+        html += recipeImageHtml(imageVariantUrls(data.image_key), 'recipe-image', '(max-width: 768px) 100vw, 720px');
+    }
+
     // Recipe Title
     if (editable) {
         html += `<h1 class="recipe-title" contenteditable="true" data-field="recipe_name">${data.recipe_name || ''}</h1>`;
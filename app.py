@@ -1,29 +1,39 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Request, Response, request, jsonify, send_from_directory
 from flask_cors import CORS
 from google.cloud import speech_v1p1beta1 as speech
 import google.generativeai as genai
 import os
 import json
-from pathlib import Path
 import tempfile
 from dotenv import load_dotenv
-import soundfile as sf
-import numpy as np
-from scipy import signal as scipy_signal
 import io
-from supabase import create_client, Client
 from datetime import datetime
 import jwt
 from functools import wraps
 import base64
+import copy
+import hmac
+import unicodedata
 import time
-from collections import defaultdict
-import requests
+from concurrent.futures import ThreadPoolExecutor
 import config_credits
-import google.auth
-import google.auth.transport.requests
 from werkzeug.exceptions import HTTPException
-# from google.oauth2 import service_account # Moved to inside function to avoid startup errors
+import audio_pipeline
+import live_transcription
+import upstream_clients
+import cache_store
+import context_cache
+import image_generation
+import image_store
+import image_variants
+import metrics
+import rate_limiter
+import auth_tokens
+import model_router
+import recipe_jobs
+import recipe_parser
+import recipe_search
+import supabase_gateway
 
 # Load environment variables from .env file
 load_dotenv()
@@ -56,7 +66,17 @@ elif os.getenv('GOOGLE_APPLICATION_CREDENTIALS'):
 else:
     print("⚠ WARNING: No Google Cloud credentials configured!")
 
+class InMemoryUploadRequest(Request):
+    """Keep uploaded files in memory instead of werkzeug's spooled temp files"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
+
+
 app = Flask(__name__, static_folder='.')
+app.request_class = InMemoryUploadRequest
+# Reject oversized bodies before they are buffered (small allowance for multipart overhead)
+app.config['MAX_CONTENT_LENGTH'] = audio_pipeline.MAX_AUDIO_UPLOAD_BYTES + 1024 * 1024
 CORS(app)
 
 @app.errorhandler(Exception)
@@ -84,53 +104,97 @@ SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY')
 SUPABASE_JWT_SECRET = os.getenv('SUPABASE_JWT_SECRET')
 
-# Rate Limiting Configuration
-RATE_LIMIT_WINDOW = 60  # 1 minute
-RATE_LIMIT_MAX_REQUESTS = 5  # 5 requests per minute
-rate_limit_store = defaultdict(list)
+# Shared secret for /api/metrics (sent as X-Metrics-Token); the endpoint is off when unset
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
 
-def check_rate_limit(user_id):
-    """Check if user has exceeded rate limit"""
-    current_time = time.time()
-    # Filter out old requests
-    rate_limit_store[user_id] = [t for t in rate_limit_store[user_id] if current_time - t < RATE_LIMIT_WINDOW]
-    
-    if len(rate_limit_store[user_id]) >= RATE_LIMIT_MAX_REQUESTS:
-        return False
-    
-    rate_limit_store[user_id].append(current_time)
-    return True
+# Rate limiting: token buckets per user and endpoint (limits and backend in rate_limiter.py)
+def check_rate_limit(user_id, limit='process-recipe'):
+    """
+    Take one request from the user's bucket for `limit`. Returns None if
+    allowed, otherwise a 429 response with a Retry-After header.
+    """
+    allowed, retry_after = rate_limiter.hit(limit, user_id)
+    if allowed:
+        return None
+
+    response = jsonify({
+        'error': f'Rate limit exceeded. Please wait {retry_after} seconds before trying again.',
+        'retry_after': retry_after
+    })
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
+
+# Speech-to-Text chunk concurrency (shared by all requests in this worker).
+# 8 covers a full 5-minute recording in a single wave of ~50 s chunks.
+STT_MAX_PARALLEL = int(os.getenv('STT_MAX_PARALLEL', '8'))
+stt_executor = ThreadPoolExecutor(max_workers=STT_MAX_PARALLEL, thread_name_prefix='stt')
+
+# Transcription cache: re-submitted recordings skip Speech-to-Text entirely.
+# Transcripts are user content, so they are only kept for a day.
+transcription_cache = cache_store.TieredCache(
+    'transcriptions',
+    max_entries=int(os.getenv('TRANSCRIPTION_CACHE_SIZE', '256')),
+    ttl=int(os.getenv('TRANSCRIPTION_CACHE_TTL', str(24 * 3600)))
+)
+
+# Stream Gemini extraction so background jobs can push recipe fields as they complete
+GEMINI_STREAM_EXTRACTION = os.getenv('GEMINI_STREAM_EXTRACTION', 'true').lower() not in ('0', 'false', 'no')
+
+# Recipe extraction mode: 'schema' (JSON response schema, short prompt) or
+# 'freeform' (JSON layout described in the prompt)
+EXTRACTION_MODES = ('schema', 'freeform')
+GEMINI_EXTRACTION_MODE = os.getenv('GEMINI_EXTRACTION_MODE', 'schema').lower()
+if GEMINI_EXTRACTION_MODE not in EXTRACTION_MODES:
+    print(f"⚠ Unknown GEMINI_EXTRACTION_MODE '{GEMINI_EXTRACTION_MODE}', using 'schema'")
+    GEMINI_EXTRACTION_MODE = 'schema'
+
+# Extraction cache. Bump EXTRACTION_PROMPT_VERSION whenever the prompt or
+# schema changes so old results stop matching.
+EXTRACTION_PROMPT_VERSION = '1'
+extraction_cache = cache_store.TieredCache(
+    'extractions',
+    max_entries=int(os.getenv('EXTRACTION_CACHE_SIZE', '256')),
+    ttl=int(os.getenv('EXTRACTION_CACHE_TTL', str(7 * 24 * 3600)))
+)
+
+# Generated images, keyed by prompt hash (local disk or Supabase Storage)
+images = image_store.create_store()
+
+# Credit balances per user, written through from every RPC that returns a
+# new_balance so /api/user/credits rarely needs the database
+credit_balances = cache_store.TieredCache(
+    'credit_balances',
+    max_entries=int(os.getenv('CREDIT_BALANCE_CACHE_SIZE', '1024')),
+    ttl=int(os.getenv('CREDIT_BALANCE_CACHE_TTL', '60')),
+    disk_dir=None
+)
 
 # Configure Gemini API
 if GEMINI_API_KEY:
     genai.configure(api_key=GEMINI_API_KEY)
-    # Use the latest stable flash model
-    model = genai.GenerativeModel('models/gemini-2.5-flash')
 
-# Initialize Supabase client only if credentials are provided
-supabase: Client = None
-if SUPABASE_URL and SUPABASE_KEY:
-    try:
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-        print("✓ Supabase client initialized")
-    except Exception as e:
-        print(f"⚠ Warning: Failed to initialize Supabase client: {str(e)}")
-        print("  Database features will be disabled.")
-        supabase = None
+# Create upstream clients and open connections before the first request
+upstream_clients.start_warm_up(supabase_url=SUPABASE_URL, gemini_api_key=GEMINI_API_KEY)
+
+# All table and RPC calls go through the gateway (pooled, with timeouts and retries)
+db = supabase_gateway.SupabaseGateway(SUPABASE_URL, SUPABASE_KEY, os.getenv('SUPABASE_SERVICE_KEY'))
+if db.configured:
+    print("✓ Supabase gateway initialized")
 else:
     print("⚠ Warning: Supabase credentials not found in .env file.")
     print("  Database features will be disabled.")
     print("  Add SUPABASE_URL and SUPABASE_KEY to .env to enable gallery and recipe management.")
 
-# Ensure uploads directory exists
-UPLOAD_FOLDER = Path('uploads')
-UPLOAD_FOLDER.mkdir(exist_ok=True)
-
 
 # ============================================================================
 # AUTHENTICATION MIDDLEWARE
 # ============================================================================
 
+# Shared-secret (HS256) and JWKS (RS256/ES256) verification with a claims cache
+token_verifier = auth_tokens.TokenVerifier(SUPABASE_JWT_SECRET, SUPABASE_URL)
+token_verifier.start()
+
+
 def verify_token(f):
     """Decorator to verify Supabase JWT token"""
     @wraps(f)
@@ -144,17 +208,12 @@ def verify_token(f):
         if not token:
             return jsonify({'error': 'Authentication required'}), 401
         
-        if not SUPABASE_JWT_SECRET:
+        if not token_verifier.configured:
             return jsonify({'error': 'Server authentication not configured'}), 500
         
         try:
-            # Verify and decode the JWT token
-            payload = jwt.decode(
-                token,
-                SUPABASE_JWT_SECRET,
-                algorithms=['HS256'],
-                audience='authenticated'
-            )
+            # Verify and decode the JWT token (cached until it expires)
+            payload = token_verifier.verify(token)
             
             # Extract user_id from the token
             request.user_id = payload.get('sub')
@@ -199,238 +258,538 @@ def serve_static(path):
     return send_from_directory('.', path)
 
 
-@app.route('/api/process-recipe', methods=['POST'])
-@verify_token
-def process_recipe():
+def remember_credit_balance(user_id, balance):
+    """Write a balance reported by the database through to the cache"""
+    if user_id and isinstance(balance, int):
+        credit_balances.set(user_id, balance)
+
+
+def fetch_credit_balance(token, user_id):
     """
-    Process uploaded audio file:
-    1. Transcribe using Google Speech-to-Text
-    2. Extract recipe information using Gemini
+    Current balance from the profiles table (DEFAULT_NEW_USER_CREDITS if the
+    profile doesn't exist yet). Raises on a failed request.
+    """
+    data = db.as_user(token).select('profiles', {'id': user_id}, columns='credits')
+    if data and len(data) > 0:
+        balance = data[0]['credits']
+    else:
+        # Profile might not exist yet for old users or if trigger failed.
+        # The deduct/reserve RPCs create it with the default credits.
+        balance = config_credits.DEFAULT_NEW_USER_CREDITS
+    remember_credit_balance(user_id, balance)
+    return balance
+
+
+def check_credit_balance(token, user_id):
+    """
+    Pre-check (read-only) that the user can afford a recipe BEFORE starting
+    the expensive pipeline. Returns None if they can, otherwise an error
+    (payload, status) tuple. Plain dicts so background jobs can use it too.
     """
-    # Check rate limit
-    if not check_rate_limit(request.user_id):
-        return jsonify({'error': 'Rate limit exceeded. Please wait a minute before trying again.'}), 429
-
     RECIPE_COST = config_credits.RECIPE_GENERATION_COST
     
-    # 1. Pre-check credits (Read-only)
-    # We check if user has enough credits BEFORE starting the expensive process
     try:
-        token = request.headers.get('Authorization').split(' ')[1]
-        headers = {
-            "apikey": SUPABASE_KEY,
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
-        
-        # Query profiles table via REST API to ensure we use the user's auth context
-        check_url = f"{SUPABASE_URL}/rest/v1/profiles?id=eq.{request.user_id}&select=credits"
-        check_response = requests.get(check_url, headers=headers)
-        
-        current_credits = 0
-        if check_response.status_code == 200:
-            data = check_response.json()
-            if data and len(data) > 0:
-                current_credits = data[0]['credits']
-            else:
-                # If profile doesn't exist, they have default credits
-                current_credits = config_credits.DEFAULT_NEW_USER_CREDITS
-        else:
-            print(f"Error checking credits status: {check_response.status_code} - {check_response.text}")
-            return jsonify({'error': 'Unable to verify credit balance.'}), 500
+        # Always ask the database: a cached balance may predate a purchase or spend
+        current_credits = fetch_credit_balance(token, user_id)
             
         if current_credits < RECIPE_COST:
-            return jsonify({
+            return {
                 'error': 'Insufficient credits', 
                 'code': 'INSUFFICIENT_CREDITS',
                 'current_balance': current_credits,
                 'required': RECIPE_COST
-            }), 402
+            }, 402
             
     except Exception as e:
         print(f"Error checking credit balance: {str(e)}")
         # Fail safe: If we can't check, we might block or allow. 
         # Let's block to be safe, but with a helpful message.
-        return jsonify({'error': 'Unable to verify credit balance. Please try again.'}), 500
+        return {'error': 'Unable to verify credit balance. Please try again.'}, 500
+
+    return None
+
+
+# Credit holds. Reservations need the reserve/commit/release RPCs from
+# credits_migration.sql (Step 8); without them we fall back to check-then-deduct.
+CREDIT_RESERVATION_TTL = 600  # Seconds before an abandoned hold is released
+CREDIT_RESERVATIONS_AVAILABLE = True
+# Commit attempts before the recipe is returned, then in the background
+# (backoff doubles each time; the background ones span most of the TTL)
+CREDIT_COMMIT_ATTEMPTS = 3
+CREDIT_COMMIT_BACKGROUND_ATTEMPTS = 8
+CREDIT_COMMIT_BACKOFF_SECONDS = 0.5
+credit_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='credits')
+
+
+def reserve_recipe_credits(token, user_id):
+    """
+    Hold RECIPE_GENERATION_COST for one recipe before the pipeline starts,
+    in a single round trip. Returns (reservation, None), or (None, (payload,
+    status)) if the user can't afford it or the balance can't be checked.
+    """
+    global CREDIT_RESERVATIONS_AVAILABLE
+    RECIPE_COST = config_credits.RECIPE_GENERATION_COST
+
+    if CREDIT_RESERVATIONS_AVAILABLE:
+        try:
+            result = db.as_user(token).rpc('reserve_credits', {"amount": RECIPE_COST, "ttl_seconds": CREDIT_RESERVATION_TTL})
+        except supabase_gateway.SupabaseError as e:
+            if e.status != 404:
+                print(f"Error reserving credits: {str(e)}")
+                return None, ({'error': 'Unable to verify credit balance. Please try again.'}, 500)
+            print("⚠ reserve_credits RPC not found (run Step 8 of credits_migration.sql); using check-then-deduct")
+            CREDIT_RESERVATIONS_AVAILABLE = False
+        else:
+            if result.get('success'):
+                print(f"✓ Reserved {RECIPE_COST} credits. Balance while held: {result.get('new_balance')}")
+                remember_credit_balance(user_id, result.get('new_balance'))
+                return dict(result, user_id=user_id), None
+            if result.get('error') == 'Insufficient credits':
+                remember_credit_balance(user_id, result.get('current_balance'))
+                return None, ({
+                    'error': 'Insufficient credits',
+                    'code': 'INSUFFICIENT_CREDITS',
+                    'current_balance': result.get('current_balance'),
+                    'required': RECIPE_COST
+                }, 402)
+            print(f"Error reserving credits: {result}")
+            return None, ({'error': 'Unable to verify credit balance.'}, 500)
+
+    credit_error = check_credit_balance(token, user_id)
+    if credit_error:
+        return None, credit_error
+    return {'legacy': True}, None
+
+
+def settle_credit_reservation(token, reservation, action):
+    """
+    Commit ('commit') or release ('release') a hold. Each reservation is
+    settled at most once; legacy reservations need nothing.
+
+    A commit is what makes the user pay, so it runs before the recipe is
+    returned and is retried (the RPC is idempotent); if Supabase is still
+    failing it keeps retrying in the background until the hold would expire.
+    A release runs in the background: if it fails, the hold expires back to
+    the user anyway.
+    """
+    if not reservation or reservation.get('legacy') or reservation.get('settled'):
+        return
+    reservation['settled'] = action
+
+    if action == 'release':
+        credit_executor.submit(_settle_with_retries, token, reservation, action, 1, 0)
+        return
+
+    if not _settle_with_retries(token, reservation, action, CREDIT_COMMIT_ATTEMPTS, CREDIT_COMMIT_BACKOFF_SECONDS):
+        # Keep trying while the hold is still ours to commit
+        credit_executor.submit(_settle_with_retries, token, reservation, action,
+                               CREDIT_COMMIT_BACKGROUND_ATTEMPTS, CREDIT_COMMIT_BACKOFF_SECONDS * 4)
+
+
+def _settle_with_retries(token, reservation, action, attempts, backoff):
+    """Call {action}_credit_reservation up to `attempts` times; True once it succeeded"""
+    reservation_id = reservation['reservation_id']
+    for attempt in range(attempts):
+        if attempt:
+            time.sleep(min(backoff * (2 ** (attempt - 1)), 60))
+        try:
+            result = db.as_user(token).rpc(f'{action}_credit_reservation', {"reservation_id": reservation_id})
+        except Exception as e:
+            print(f"Error during credit reservation {action} (attempt {attempt + 1}/{attempts}): {str(e)}")
+            continue
+
+        if result.get('success'):
+            print(f"✓ Credit reservation {reservation_id}: {action} done")
+            # A release refunds the hold; a commit leaves the balance as it was
+            remember_credit_balance(reservation.get('user_id'), result.get('new_balance'))
+            return True
+
+        # The hold was already released (it expired before we could commit it),
+        # so this recipe went unpaid; retrying can't change that
+        print(f"⚠️ Warning: Credit reservation {reservation_id} {action} failed: {result.get('error')}")
+        metrics.incr(f'credits.{action}_rejected')
+        return True
+
+    metrics.incr(f'credits.{action}_failed')
+    return False
+
+
+def deduct_recipe_credits(token, user_id, recipe_data):
+    """Check-then-deduct fallback for databases without the reservation RPCs"""
+    RECIPE_COST = config_credits.RECIPE_GENERATION_COST
 
     try:
-        # Check if file is present
-        if 'audio' not in request.files:
-            return jsonify({'error': 'No audio file provided'}), 400
+        # Call the RPC function
+        deduct_result = db.as_user(token).rpc('deduct_credits', {"amount": RECIPE_COST})
+        
+        if not deduct_result.get('success'):
+            # This is a rare edge case: User had credits at start, but spent them during generation
+            # We will still return the recipe (freebie) but warn the user or log it
+            print(f"⚠️ Warning: Failed to deduct credits AFTER generation: {deduct_result.get('error')}")
+            # We don't block the user here because they already waited for the recipe
+        else:
+            print(f"✓ Deducted {RECIPE_COST} credits. New balance: {deduct_result.get('new_balance')}")
+            remember_credit_balance(user_id, deduct_result.get('new_balance'))
+            # Add credit info to response so frontend can update UI
+            recipe_data['credits_remaining'] = deduct_result.get('new_balance')
+            
+    except Exception as credit_error:
+        print(f"Error deducting credits: {str(credit_error)}")
+        # Continue anyway, don't block the recipe
 
-        audio_file = request.files['audio']
-        language_code = request.form.get('language', 'en-US')  # Default to English US
-        output_language = request.form.get('output_language', 'en') # Default to English
-        
-        # Save audio file temporarily
-        temp_audio_path = UPLOAD_FOLDER / f'temp_{audio_file.filename}'
-        audio_file.save(temp_audio_path)
 
+def complete_recipe(transcription, output_language, user_id, token, on_stage=None, on_field=None, regenerate=False,
+                    reservation=None):
+    """
+    Everything after transcription: extract the recipe with Gemini, settle
+    credits and save to the database. Shared by the upload and live flows.
+    on_stage(stage) is called as the pipeline moves to 'extracting' and 'saving';
+    on_field receives streamed recipe fields (see extract_recipe_with_gemini);
+    regenerate bypasses the extraction cache. reservation is the credit hold
+    from reserve_recipe_credits; it is committed once the recipe exists.
+    """
+    on_stage = on_stage or (lambda stage: None)
+
+    # Step 2: Extract recipe using Gemini
+    on_stage('extracting')
+    print(f"Extracting recipe information in {output_language}...")
+    recipe_data = extract_recipe_with_gemini(transcription, output_language, on_field=on_field, regenerate=regenerate)
+
+    # Add transcription to response
+    recipe_data['transcription'] = transcription
+    
+    # Step 3: Deduct Credits (ONLY after successful generation)
+    on_stage('saving')
+    if reservation and not reservation.get('legacy'):
+        # The credits were taken off when they were reserved; commit the hold so it can't expire back
+        settle_credit_reservation(token, reservation, 'commit')
+        recipe_data['credits_remaining'] = reservation.get('new_balance')
+    else:
+        deduct_recipe_credits(token, user_id, recipe_data)
+    
+    # Save recipe to Supabase database with user_id
+    if db.configured:
+        try:
+            saved_recipe = save_recipe_to_db(recipe_data, user_id, token)
+            recipe_data['id'] = saved_recipe.get('id')
+            print(f"✓ Recipe saved to database with ID: {recipe_data['id']}")
+        except Exception as db_error:
+            print(f"Warning: Failed to save to database: {str(db_error)}")
+            # Continue without database save
+
+    return recipe_data
+
+
+TRANSCRIPTION_FAILED_MESSAGE = 'Failed to transcribe audio. Please ensure:\n• Audio contains clear speech\n• Recording is not too quiet\n• There is minimal background noise\n• Audio duration is at least 1 second'
+
+
+def run_recipe_pipeline(job, audio_bytes, filename, language_code, output_language, user_id, token, regenerate=False, stream_fields=True):
+    """
+    Full upload pipeline: decode -> pre-flight -> credit hold ->
+    transcribe -> extract -> commit/save. Reports progress (and, with
+    stream_fields, each recipe field as Gemini writes it) on `job` and
+    raises recipe_jobs.JobFailed with the same bodies the endpoint returns.
+    """
+    # Decode the upload in memory (no temp files, no shared filenames)
+    job.set_stage('decoding')
+    decoded_audio = audio_pipeline.decode_audio(audio_bytes, filename)
+
+    # Reject silent/short/clipped audio in milliseconds, before any paid call
+    rejection = audio_pipeline.preflight(decoded_audio)
+    if rejection:
+        print(f"Rejected audio in pre-flight: {rejection}")
+        raise recipe_jobs.JobFailed({'error': TRANSCRIPTION_FAILED_MESSAGE, 'reason': rejection}, 400)
+
+    # 1. Hold the recipe's credits (released again if anything below fails)
+    reservation, credit_error = reserve_recipe_credits(token, user_id)
+    if credit_error:
+        raise recipe_jobs.JobFailed(*credit_error)
+
+    try:
         # Step 1: Transcribe audio
+        job.set_stage('transcribing')
         print(f"Starting transcription with language: {language_code}...")
-        transcription = transcribe_audio(temp_audio_path, language_code)
+        transcription = transcribe_audio(decoded_audio, language_code)
         
         if not transcription:
-            # Clean up temp file before returning error
-            if temp_audio_path.exists():
-                temp_audio_path.unlink()
-            return jsonify({
-                'error': 'Failed to transcribe audio. Please ensure:\n• Audio contains clear speech\n• Recording is not too quiet\n• There is minimal background noise\n• Audio duration is at least 1 second'
-            }), 400
+            raise recipe_jobs.JobFailed({'error': TRANSCRIPTION_FAILED_MESSAGE}, 400)
 
         print(f"Transcription: {transcription}")
 
-        # Step 2: Extract recipe using Gemini
-        print(f"Extracting recipe information in {output_language}...")
-        recipe_data = extract_recipe_with_gemini(transcription, output_language)
+        return complete_recipe(
+            transcription, output_language, user_id, token,
+            on_stage=job.set_stage,
+            on_field=job.add_field if stream_fields else None,
+            regenerate=regenerate,
+            reservation=reservation
+        )
+    except Exception:
+        settle_credit_reservation(token, reservation, 'release')
+        raise
 
-        # Clean up temp file
-        if temp_audio_path.exists():
-            temp_audio_path.unlink()
 
-        # Add transcription to response
-        recipe_data['transcription'] = transcription
-        
-        # Step 3: Deduct Credits (ONLY after successful generation)
+@app.route('/api/process-recipe', methods=['POST'])
+@verify_token
+def process_recipe():
+    """
+    Process uploaded audio file:
+    1. Transcribe using Google Speech-to-Text
+    2. Extract recipe information using Gemini
+
+    By default the pipeline runs as a background job: responds 202 with a
+    job id to follow via /api/jobs/<id> or /api/jobs/<id>/events.
+    Pass mode=sync (query or form) to wait for the recipe in this request.
+    """
+    # Check rate limit
+    rate_limited = check_rate_limit(request.user_id)
+    if rate_limited:
+        return rate_limited
+
+    token = request.headers.get('Authorization').split(' ')[1]
+
+    # Check if file is present
+    if 'audio' not in request.files:
+        return jsonify({'error': 'No audio file provided'}), 400
+
+    audio_file = request.files['audio']
+    language_code = request.form.get('language', 'en-US')  # Default to English US
+    output_language = request.form.get('output_language', 'en') # Default to English
+    # regenerate=true asks for a fresh extraction instead of a cached one
+    regenerate = request.form.get('regenerate', '').lower() in ('1', 'true', 'yes')
+
+    try:
+        audio_bytes = audio_pipeline.read_upload(audio_file)
+    except audio_pipeline.AudioTooLargeError as size_error:
+        return jsonify({'error': str(size_error)}), 413
+
+    pipeline_args = (audio_bytes, audio_file.filename, language_code, output_language, request.user_id, token, regenerate)
+
+    if (request.args.get('mode') or request.form.get('mode')) == 'sync':
         try:
-            token = request.headers.get('Authorization').split(' ')[1]
-            url = f"{SUPABASE_URL}/rest/v1/rpc/deduct_credits"
-            headers = {
-                "apikey": SUPABASE_KEY,
-                "Authorization": f"Bearer {token}",
-                "Content-Type": "application/json"
-            }
-            
-            # Call the RPC function
-            deduct_response = requests.post(url, headers=headers, json={"amount": RECIPE_COST})
-            deduct_result = deduct_response.json()
-            
-            if not deduct_result.get('success'):
-                # This is a rare edge case: User had credits at start, but spent them during generation
-                # We will still return the recipe (freebie) but warn the user or log it
-                print(f"⚠️ Warning: Failed to deduct credits AFTER generation: {deduct_result.get('error')}")
-                # We don't block the user here because they already waited for the recipe
-            else:
-                print(f"✓ Deducted {RECIPE_COST} credits. New balance: {deduct_result.get('new_balance')}")
-                # Add credit info to response so frontend can update UI
-                recipe_data['credits_remaining'] = deduct_result.get('new_balance')
-                
-        except Exception as credit_error:
-            print(f"Error deducting credits: {str(credit_error)}")
-            # Continue anyway, don't block the recipe
-        
-        # Save recipe to Supabase database with user_id
-        if supabase:
-            try:
-                saved_recipe = save_recipe_to_db(recipe_data, request.user_id)
-                recipe_data['id'] = saved_recipe.get('id')
-                print(f"✓ Recipe saved to database with ID: {recipe_data['id']}")
-            except Exception as db_error:
-                print(f"Warning: Failed to save to database: {str(db_error)}")
-                # Continue without database save
+            recipe_data = run_recipe_pipeline(recipe_jobs.RecipeJob(request.user_id), *pipeline_args, stream_fields=False)
+            return jsonify(recipe_data)
+        except recipe_jobs.JobFailed as e:
+            return jsonify(e.payload), e.status
+        except Exception as e:
+            print(f"Error processing recipe: {str(e)}")
+            return jsonify({'error': f'We encountered an issue generating your recipe. Please try again. (Error: {str(e)})'}), 500
+
+    try:
+        job = recipe_jobs.submit(request.user_id, run_recipe_pipeline, *pipeline_args)
+    except recipe_jobs.JobQueueFullError as e:
+        return jsonify({'error': str(e)}), 503
+
+    return jsonify({
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': f'/api/jobs/{job.id}',
+        'events_url': f'/api/jobs/{job.id}/events'
+    }), 202
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@verify_token
+def get_job_status(job_id):
+    """Current stage of a recipe job, plus the recipe (or error) once finished"""
+    job = recipe_jobs.get_job(job_id, request.user_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+@verify_token
+def stream_job_events(job_id):
+    """
+    Server-Sent Events for a recipe job: a 'progress' event per stage change,
+    a 'field' event per recipe field/list item as Gemini streams it, and a
+    final 'done' event carrying the same body as /api/jobs/<id>.
+    """
+    job = recipe_jobs.get_job(job_id, request.user_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    def generate():
+        offset = 0
+        while True:
+            events = job.events_since(offset, timeout=15)
+            if not events:
+                # Keep proxies from closing an idle stream
+                yield ': keep-alive\n\n'
+                continue
+            offset += len(events)
+
+            for event, data in events:
+                yield sse_event(event, data)
+                if event == 'done':
+                    return
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+# ============================================================================
+# LIVE TRANSCRIPTION (STREAMING WHILE RECORDING)
+# ============================================================================
+
+@app.route('/api/live/start', methods=['POST'])
+@verify_token
+def start_live_session():
+    """
+    Open a live transcription session for a recording that is about to start.
+    Returns a session id the client streams MediaRecorder chunks to.
+    """
+    rate_limited = check_rate_limit(request.user_id)
+    if rate_limited:
+        return rate_limited
+
+    token = request.headers.get('Authorization').split(' ')[1]
+
+    # Streaming STT costs money as soon as audio arrives, so check credits up front
+    credit_error = check_credit_balance(token, request.user_id)
+    if credit_error:
+        payload, status = credit_error
+        return jsonify(payload), status
+
+    data = request.get_json(silent=True) or {}
+    language_code = data.get('language', 'en-US')
+    mime_type = data.get('mime_type', 'audio/webm')
+
+    try:
+        session = live_transcription.create_session(request.user_id, language_code, mime_type, upstream_clients.get_speech_client)
+    except live_transcription.LiveSessionError as e:
+        # The client falls back to uploading the finished recording
+        return jsonify({'error': str(e), 'code': 'LIVE_UNAVAILABLE'}), 503
+
+    return jsonify({'session_id': session.id}), 201
+
+
+@app.route('/api/live/<session_id>/chunk', methods=['POST'])
+@verify_token
+def push_live_chunk(session_id):
+    """Append one MediaRecorder chunk (raw request body) to a live session"""
+    session = live_transcription.get_session(session_id, request.user_id)
+    if not session:
+        return jsonify({'error': 'Live session not found', 'code': 'LIVE_SESSION_NOT_FOUND'}), 404
+
+    try:
+        session.feed(request.get_data())
+    except live_transcription.LiveSessionError as e:
+        return jsonify({'error': str(e)}), 409
+
+    return '', 204
+
+
+@app.route('/api/live/<session_id>/stop', methods=['POST'])
+@verify_token
+def stop_live_session(session_id):
+    """Recording stopped: end the audio stream so the final transcript is ready by /finish"""
+    session = live_transcription.get_session(session_id, request.user_id)
+    if not session:
+        return jsonify({'error': 'Live session not found', 'code': 'LIVE_SESSION_NOT_FOUND'}), 404
+
+    session.close()
+    return '', 204
+
+
+@app.route('/api/live/<session_id>/finish', methods=['POST'])
+@verify_token
+def finish_live_session(session_id):
+    """
+    Collect the live transcript and immediately run recipe extraction.
+    Responds exactly like /api/process-recipe.
+    """
+    session = live_transcription.get_session(session_id, request.user_id)
+    if not session:
+        return jsonify({'error': 'Live session not found', 'code': 'LIVE_SESSION_NOT_FOUND'}), 404
+
+    token = request.headers.get('Authorization').split(' ')[1]
+    data = request.get_json(silent=True) or {}
+    output_language = data.get('output_language', 'en')
+    regenerate = bool(data.get('regenerate'))
+    reservation = None
+
+    try:
+        transcription = session.wait_transcript()
+
+        if not transcription and session.audio_bytes():
+            # Streaming failed or heard nothing: retry once on the full recording
+            print(f"Live session {session_id}: falling back to full-recording transcription")
+            decoded_audio = audio_pipeline.decode_audio(session.audio_bytes(), f'live{session.mime_type.replace("audio/", ".")}')
+            rejection = audio_pipeline.preflight(decoded_audio)
+            if rejection:
+                print(f"Rejected live recording in pre-flight: {rejection}")
+                return jsonify({'error': TRANSCRIPTION_FAILED_MESSAGE, 'reason': rejection}), 400
+            transcription = transcribe_audio(decoded_audio, session.language_code)
+
+        if not transcription:
+            return jsonify({'error': TRANSCRIPTION_FAILED_MESSAGE}), 400
+
+        print(f"Live transcription: {transcription}")
+
+        reservation, credit_error = reserve_recipe_credits(token, request.user_id)
+        if credit_error:
+            payload, status = credit_error
+            return jsonify(payload), status
+
+        recipe_data = complete_recipe(
+            transcription, output_language, request.user_id, token,
+            regenerate=regenerate, reservation=reservation
+        )
 
         return jsonify(recipe_data)
 
     except Exception as e:
-        print(f"Error processing recipe: {str(e)}")
-        # Clean up temp file if it exists
-        if 'temp_audio_path' in locals() and temp_audio_path.exists():
-            temp_audio_path.unlink()
-            
+        settle_credit_reservation(token, reservation, 'release')
+        print(f"Error finishing live recipe: {str(e)}")
         return jsonify({'error': f'We encountered an issue generating your recipe. Please try again. (Error: {str(e)})'}), 500
+    finally:
+        live_transcription.discard_session(session_id)
+
+
+@app.route('/api/live/<session_id>', methods=['DELETE'])
+@verify_token
+def cancel_live_session(session_id):
+    """Discard a live session (recording reset or abandoned)"""
+    if live_transcription.get_session(session_id, request.user_id):
+        live_transcription.discard_session(session_id)
+    return '', 204
 
 
-def transcribe_audio(audio_path, language_code='en-US'):
+def transcribe_audio(decoded_audio, language_code='en-US'):
     """
-    Transcribe audio file using Google Speech-to-Text API
+    Transcribe decoded audio using Google Speech-to-Text API
     """
+    # Identical audio (retries, re-submits) hits the cache instead of STT.
+    # Keyed on the normalized 16kHz mono PCM, so container/bitrate differences don't matter.
+    cache_key = None
+    if decoded_audio.pcm is not None:
+        cache_key = cache_store.hash_key(decoded_audio.pcm_bytes(), language_code)
+        cached = transcription_cache.get(cache_key)
+        if cached:
+            print(f"✓ Transcription cache hit ({decoded_audio.duration:.1f}s of audio)")
+            return cached
+
     try:
-        # Initialize the Speech client
-        client = speech.SpeechClient()
+        # Shared Speech client (created once per worker)
+        client = upstream_clients.get_speech_client()
 
-        print(f"Processing audio file: {audio_path}")
-        
-        # Check file size
-        file_size = os.path.getsize(audio_path)
-        print(f"Audio file size: {file_size} bytes")
-        
-        if file_size == 0:
-            print("Error: Audio file is empty")
-            return None
-        
-        # For WebM files, convert using ffmpeg (more reliable than soundfile)
-        file_ext = Path(audio_path).suffix.lower()
-        
-        if file_ext in ['.webm', '.opus']:
-            print("Converting WebM to WAV using ffmpeg...")
-            try:
-                import subprocess
-                
-                # Convert to WAV using ffmpeg
-                wav_path = str(audio_path).replace(file_ext, '_converted.wav')
-                
-                # ffmpeg command: convert to mono, 16kHz, 16-bit PCM WAV
-                cmd = [
-                    'ffmpeg', '-y', '-i', str(audio_path),
-                    '-acodec', 'pcm_s16le',
-                    '-ar', '16000',
-                    '-ac', '1',
-                    wav_path
-                ]
-                
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                
-                if result.returncode != 0:
-                    print(f"ffmpeg conversion failed: {result.stderr}")
-                    raise Exception("ffmpeg conversion failed")
-                
-                print(f"✓ Converted to WAV: {wav_path}")
-                audio_path = Path(wav_path)
-                file_ext = '.wav'
-                
-            except FileNotFoundError:
-                print("⚠ ffmpeg not found, trying soundfile conversion...")
-            except Exception as ffmpeg_error:
-                print(f"⚠ ffmpeg error: {ffmpeg_error}, trying soundfile...")
-        
-        # Try with audio conversion (for non-WebM or if ffmpeg failed)
-        try:
-            # Load audio file with soundfile
-            audio_data, sample_rate = sf.read(audio_path, always_2d=True)
-            
-            print(f"Loaded audio: {audio_data.shape} at {sample_rate}Hz")
+        if decoded_audio.pcm is not None:
+            # Decoded in memory: send raw 16kHz mono LINEAR16 samples
+            content = decoded_audio.pcm_bytes()
             
-            # Check if audio has data
-            if len(audio_data) == 0:
-                print("Error: Audio data is empty")
-                return None
-            
-            # Convert to mono if stereo (average channels)
-            if audio_data.shape[1] > 1:
-                audio_data = np.mean(audio_data, axis=1)
-            else:
-                audio_data = audio_data[:, 0]
-            
-            # Resample to 16kHz if needed (optimal for speech recognition)
-            target_rate = 16000
-            if sample_rate != target_rate:
-                # Calculate resampling ratio
-                num_samples = int(len(audio_data) * target_rate / sample_rate)
-                audio_data = scipy_signal.resample(audio_data, num_samples)
-                sample_rate = target_rate
-                print(f"Resampled to {sample_rate}Hz, {len(audio_data)} samples")
-            
-            # Convert to 16-bit PCM and export as WAV in memory
-            wav_io = io.BytesIO()
-            sf.write(wav_io, audio_data, sample_rate, subtype='PCM_16', format='WAV')
-            wav_io.seek(0)
-            content = wav_io.read()
-            
-            print(f"Generated WAV: {len(content)} bytes")
+            print(f"Generated PCM: {len(content)} bytes ({decoded_audio.duration:.1f}s)")
             
             config = speech.RecognitionConfig(
                 encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-                sample_rate_hertz=16000,
+                sample_rate_hertz=decoded_audio.sample_rate,
                 language_code=language_code,  # Use provided language code
                 enable_automatic_punctuation=True,
                 model='default',
@@ -439,12 +798,14 @@ def transcribe_audio(audio_path, language_code='en-US'):
             
             print("Using converted audio format (LINEAR16)")
             
-        except Exception as conv_error:
-            print(f"Audio conversion failed: {conv_error}")
+        else:
+            # Fallback: send the raw upload bytes
+            content = decoded_audio.raw
+            file_ext = decoded_audio.file_ext
             
-            # Fallback: Read raw audio file
-            with open(audio_path, 'rb') as audio_file:
-                content = audio_file.read()
+            if not content:
+                print("Error: Audio file is empty")
+                return None
             
             print(f"Using raw audio: {len(content)} bytes")
             
@@ -472,24 +833,21 @@ def transcribe_audio(audio_path, language_code='en-US'):
             
             print(f"Using direct audio format: {encoding} at {sample_rate}Hz")
 
-        audio = speech.RecognitionAudio(content=content)
-
-        # Perform the transcription
-        print("Sending audio to Google Speech-to-Text...")
-        response = client.recognize(config=config, audio=audio)
-
-        # Extract transcription
-        transcription = ''
-        for result in response.results:
-            transcription += result.alternatives[0].transcript + ' '
-
-        transcription = transcription.strip()
+        if decoded_audio.pcm is not None and decoded_audio.duration > audio_pipeline.MAX_CHUNK_SECONDS:
+            # Long recording: split at pauses and transcribe chunks in parallel
+            transcription = transcribe_chunked(client, config, decoded_audio)
+        else:
+            # Perform the transcription
+            print("Sending audio to Google Speech-to-Text...")
+            transcription = recognize_content(client, config, content)
         
         if not transcription:
             print("No transcription results returned from API - audio may be empty or unclear")
             return None
             
         print(f"Transcription successful: {transcription[:100]}...")
+        if cache_key:
+            transcription_cache.set(cache_key, transcription)
         return transcription
 
     except Exception as e:
@@ -499,45 +857,108 @@ def transcribe_audio(audio_path, language_code='en-US'):
         return None
 
 
-def extract_recipe_with_gemini(transcription, output_language='en'):
+def recognize_content(client, config, content):
+    """Run one synchronous recognize call and join the result alternatives"""
+    audio = speech.RecognitionAudio(content=content)
+    response = client.recognize(config=config, audio=audio)
+
+    # Extract transcription
+    transcription = ''
+    for result in response.results:
+        transcription += result.alternatives[0].transcript + ' '
+
+    return transcription.strip()
+
+
+def transcribe_chunked(client, config, decoded_audio):
     """
-    Use Google Gemini to extract structured recipe information from transcription
+    Transcribe a long recording by splitting it at silence boundaries and
+    recognizing the chunks concurrently, so wall-clock time tracks the longest
+    chunk rather than the total duration. Results are stitched back in order.
     """
-    try:
-        # Map language codes to full names for better prompting
-        language_names = {
-            'en': 'English',
-            'es': 'Spanish',
-            'hi': 'Hindi',
-            'ta': 'Tamil',
-            'te': 'Telugu',
-            'ml': 'Malayalam',
-            'kn': 'Kannada',
-            'bn': 'Bengali',
-            'mr': 'Marathi',
-            'gu': 'Gujarati',
-            'fr': 'French',
-            'de': 'German',
-            'it': 'Italian',
-            'pt': 'Portuguese',
-            'zh': 'Chinese',
-            'ja': 'Japanese',
-            'ko': 'Korean',
-            'ar': 'Arabic',
-            'ru': 'Russian',
-            'th': 'Thai',
-            'vi': 'Vietnamese',
-            'id': 'Indonesian',
-            'ms': 'Malay'
-        }
-        
-        target_language = language_names.get(output_language, 'English')
-        
-        prompt = f"""
-You are a recipe extraction expert. Analyze the following transcription of someone describing a recipe and extract structured recipe information.
+    pcm = decoded_audio.pcm
+    chunks = audio_pipeline.split_on_silence(pcm, decoded_audio.sample_rate)
+    print(f"Long recording ({decoded_audio.duration:.1f}s): transcribing {len(chunks)} chunks in parallel...")
 
-Transcription:
-{transcription}
+    futures = [
+        stt_executor.submit(recognize_content, client, config, pcm[start:end].astype('<i2', copy=False).tobytes())
+        for start, end in chunks
+    ]
+    # Any failed chunk fails the whole transcription rather than returning partial text
+    parts = [future.result() for future in futures]
+
+    return audio_pipeline.stitch_transcripts(parts, chunks)
+
+
+# Response schema for 'schema' mode. Descriptions carry the per-field rules
+# that the free-form prompt spells out in its JSON template.
+RECIPE_RESPONSE_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'recipe_name': {'type': 'string', 'description': 'Descriptive, appetizing name of the dish'},
+        'author': {'type': 'string', 'description': "Author if mentioned, otherwise 'Home Chef'"},
+        'description': {'type': 'string', 'description': 'Brief description of the dish'},
+        'prep_time': {'type': 'string', 'description': "Chopping, mixing, marinating time, e.g. '15 minutes'"},
+        'cook_time': {'type': 'string', 'description': "Time on heat or in the oven, e.g. '30 minutes'"},
+        'yield': {'type': 'string', 'description': "Servings, e.g. 'Serves 4'"},
+        'ingredients': {'type': 'array', 'items': {'type': 'string'}},
+        'instructions': {'type': 'array', 'items': {'type': 'string'}},
+        'tips': {'type': 'array', 'items': {'type': 'string'}},
+    },
+    'required': ['recipe_name', 'author', 'description', 'prep_time', 'cook_time', 'yield',
+                 'ingredients', 'instructions', 'tips'],
+}
+
+
+# Output languages offered in the UI; also the keys for cached extraction instructions
+LANGUAGE_NAMES = {
+    'en': 'English',
+    'es': 'Spanish',
+    'hi': 'Hindi',
+    'ta': 'Tamil',
+    'te': 'Telugu',
+    'ml': 'Malayalam',
+    'kn': 'Kannada',
+    'bn': 'Bengali',
+    'mr': 'Marathi',
+    'gu': 'Gujarati',
+    'fr': 'French',
+    'de': 'German',
+    'it': 'Italian',
+    'pt': 'Portuguese',
+    'zh': 'Chinese',
+    'ja': 'Japanese',
+    'ko': 'Korean',
+    'ar': 'Arabic',
+    'ru': 'Russian',
+    'th': 'Thai',
+    'vi': 'Vietnamese',
+    'id': 'Indonesian',
+    'ms': 'Malay'
+}
+
+
+def build_extraction_instructions(output_language='en', mode='freeform'):
+    """
+    The fixed part of the extraction prompt. It depends only on mode and
+    output_language, which lets it be cached on Gemini's side.
+    """
+    target_language = LANGUAGE_NAMES.get(output_language, 'English')
+
+    if mode == 'schema':
+        # The JSON layout comes from RECIPE_RESPONSE_SCHEMA, so only the content rules remain
+        return f"""You are a recipe extraction expert. Extract the recipe described in the transcription.
+
+Guidelines:
+- Write all text values in {target_language}, translating if needed.
+- Ingredients: "quantity measurement ingredient (metric equivalent if applicable)", e.g. "2 cups (240g) flour".
+- Instructions: clear, detailed steps. Tips: cooking tips, variations or notes mentioned (may be empty).
+- Always give prep_time, cook_time and yield; estimate them from the recipe if not mentioned.
+- Use "Home Chef" as author if none is mentioned.
+"""
+    
+    prompt = f"""
+You are a recipe extraction expert. Analyze the transcription of someone describing a recipe and extract structured recipe information.
 
 Please extract and return the recipe information in the following JSON format.
 IMPORTANT: The content of the recipe (name, description, ingredients, instructions, tips) MUST be in {target_language}.
@@ -581,9 +1002,193 @@ Important guidelines:
 
 Return ONLY the JSON object, no additional text.
 """
+    return prompt
+
+
+def build_extraction_prompt(transcription, output_language='en', mode='freeform'):
+    """Build the full Gemini prompt for extracting a recipe in output_language"""
+    return build_extraction_instructions(output_language, mode) + transcription_message(transcription)
+
+
+def transcription_message(transcription):
+    """The per-request part of the prompt"""
+    return f"""
+Transcription:
+{transcription}
+"""
+
+
+def read_response_text(response):
+    """
+    Get the text of a Gemini response, handling safety blocks and MAX_TOKENS
+    truncation (where response.text raises)
+    """
+    # Extract the text response safely
+    try:
+        return response.text.strip()
+    except Exception as e:
+        # Handle cases where response.text fails (e.g. safety filters or max tokens with no valid part)
+        print(f"Error accessing response.text: {str(e)}")
+        
+        if not response.candidates:
+            raise Exception("Gemini returned no candidates.")
+            
+        candidate = response.candidates[0]
+        print(f"Candidate finish reason: {candidate.finish_reason}")
+        
+        # Check for safety blocks
+        if candidate.finish_reason == 3: # SAFETY
+            raise Exception("The recipe content was flagged by safety filters. Please try again with different wording.")
+            
+        # Check for max tokens
+        if candidate.finish_reason == 2: # MAX_TOKENS
+            # Use whatever was written; parse_recipe_response salvages the complete fields
+            if candidate.content and candidate.content.parts:
+                response_text = ''.join(part.text for part in candidate.content.parts if getattr(part, 'text', None)).strip()
+                print("Warning: Response truncated due to max tokens, attempting to parse partial response.")
+            else:
+                raise Exception("Response was truncated due to length limits and no text was returned.")
+        else:
+            raise Exception(f"Gemini returned no valid text. Finish reason: {candidate.finish_reason}")
+
+    return response_text
+
+
+def parse_recipe_response(response_text, transcription, mode='freeform'):
+    """
+    Parse Gemini's JSON reply into a recipe dict, with defaults and a fallback structure.
+    Truncated or slightly malformed replies keep every field that was fully written.
+    Returns (recipe_data, complete); complete is False for salvaged or fallback recipes.
+    """
+    print(f"Raw Gemini response (first 500 chars): {response_text[:500]}")
+
+    recipe_data, complete = recipe_parser.parse_recipe(response_text)
+
+    if recipe_data is None:
+        print("Error parsing Gemini response: no usable recipe fields found")
+        print(f"Full response text:\n{response_text}")
+        metrics.incr(f'gemini.extraction.{mode}.parse_failed')
+        # Return a fallback structure
+        return {
+            'recipe_name': 'Recipe from Audio',
+            'author': 'Home Chef',
+            'description': 'Could not extract structured recipe data. Please try again.',
+            'ingredients': [],
+            'instructions': [transcription],
+            'prep_time': '15 minutes',
+            'cook_time': '30 minutes',
+            'yield': 'Serves 4',
+            'tips': ['The AI had trouble parsing the recipe. You can edit this manually.']
+        }, False
+
+    if not complete:
+        print(f"Warning: Gemini response was incomplete, salvaged fields: {', '.join(recipe_data)}")
+        metrics.incr(f'gemini.extraction.{mode}.salvaged')
+
+    # Ensure critical fields have default values if missing
+    if not all(recipe_data.get(key) for key in ('prep_time', 'cook_time', 'yield', 'author')):
+        metrics.incr(f'gemini.extraction.{mode}.defaults_filled')
+    if not recipe_data.get('prep_time'):
+        recipe_data['prep_time'] = '15 minutes'
+    if not recipe_data.get('cook_time'):
+        recipe_data['cook_time'] = '30 minutes'
+    if not recipe_data.get('yield'):
+        recipe_data['yield'] = 'Serves 4'
+    if not recipe_data.get('author'):
+        recipe_data['author'] = 'Home Chef'
+
+    return recipe_data, complete
+
+
+def record_extraction_usage(mode, response):
+    """Count calls and prompt/output tokens per extraction mode; returns (prompt, output) tokens"""
+    metrics.incr(f'gemini.extraction.{mode}.calls')
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return 0, 0
+    prompt_tokens = getattr(usage, 'prompt_token_count', 0) or 0
+    output_tokens = getattr(usage, 'candidates_token_count', 0) or 0
+    cached_tokens = getattr(usage, 'cached_content_token_count', 0) or 0
+    metrics.incr(f'gemini.extraction.{mode}.prompt_tokens', prompt_tokens)
+    metrics.incr(f'gemini.extraction.{mode}.output_tokens', output_tokens)
+    metrics.incr(f'gemini.extraction.{mode}.cached_tokens', cached_tokens)
+    print(f"Gemini usage ({mode}): {prompt_tokens} prompt tokens ({cached_tokens} cached), {output_tokens} output tokens")
+    return prompt_tokens, output_tokens
+
+
+def extraction_stats():
+    """Per-mode averages and parse failure rates, for comparing extraction modes"""
+    counters = metrics.snapshot()['counters']
+    stats = {}
+    for mode in EXTRACTION_MODES:
+        prefix = f'gemini.extraction.{mode}.'
+        calls = counters.get(prefix + 'calls', 0)
+        if not calls:
+            continue
+        stats[mode] = {
+            'calls': calls,
+            'avg_prompt_tokens': round(counters.get(prefix + 'prompt_tokens', 0) / calls, 1),
+            'avg_output_tokens': round(counters.get(prefix + 'output_tokens', 0) / calls, 1),
+            'avg_cached_tokens': round(counters.get(prefix + 'cached_tokens', 0) / calls, 1),
+            'parse_failure_rate': round(counters.get(prefix + 'parse_failed', 0) / calls, 4),
+            'salvage_rate': round(counters.get(prefix + 'salvaged', 0) / calls, 4),
+            'defaults_rate': round(counters.get(prefix + 'defaults_filled', 0) / calls, 4),
+        }
+    return stats
+
+
+def extraction_cache_key(transcription, output_language, mode):
+    """Cache key for an extraction; trivially different transcripts share a key"""
+    normalized = ' '.join(unicodedata.normalize('NFKC', transcription).casefold().split())
+    return cache_store.hash_key(normalized, output_language, mode, EXTRACTION_PROMPT_VERSION)
+
+
+def extract_recipe_with_gemini(transcription, output_language='en', on_field=None, regenerate=False):
+    """
+    Use Google Gemini to extract structured recipe information from transcription
+
+    If on_field is given (and GEMINI_STREAM_EXTRACTION is enabled), the
+    response is streamed and on_field(kind, key, value) is called for every
+    recipe field ('field') and list element ('item') as soon as it's complete.
+
+    Results are memoized per normalized transcription, language and prompt
+    version, so retries and duplicate uploads get the same recipe without a
+    Gemini call. regenerate=True skips the lookup and replaces the entry.
+    """
+    mode = GEMINI_EXTRACTION_MODE
+    if output_language not in LANGUAGE_NAMES:
+        output_language = 'en'
+
+    cache_key = extraction_cache_key(transcription, output_language, mode)
+    if not regenerate:
+        cached = extraction_cache.get(cache_key)
+        if cached is not None:
+            print("✓ Using cached recipe extraction")
+            if on_field:
+                for key, value in cached.items():
+                    on_field('field', key, value)
+            return copy.deepcopy(cached)
+
+    try:
+        instructions = build_extraction_instructions(output_language, mode)
+
+        # Model tier and timeout depend on transcript length and recent latency
+        decision = model_router.route(transcription, output_language)
+
+        # With the instructions cached on Gemini's side, only the transcription is sent
+        model = context_cache.get_cached_model(
+            f'{mode}-{output_language}-{decision.tier}', decision.model, instructions
+        )
+        if model is not None:
+            prompt = transcription_message(transcription)
+            timing_key = 'cached'
+        else:
+            model = upstream_clients.get_gemini_model(decision.model)
+            prompt = instructions + transcription_message(transcription)
+            timing_key = 'uncached'
 
         # Generate content using Gemini with timeout (no auto-retry to avoid excessive API calls)
-        print("Calling Gemini API...")
+        print(f"Calling Gemini API ({mode} mode, {decision.model}, {decision.timeout}s)...")
         
         # Configure generation with timeout
         generation_config = {
@@ -592,116 +1197,62 @@ Return ONLY the JSON object, no additional text.
             "top_k": 40,
             "max_output_tokens": 8192,
         }
+        if mode == 'schema':
+            generation_config["response_mime_type"] = "application/json"
+            generation_config["response_schema"] = RECIPE_RESPONSE_SCHEMA
+        
+        stream = bool(on_field) and GEMINI_STREAM_EXTRACTION
         
+        started = time.time()
+        decision.start()  # Context-cache setup above isn't model latency
         try:
             response = model.generate_content(
                 prompt,
                 generation_config=generation_config,
-                request_options={"timeout": 60}  # 60 second timeout
+                request_options={"timeout": decision.timeout},
+                stream=stream
             )
+            
+            if stream:
+                # Forward each recipe field to the client as soon as it's complete
+                parser = recipe_parser.RecipeStreamParser()
+                first_chunk = True
+                for chunk in response:
+                    if first_chunk:
+                        metrics.observe(f'gemini.extraction.ttft_ms.{timing_key}', (time.time() - started) * 1000)
+                        first_chunk = False
+                    try:
+                        chunk_text = chunk.text
+                    except Exception:
+                        continue  # e.g. a final chunk carrying only the finish reason
+                    for kind, key, value in parser.feed(chunk_text):
+                        on_field(kind, key, value)
         except Exception as api_error:
+            model_router.record(decision, ok=False)
             error_msg = str(api_error)
             if "timeout" in error_msg.lower() or "504" in error_msg:
                 raise Exception("Gemini API is taking too long. This recipe might be too complex. Please try with a shorter recipe or simplify your description.")
             else:
                 raise
         
-        # Extract the text response safely
-        try:
-            response_text = response.text.strip()
-        except Exception as e:
-            # Handle cases where response.text fails (e.g. safety filters or max tokens with no valid part)
-            print(f"Error accessing response.text: {str(e)}")
-            
-            if not response.candidates:
-                raise Exception("Gemini returned no candidates.")
-                
-            candidate = response.candidates[0]
-            print(f"Candidate finish reason: {candidate.finish_reason}")
-            
-            # Check for safety blocks
-            if candidate.finish_reason == 3: # SAFETY
-                raise Exception("The recipe content was flagged by safety filters. Please try again with different wording.")
-                
-            # Check for max tokens
-            if candidate.finish_reason == 2: # MAX_TOKENS
-                # Try to get partial text if available
-                if candidate.content and candidate.content.parts:
-                    response_text = candidate.content.parts[0].text.strip()
-                    print("Warning: Response truncated due to max tokens, attempting to parse partial response.")
-                else:
-                    raise Exception("Response was truncated due to length limits and no text was returned.")
-            else:
-                raise Exception(f"Gemini returned no valid text. Finish reason: {candidate.finish_reason}")
-        
-        print(f"Raw Gemini response (first 500 chars): {response_text[:500]}")
-        
-        # Remove markdown code blocks if present
-        if response_text.startswith('```json'):
-            response_text = response_text[7:]
-        if response_text.startswith('```'):
-            response_text = response_text[3:]
-        if response_text.endswith('```'):
-            response_text = response_text[:-3]
-        
-        response_text = response_text.strip()
-        
-        # Try to find JSON object boundaries if response has extra text
-        json_start = response_text.find('{')
-        json_end = response_text.rfind('}')
-        if json_start != -1 and json_end != -1 and json_end > json_start:
-            response_text = response_text[json_start:json_end + 1]
-        
-        print(f"Cleaned response (first 500 chars): {response_text[:500]}")
-
-        # Parse JSON response with better error handling
-        try:
-            recipe_data = json.loads(response_text)
-        except json.JSONDecodeError as json_err:
-            print(f"JSON parsing failed at position {json_err.pos}")
-            print(f"Error: {json_err.msg}")
-            # Try to fix common JSON issues
-            
-            # Fix trailing commas in arrays/objects
-            import re
-            response_text = re.sub(r',(\s*[}\]])', r'\1', response_text)
-            
-            # Try parsing again
-            try:
-                recipe_data = json.loads(response_text)
-                print("Successfully parsed after fixing trailing commas")
-            except:
-                # If still failing, raise the original error
-                raise json_err
+        if not stream:
+            # Without streaming the first token arrives with the whole response
+            metrics.observe(f'gemini.extraction.ttft_ms.{timing_key}', (time.time() - started) * 1000)
+        prompt_tokens, output_tokens = record_extraction_usage(mode, response)
         
-        # Ensure critical fields have default values if missing
-        if not recipe_data.get('prep_time'):
-            recipe_data['prep_time'] = '15 minutes'
-        if not recipe_data.get('cook_time'):
-            recipe_data['cook_time'] = '30 minutes'
-        if not recipe_data.get('yield'):
-            recipe_data['yield'] = 'Serves 4'
-        if not recipe_data.get('author'):
-            recipe_data['author'] = 'Home Chef'
-
+        if stream and parser.text.strip():
+            response_text = parser.text.strip()
+        else:
+            response_text = read_response_text(response)
+        
+        recipe_data, complete = parse_recipe_response(response_text, transcription, mode)
+        model_router.record(decision, ok=True, prompt_tokens=prompt_tokens,
+                            output_tokens=output_tokens, truncated=not complete)
+        if complete:
+            # Salvaged and fallback recipes aren't cached so a retry can do better
+            extraction_cache.set(cache_key, copy.deepcopy(recipe_data))
         return recipe_data
 
-    except json.JSONDecodeError as e:
-        print(f"Error parsing Gemini response: {str(e)}")
-        print(f"Full response text:\n{response_text}")
-        print(f"Character at error position: {response_text[e.pos-10:e.pos+10] if e.pos < len(response_text) else 'N/A'}")
-        # Return a fallback structure
-        return {
-            'recipe_name': 'Recipe from Audio',
-            'author': 'Home Chef',
-            'description': 'Could not extract structured recipe data. Please try again.',
-            'ingredients': [],
-            'instructions': [transcription],
-            'prep_time': '15 minutes',
-            'cook_time': '30 minutes',
-            'yield': 'Serves 4',
-            'tips': ['The AI had trouble parsing the recipe. You can edit this manually.']
-        }
     except Exception as e:
         print(f"Error using Gemini API: {str(e)}")
         raise
@@ -711,9 +1262,14 @@ Return ONLY the JSON object, no additional text.
 # DATABASE FUNCTIONS
 # ============================================================================
 
-def save_recipe_to_db(recipe_data, user_id):
+def user_db():
+    """Gateway client acting as the authenticated user of this request"""
+    return db.as_user(request.headers.get('Authorization').split(' ')[1])
+
+
+def save_recipe_to_db(recipe_data, user_id, token):
     """Save recipe to Supabase database with user_id"""
-    if not supabase:
+    if not db.configured:
         raise Exception("Supabase client not initialized")
     
     # Prepare data for database (convert lists to JSON)
@@ -731,41 +1287,166 @@ def save_recipe_to_db(recipe_data, user_id):
         'created_at': datetime.utcnow().isoformat()
     }
     
-    result = supabase.table('recipes').insert(db_data).execute()
-    return result.data[0] if result.data else None
+    result = db.as_user(token).insert('recipes', db_data)
+    saved_recipe = result[0] if result else None
+    if saved_recipe:
+        recipe_search.upsert(user_id, saved_recipe)
+    return saved_recipe
 
 
 # ============================================================================
 # RECIPE CRUD API ENDPOINTS
 # ============================================================================
 
+# Recipe listing page size (?limit=), newest first
+RECIPES_PAGE_SIZE = 24
+MAX_RECIPES_PAGE_SIZE = 100
+
+# Rows per request when loading a user's whole library for the search index
+# (PostgREST silently caps a response at the project's max-rows, 1000 by default)
+RECIPE_INDEX_BATCH_SIZE = 500
+
+# Columns ?search= matches (case-insensitive substring)
+RECIPE_SEARCH_FIELDS = ('recipe_name', 'author', 'description')
+
+
+def encode_cursor(value):
+    """Opaque URL-safe cursor for any JSON value"""
+    raw = json.dumps(value).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def encode_recipes_cursor(recipe):
+    """Cursor pointing just after this recipe in newest-first order"""
+    return encode_cursor([recipe['created_at'], recipe['id']])
+
+
+def decode_recipes_cursor(cursor):
+    """(created_at, id) from encode_recipes_cursor; raises ValueError if malformed"""
+    value = decode_cursor(cursor)
+    if (not isinstance(value, list) or len(value) != 2 or not isinstance(value[0], str)
+            or not isinstance(value[1], (str, int))):
+        raise ValueError('Invalid cursor')
+    return value[0], value[1]
+
+
+def search_recipes_page(search_query, limit, cursor):
+    """
+    One page of ranked search results from the user's in-process index, as
+    (recipes, next_cursor). Each recipe carries 'search': {'score', 'highlights'}.
+    The cursor is the offset into the ranking.
+    """
+    offset = decode_cursor(cursor) if cursor else 0
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError('Invalid cursor')
+
+    def load_recipes():
+        # Keyset pages until one comes back empty, so a lower max-rows can't truncate the index
+        recipes = []
+        cursor = None
+        while True:
+            params = {'order': 'created_at.desc,id.desc', 'limit': RECIPE_INDEX_BATCH_SIZE}
+            if cursor:
+                params['and'] = recipes_page_filter(cursor, None)
+            batch = user_db().select('recipes', {'user_id': request.user_id}, params=params)
+            if not batch:
+                return recipes
+            recipes.extend(batch)
+            cursor = (batch[-1]['created_at'], batch[-1]['id'])
+
+    results = recipe_search.search(request.user_id, search_query, load_recipes)
+    page = [
+        {**recipe, 'search': {'score': score, 'highlights': highlights}}
+        for recipe, score, highlights in results[offset:offset + limit]
+    ]
+    next_cursor = encode_cursor(offset + limit) if len(results) > offset + limit else None
+    return page, next_cursor
+
+
+def postgrest_quote(value):
+    """Quote a value for a PostgREST logic filter (commas, dots and parens are reserved)"""
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def recipes_page_filter(cursor, search_query):
+    """PostgREST 'and' filter for one page: after the cursor, and matching the search"""
+    conditions = []
+    if cursor:
+        created_at, recipe_id = cursor
+        created_at, recipe_id = postgrest_quote(created_at), postgrest_quote(recipe_id)
+        conditions.append(
+            f"or(created_at.lt.{created_at},and(created_at.eq.{created_at},id.lt.{recipe_id}))"
+        )
+    if search_query:
+        # Escape LIKE wildcards so the query is matched literally
+        pattern = search_query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        pattern = postgrest_quote(f'*{pattern}*')
+        conditions.append('or(' + ','.join(f'{field}.ilike.{pattern}' for field in RECIPE_SEARCH_FIELDS) + ')')
+    return f"({','.join(conditions)})" if conditions else None
+
+
 @app.route('/api/recipes', methods=['GET'])
 @verify_token
 def get_recipes():
-    """Get all recipes for the authenticated user with optional search and filter"""
-    if not supabase:
+    """
+    One page of the authenticated user's recipes, newest first, or with
+    ?search= ranked by relevance (see recipe_search). Pass
+    ?cursor=<next_cursor> to get the next page; next_cursor is null on the
+    last page.
+    """
+    if not db.configured:
         return jsonify({'error': 'Database not configured'}), 503
     
     try:
         search_query = request.args.get('search', '').strip()
-        
-        # Filter by user_id and order by newest first
-        result = supabase.table('recipes').select('*').eq('user_id', request.user_id).order('created_at', desc=True).execute()
-        
-        # Filter in Python if search query provided (since supabase 2.0.3 doesn't support or_)
-        recipes = result.data
+        try:
+            limit = int(request.args.get('limit', RECIPES_PAGE_SIZE))
+        except ValueError:
+            return jsonify({'error': 'limit must be a number'}), 400
+        limit = max(1, min(limit, MAX_RECIPES_PAGE_SIZE))
+
+        cursor = request.args.get('cursor')
         if search_query:
-            search_lower = search_query.lower()
-            recipes = [
-                recipe for recipe in recipes
-                if (recipe.get('recipe_name', '').lower().find(search_lower) >= 0 or
-                    recipe.get('author', '').lower().find(search_lower) >= 0 or
-                    recipe.get('description', '').lower().find(search_lower) >= 0)
-            ]
+            try:
+                recipes, next_cursor = search_recipes_page(search_query, limit, cursor)
+                return jsonify({'recipes': recipes, 'count': len(recipes), 'next_cursor': next_cursor})
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+            except supabase_gateway.SupabaseError as e:
+                if cursor:
+                    raise
+                # Couldn't load the index; fall back to matching in the database
+                print(f"⚠ Search index unavailable, using database search: {str(e)}")
+
+        if cursor:
+            try:
+                cursor = decode_recipes_cursor(cursor)
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+
+        # Keyset pagination on (created_at, id); one extra row tells us if there's another page
+        params = {'order': 'created_at.desc,id.desc', 'limit': limit + 1}
+        page_filter = recipes_page_filter(cursor, search_query)
+        if page_filter:
+            params['and'] = page_filter
+        recipes = user_db().select('recipes', {'user_id': request.user_id}, params=params)
+
+        next_cursor = None
+        if len(recipes) > limit:
+            recipes = recipes[:limit]
+            next_cursor = encode_recipes_cursor(recipes[-1])
         
         return jsonify({
             'recipes': recipes,
-            'count': len(recipes)
+            'count': len(recipes),
+            'next_cursor': next_cursor
         })
         
     except Exception as e:
@@ -776,17 +1457,28 @@ def get_recipes():
 @app.route('/api/recipes/<recipe_id>', methods=['GET'])
 @verify_token
 def get_recipe(recipe_id):
-    """Get a single recipe by ID (only if owned by user)"""
-    if not supabase:
+    """Get a single recipe by ID (only if owned by user), optionally in a translated language"""
+    if not db.configured:
         return jsonify({'error': 'Database not configured'}), 503
     
     try:
-        result = supabase.table('recipes').select('*').eq('id', recipe_id).eq('user_id', request.user_id).execute()
+        result = user_db().select('recipes', {'id': recipe_id, 'user_id': request.user_id})
         
-        if not result.data:
+        if not result:
             return jsonify({'error': 'Recipe not found'}), 404
         
-        return jsonify(result.data[0])
+        recipe = result[0]
+
+        # ?lang=xx serves a stored translation (see /api/recipes/<id>/translate)
+        lang = request.args.get('lang')
+        if lang:
+            translation = stored_translation(recipe, lang)
+            if translation:
+                recipe = {**recipe, **translation, 'language': lang}
+            else:
+                recipe['translation_available'] = False
+        
+        return jsonify(recipe)
         
     except Exception as e:
         print(f"Error fetching recipe: {str(e)}")
@@ -797,12 +1489,12 @@ def get_recipe(recipe_id):
 @verify_token
 def create_recipe():
     """Create a new recipe manually"""
-    if not supabase:
+    if not db.configured:
         return jsonify({'error': 'Database not configured'}), 503
     
     try:
         recipe_data = request.json
-        saved_recipe = save_recipe_to_db(recipe_data, request.user_id)
+        saved_recipe = save_recipe_to_db(recipe_data, request.user_id, request.headers.get('Authorization').split(' ')[1])
         
         return jsonify(saved_recipe), 201
         
@@ -815,7 +1507,7 @@ def create_recipe():
 @verify_token
 def update_recipe(recipe_id):
     """Update an existing recipe (only if owned by user)"""
-    if not supabase:
+    if not db.configured:
         return jsonify({'error': 'Database not configured'}), 503
     
     try:
@@ -839,12 +1531,13 @@ def update_recipe(recipe_id):
         update_data = {k: v for k, v in update_data.items() if v is not None}
         
         # Update only if recipe belongs to user
-        result = supabase.table('recipes').update(update_data).eq('id', recipe_id).eq('user_id', request.user_id).execute()
+        result = user_db().update('recipes', update_data, {'id': recipe_id, 'user_id': request.user_id})
         
-        if not result.data:
+        if not result:
             return jsonify({'error': 'Recipe not found or unauthorized'}), 404
         
-        return jsonify(result.data[0])
+        recipe_search.upsert(request.user_id, result[0])
+        return jsonify(result[0])
         
     except Exception as e:
         print(f"Error updating recipe: {str(e)}")
@@ -855,16 +1548,17 @@ def update_recipe(recipe_id):
 @verify_token
 def delete_recipe(recipe_id):
     """Delete a recipe (only if owned by user)"""
-    if not supabase:
+    if not db.configured:
         return jsonify({'error': 'Database not configured'}), 503
     
     try:
         # Delete only if recipe belongs to user
-        result = supabase.table('recipes').delete().eq('id', recipe_id).eq('user_id', request.user_id).execute()
+        result = user_db().delete('recipes', {'id': recipe_id, 'user_id': request.user_id})
         
-        if not result.data:
+        if not result:
             return jsonify({'error': 'Recipe not found or unauthorized'}), 404
         
+        recipe_search.remove(request.user_id, result[0].get('id'))
         return jsonify({'message': 'Recipe deleted successfully', 'id': recipe_id})
         
     except Exception as e:
@@ -872,36 +1566,207 @@ def delete_recipe(recipe_id):
         return jsonify({'error': str(e)}), 500
 
 
+# ============================================================================
+# RECIPE TRANSLATION
+# ============================================================================
+
+# Fields translated between languages (author is a name and stays as is)
+TRANSLATABLE_FIELDS = ('recipe_name', 'description', 'prep_time', 'cook_time', 'yield',
+                       'ingredients', 'instructions', 'tips')
+
+# Languages per request (each is its own model call, run in parallel)
+MAX_TRANSLATION_LANGUAGES = 5
+translation_executor = ThreadPoolExecutor(max_workers=MAX_TRANSLATION_LANGUAGES, thread_name_prefix='translate')
+
+
+def translation_source(recipe):
+    """The translatable text of a recipe, and a hash identifying that text"""
+    source = {key: recipe.get(key) for key in TRANSLATABLE_FIELDS if recipe.get(key)}
+    source_hash = cache_store.hash_key(json.dumps(source, sort_keys=True, ensure_ascii=False))[:16]
+    return source, source_hash
+
+
+def stored_translation(recipe, lang):
+    """Stored translation of recipe into lang, or None if missing or made from older text"""
+    translation = (recipe.get('translations') or {}).get(lang)
+    if not translation:
+        return None
+    _, source_hash = translation_source(recipe)
+    if translation.get('source_hash') != source_hash:
+        return None
+    return {key: value for key, value in translation.items() if key in TRANSLATABLE_FIELDS}
+
+
+def translate_recipe_into(source, lang):
+    """
+    Translate the recipe text into one language. Returns (fields, complete):
+    fields is None if nothing usable came back, and complete is False when
+    the reply was cut off and only its finished fields were kept.
+    """
+    field_schema = {
+        key: RECIPE_RESPONSE_SCHEMA['properties'][key] for key in TRANSLATABLE_FIELDS if key in source
+    }
+    response_schema = {'type': 'object', 'properties': field_schema, 'required': list(field_schema)}
+
+    prompt = f"""Translate this recipe into {LANGUAGE_NAMES[lang]}.
+
+Guidelines:
+- Translate every text value; keep list items in the same order and count.
+- Keep quantities, numbers and metric equivalents exactly as they are.
+- Use the cooking terms a home cook in that language would use.
+
+Recipe:
+{json.dumps(source, ensure_ascii=False, indent=2)}
+"""
+
+    started = time.time()
+    response = upstream_clients.get_gemini_model().generate_content(
+        prompt,
+        generation_config={
+            "temperature": 0.2,
+            "max_output_tokens": 8192,
+            "response_mime_type": "application/json",
+            "response_schema": response_schema,
+        },
+        request_options={"timeout": 60}
+    )
+    metrics.incr('gemini.translation.calls')
+    metrics.observe('gemini.translation.latency_ms', (time.time() - started) * 1000)
+
+    # Same salvage as extraction: a truncated reply keeps every finished field
+    fields, complete = recipe_parser.parse_recipe(read_response_text(response))
+    if not fields:
+        return None, False
+    return {key: value for key, value in fields.items() if key in TRANSLATABLE_FIELDS}, complete
+
+
+def translate_recipe_fields(source, languages):
+    """
+    Translate the recipe text into every language, one Gemini call per
+    language run in parallel (so one long reply can't truncate the others).
+    Returns {lang: (fields, complete)}; languages that failed are left out.
+    """
+    futures = {lang: translation_executor.submit(translate_recipe_into, source, lang) for lang in languages}
+    results = {}
+    for lang, future in futures.items():
+        try:
+            fields, complete = future.result()
+        except Exception as e:
+            print(f"⚠ Translation into {lang} failed: {str(e)}")
+            continue
+        if fields:
+            results[lang] = (fields, complete)
+            if not complete:
+                print(f"⚠ Translation into {lang} was truncated; returning the finished fields")
+        else:
+            print(f"⚠ Translation into {lang} was missing or malformed")
+    return results
+
+
+@app.route('/api/recipes/<recipe_id>/translate', methods=['POST'])
+@verify_token
+def translate_recipe(recipe_id):
+    """
+    Translate a saved recipe into one or more languages: {"languages": ["hi", "es"]}.
+    Translations are stored on the recipe, so only languages not translated
+    yet (or translated before the recipe was edited) cost a model call.
+    """
+    if not db.configured:
+        return jsonify({'error': 'Database not configured'}), 503
+
+    data = request.get_json(silent=True) or {}
+    languages = data.get('languages') or []
+    if isinstance(languages, str):
+        languages = [languages]
+    languages = list(dict.fromkeys(languages))  # de-duplicate, keep order
+
+    if not languages:
+        return jsonify({'error': 'No target languages provided'}), 400
+    unsupported = [lang for lang in languages if lang not in LANGUAGE_NAMES]
+    if unsupported:
+        return jsonify({'error': f"Unsupported language(s): {', '.join(map(str, unsupported))}"}), 400
+    if len(languages) > MAX_TRANSLATION_LANGUAGES:
+        return jsonify({'error': f'At most {MAX_TRANSLATION_LANGUAGES} languages per request'}), 400
+
+    try:
+        result = user_db().select('recipes', {'id': recipe_id, 'user_id': request.user_id})
+        if not result:
+            return jsonify({'error': 'Recipe not found'}), 404
+        recipe = result[0]
+
+        translations = {}
+        missing = []
+        incomplete = []
+        for lang in languages:
+            translation = stored_translation(recipe, lang)
+            if translation:
+                translations[lang] = translation
+            else:
+                missing.append(lang)
+
+        if missing:
+            rate_limited = check_rate_limit(request.user_id, 'translate')
+            if rate_limited:
+                return rate_limited
+
+            source, source_hash = translation_source(recipe)
+            print(f"Translating recipe {recipe_id} into {', '.join(missing)}...")
+            new_translations = translate_recipe_fields(source, missing)
+
+            # Only complete translations are stored; truncated ones are returned
+            # this time and redone on the next request
+            complete_translations = {lang: fields for lang, (fields, complete) in new_translations.items() if complete}
+            if complete_translations:
+                stored = dict(recipe.get('translations') or {})
+                for lang, fields in complete_translations.items():
+                    stored[lang] = {**fields, 'source_hash': source_hash}
+                try:
+                    user_db().update('recipes', {'translations': stored}, {'id': recipe_id, 'user_id': request.user_id})
+                except Exception as db_error:
+                    # Still return the translations; they'll be redone next time
+                    print(f"Warning: Failed to store translations: {str(db_error)}")
+            translations.update({lang: fields for lang, (fields, _) in new_translations.items()})
+            incomplete = [lang for lang, (_, complete) in new_translations.items() if not complete]
+
+        failed = [lang for lang in languages if lang not in translations]
+        if failed and len(failed) == len(languages):
+            return jsonify({'error': 'Translation failed. Please try again.'}), 502
+
+        response = {'recipe_id': recipe_id, 'translations': translations}
+        if failed:
+            response['failed'] = failed
+        if incomplete:
+            response['incomplete'] = incomplete
+        return jsonify(response)
+
+    except Exception as e:
+        print(f"Error translating recipe: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/api/user/credits', methods=['GET'])
 @verify_token
 def get_user_credits():
-    """Get current user credits"""
+    """
+    Get current user credits. Served from the balance cache when possible;
+    the ETag lets the browser revalidate with a 304 instead of a new body.
+    """
     try:
-        # Call Supabase RPC to get credits or query table directly
-        # We use the user's token to authenticate with Supabase
-        token = request.headers.get('Authorization').split(' ')[1]
-        
-        url = f"{SUPABASE_URL}/rest/v1/profiles?select=credits&id=eq.{request.user_id}"
-        headers = {
-            "apikey": SUPABASE_KEY,
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
-        
-        response = requests.get(url, headers=headers)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data and len(data) > 0:
-                return jsonify({'credits': data[0]['credits']})
-            else:
-                # Profile might not exist yet for old users or if trigger failed
-                # We return the default credits so the UI looks correct.
-                # The actual profile will be created when they first try to spend credits
-                # via the deduct_credits RPC which handles missing profiles.
-                return jsonify({'credits': config_credits.DEFAULT_NEW_USER_CREDITS})
-        else:
-            return jsonify({'error': 'Failed to fetch credits'}), 500
+        balance = credit_balances.get(request.user_id)
+        if balance is None:
+            # We use the user's token to authenticate with Supabase
+            token = request.headers.get('Authorization').split(' ')[1]
+            try:
+                balance = fetch_credit_balance(token, request.user_id)
+            except supabase_gateway.SupabaseError as e:
+                print(f"Error fetching credits: {str(e)}")
+                return jsonify({'error': 'Failed to fetch credits'}), 500
+
+        response = jsonify({'credits': balance})
+        response.set_etag(cache_store.hash_key(request.user_id, str(balance))[:32])
+        # Private to this user, and always revalidated so a new balance shows at once
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
             
     except Exception as e:
         print(f"Error fetching credits: {str(e)}")
@@ -1052,34 +1917,25 @@ def verify_payment():
             return jsonify({'error': 'Invalid provider'}), 400
             
         if credits_to_add > 0:
-            # Add credits via Supabase RPC
-            url = f"{SUPABASE_URL}/rest/v1/rpc/add_credits"
-            headers = {
-                "apikey": SUPABASE_KEY,
-                "Authorization": f"Bearer {SUPABASE_KEY}", # Service role key preferred
-                "Content-Type": "application/json"
-            }
-            
-            # We need a service role key to add credits securely if RLS prevents it
-            # But our RPC is SECURITY DEFINER so anon key works if we allow it
-            # Ideally, use a secret key here.
-            
+            # Add credits via Supabase RPC with the service key (SUPABASE_SERVICE_KEY,
+            # else SUPABASE_KEY: our RPC is SECURITY DEFINER so anon key works if we allow it)
             payload = {
                 "user_id": request.user_id,
                 "amount": credits_to_add
             }
             
-            response = requests.post(url, headers=headers, json=payload)
-            
-            if response.status_code == 200:
-                result = response.json()
-                return jsonify({
-                    'success': True, 
-                    'message': f'Added {credits_to_add} credits',
-                    'new_balance': result.get('new_balance')
-                })
-            else:
+            try:
+                result = db.as_service().rpc('add_credits', payload)
+            except supabase_gateway.SupabaseError as e:
+                print(f"Supabase RPC error: {str(e)}")
                 return jsonify({'error': 'Failed to update credits database'}), 500
+
+            remember_credit_balance(request.user_id, result.get('new_balance'))
+            return jsonify({
+                'success': True, 
+                'message': f'Added {credits_to_add} credits',
+                'new_balance': result.get('new_balance')
+            })
                 
         return jsonify({'error': 'No credits to add'}), 400
             
@@ -1104,28 +1960,22 @@ def simulate_buy_credits():
             return jsonify({'error': 'Invalid amount'}), 400
             
         # Call Supabase RPC to add credits
-        # We use the anon key but the function is SECURITY DEFINER
-        # In production, use SERVICE_ROLE_KEY and do not expose this RPC publicly
-        
-        url = f"{SUPABASE_URL}/rest/v1/rpc/add_credits"
-        headers = {
-            "apikey": SUPABASE_KEY,
-            "Authorization": f"Bearer {SUPABASE_KEY}", # Using anon key to call RPC
-            "Content-Type": "application/json"
-        }
+        # Without SUPABASE_SERVICE_KEY this uses the anon key, which works because
+        # the function is SECURITY DEFINER. In production, do not expose this RPC publicly
         
         payload = {
             "user_id": request.user_id,
             "amount": amount
         }
         
-        response = requests.post(url, headers=headers, json=payload)
-        
-        if response.status_code == 200:
-            return jsonify({'success': True, 'message': f'Added {amount} credits'})
-        else:
-            print(f"Supabase RPC error: {response.text}")
+        try:
+            result = db.as_service().rpc('add_credits', payload)
+        except supabase_gateway.SupabaseError as e:
+            print(f"Supabase RPC error: {str(e)}")
             return jsonify({'error': 'Failed to add credits'}), 500
+
+        remember_credit_balance(request.user_id, result.get('new_balance'))
+        return jsonify({'success': True, 'message': f'Added {amount} credits'})
             
     except Exception as e:
         print(f"Error buying credits: {str(e)}")
@@ -1136,7 +1986,11 @@ def simulate_buy_credits():
 @verify_token
 def generate_recipe_image():
     """
-    Generate a unique recipe image using Google's Imagen 3 (Nano Banana)
+    Generate a unique recipe image using Google's Imagen 3 (Nano Banana).
+    Responds with a URL into the image store; an identical prompt is served
+    from the store without generating again (unless "regenerate" is set).
+    With "recipe_id", the image is also recorded on that saved recipe so the
+    gallery can show its thumbnail.
     """
     try:
         data = request.get_json()
@@ -1182,130 +2036,53 @@ Instructions:
 Design Style: Modern culinary magazine layout, elegant typography, appetizing food photography background or side-by-side layout. The text must be legible and professional."""
         
         
-        # Option 1: Try Gemini 3 Pro Image Preview via AI Studio API (using GEMINI_API_KEY)
-        # This is the preferred method for "Preview" models as it bypasses some Vertex AI region restrictions
-        if GEMINI_API_KEY:
-            try:
-                print("Attempting generation with Gemini 3 Pro (AI Studio)...")
-                url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-3-pro-image-preview:generateContent?key={GEMINI_API_KEY}"
-                
-                headers = {"Content-Type": "application/json"}
-                
-                payload = {
-                    "contents": [{
-                        "parts": [{"text": prompt}]
-                    }],
-                    "generationConfig": {
-                        "responseModalities": ["IMAGE"],
-                        "imageConfig": {
-                            "aspectRatio": "3:4",
-                            "imageSize": "2K"
-                        }
-                    }
-                }
-                
-                # Add timeout to prevent hanging
-                response = requests.post(url, headers=headers, json=payload, timeout=30)
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    candidates = result.get('candidates', [])
-                    if candidates:
-                        parts = candidates[0].get('content', {}).get('parts', [])
-                        for part in parts:
-                            inline_data = part.get('inlineData') or part.get('inline_data')
-                            if inline_data:
-                                return jsonify({
-                                    'success': True,
-                                    'image': f"data:image/png;base64,{inline_data.get('data')}",
-                                    'filename': f"{title.replace(' ', '_')}_nanobanan.png"
-                                })
-                else:
-                    print(f"Gemini API Error: {response.status_code} - {response.text}")
-            except Exception as e:
-                print(f"Gemini Request Error: {str(e)}")
-
-        # Option 2: Fallback to Vertex AI REST API (Imagen 3)
-        # This is used if GEMINI_API_KEY is missing or the above request fails
-        try:
-            print("Falling back to Vertex AI (Imagen 3)...")
-            
-            # Explicitly load credentials from file if available (more robust in deployment)
-            creds_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
-            project_id = os.getenv('GOOGLE_CLOUD_PROJECT')
-            
-            if creds_path and os.path.exists(creds_path):
-                print(f"Loading credentials from file: {creds_path}")
-                # Import here to avoid top-level dependency issues
-                from google.oauth2 import service_account
-                credentials = service_account.Credentials.from_service_account_file(
-                    creds_path,
-                    scopes=['https://www.googleapis.com/auth/cloud-platform']
-                )
-                # Try to get project_id from credentials if not set in env
-                if not project_id and hasattr(credentials, 'project_id'):
-                    project_id = credentials.project_id
-            else:
-                print("Using google.auth.default()...")
-                # Get credentials and project ID
-                credentials, auth_project_id = google.auth.default(scopes=['https://www.googleapis.com/auth/cloud-platform'])
-                if not project_id:
-                    project_id = auth_project_id
-            
-            if not project_id:
-                raise Exception("Could not determine Google Cloud Project ID. Please set GOOGLE_CLOUD_PROJECT environment variable.")
+        filename = f"{title.replace(' ', '_')}_nanobanan.png"
+        prompt_key = image_store.image_key(prompt)
 
-            auth_req = google.auth.transport.requests.Request()
-            credentials.refresh(auth_req)
-            token = credentials.token
-            
-            # Vertex AI Endpoint for Imagen 3 (Stable)
-            url = f"https://us-central1-aiplatform.googleapis.com/v1/projects/{project_id}/locations/us-central1/publishers/google/models/imagen-3.0-generate-001:predict"
-            
-            headers = {
-                "Authorization": f"Bearer {token}",
-                "Content-Type": "application/json; charset=utf-8"
-            }
-            
-            payload = {
-                "instances": [
-                    {
-                        "prompt": prompt
-                    }
-                ],
-                "parameters": {
-                    "sampleCount": 1,
-                    "aspectRatio": "3:4",
-                    "safetyFilterLevel": "block_some",
-                    "personGeneration": "allow_adult"
-                }
-            }
-            
-            # Add timeout to prevent hanging
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
-            
-            if response.status_code == 200:
-                result = response.json()
-                predictions = result.get('predictions', [])
-                
-                if predictions:
-                    # Imagen 3 returns base64 encoded image in 'bytesBase64Encoded'
-                    img_base64 = predictions[0].get('bytesBase64Encoded')
-                    
-                    if img_base64:
-                        return jsonify({
-                            'success': True,
-                            'image': f'data:image/png;base64,{img_base64}',
-                            'filename': f"{title.replace(' ', '_')}_nanobanan.png"
-                        })
-            
-            # If we get here, something failed
-            print(f"Vertex AI Error: {response.status_code} - {response.text}")
+        try:
+            # One generation per prompt, even if the user clicks generate twice
+            with image_store.key_lock(prompt_key):
+                key = None if data.get('regenerate') else images.current(prompt_key)
+                if key:
+                    name = f'{key}.png'
+                    print(f"✓ Serving stored image {name}")
+                    metrics.incr('image.store.hit')
+                    image_variants.schedule(images, key)  # no-op unless variants are missing
+                    save_recipe_image(data.get('recipe_id'), key)
+                    return jsonify({'success': True, 'image': images.url(name), 'image_key': key,
+                                    'variants': image_variant_urls(key), 'filename': filename, 'cached': True})
+
+                # Only actual generations count against the limit; stored images are free
+                rate_limited = check_rate_limit(request.user_id, 'generate-image')
+                if rate_limited:
+                    return rate_limited
+
+                # Gemini image preview first, hedged with Vertex AI Imagen 3 if it's slow or fails
+                img_base64, backend = image_generation.generate_image(prompt, GEMINI_API_KEY)
+                metrics.incr('image.store.miss')
+
+                try:
+                    # Named by its bytes, so a regenerated image never reuses a cached URL
+                    png_bytes = base64.b64decode(img_base64)
+                    key = image_store.content_key(png_bytes)
+                    name = f'{key}.png'
+                    images.put(name, png_bytes)
+                    images.set_current(prompt_key, key)
+                    image_variants.schedule(images, key, png_bytes)
+                except Exception as store_error:
+                    # Don't lose an image we already paid for; inline it instead
+                    print(f"Warning: Failed to store image for {prompt_key}: {str(store_error)}")
+                    return jsonify({'success': True, 'image': f'data:image/png;base64,{img_base64}', 'filename': filename})
+
+            save_recipe_image(data.get('recipe_id'), key)
+            return jsonify({'success': True, 'image': images.url(name), 'image_key': key,
+                            'variants': image_variant_urls(key), 'filename': filename, 'cached': False})
+        except image_generation.ImageBackendError as backend_error:
+            print(f"Image generation failed: {str(backend_error)}")
             return jsonify({
-                'error': f'Image generation failed. Gemini API Key present: {bool(GEMINI_API_KEY)}. Vertex Error: {response.text}',
+                'error': f'Image generation failed. Gemini API Key present: {bool(GEMINI_API_KEY)}. {str(backend_error)}',
                 'suggestion': 'Please ensure Vertex AI API is enabled and you have quota.'
             }), 500
-                
         except Exception as img_error:
             print(f"Image generation error: {str(img_error)}")
             return jsonify({
@@ -1318,6 +2095,72 @@ Design Style: Modern culinary magazine layout, elegant typography, appetizing fo
         return jsonify({'error': f'Request failed: {str(e)}'}), 500
 
 
+def image_variant_urls(key):
+    """Accept-negotiated URLs of the compressed variants of a stored image"""
+    return {variant: f'/api/images/{key}/{variant}' for variant in image_variants.VARIANTS}
+
+
+def save_recipe_image(recipe_id, key):
+    """Record the image on the user's saved recipe; best effort, the image is returned either way"""
+    if not recipe_id or not db.configured:
+        return
+    try:
+        result = user_db().update('recipes', {'image_key': key}, {'id': recipe_id, 'user_id': request.user_id})
+        if result:
+            recipe_search.upsert(request.user_id, result[0])
+    except Exception as e:
+        print(f"⚠ Failed to save image on recipe {recipe_id}: {str(e)}")
+
+
+@app.route('/api/images/<key>/<variant>', methods=['GET'])
+def serve_image_variant(key, variant):
+    """
+    A compressed variant (full, preview, thumb) in the best format the
+    client accepts (AVIF, WebP), or the original PNG while it's being built.
+    """
+    if variant not in image_variants.VARIANTS or not image_store.valid_name(f'{key}.png'):
+        return jsonify({'error': 'Image not found'}), 404
+
+    accepted = [value for value, quality in request.accept_mimetypes if quality > 0]
+    name, final = image_variants.negotiate(images, key, variant, accepted)
+    if not final:
+        image_variants.schedule(images, key)
+
+    data = images.get(name)
+    if data is None:
+        if not images.exists(name):
+            return jsonify({'error': 'Image not found'}), 404
+        # Object storage serves the file itself
+        response = app.redirect(images.url(name))
+    else:
+        response = Response(data, mimetype=image_store.content_type(name))
+        response.set_etag(name)
+
+    response.headers['Vary'] = 'Accept'
+    # A fallback is replaced once the variant exists, so only cache it briefly
+    response.headers['Cache-Control'] = image_store.IMMUTABLE_CACHE_CONTROL if final else 'public, max-age=60'
+    return response.make_conditional(request) if data is not None else response
+
+
+@app.route('/api/images/<name>', methods=['GET'])
+def serve_image(name):
+    """
+    Stored images. Names are content hashes, so the URL itself is the
+    access check and the response never changes.
+    """
+    if not image_store.valid_name(name):
+        return jsonify({'error': 'Image not found'}), 404
+
+    data = images.get(name)
+    if data is None:
+        return jsonify({'error': 'Image not found'}), 404
+
+    response = Response(data, mimetype=image_store.content_type(name))
+    response.headers['Cache-Control'] = image_store.IMMUTABLE_CACHE_CONTROL
+    response.set_etag(name)
+    return response.make_conditional(request)
+
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -1325,7 +2168,32 @@ def health_check():
         'status': 'healthy',
         'speech_to_text': bool(GOOGLE_APPLICATION_CREDENTIALS),
         'gemini': bool(GEMINI_API_KEY),
-        'database': bool(supabase)
+        'database': db.configured
+    })
+
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Per-worker counters and cache statistics, for operators holding METRICS_TOKEN"""
+    token = request.headers.get('X-Metrics-Token', '')
+    if not METRICS_TOKEN:
+        return jsonify({'error': 'Not found'}), 404
+    if not hmac.compare_digest(token.encode('utf-8'), METRICS_TOKEN.encode('utf-8')):
+        return jsonify({'error': 'Authentication required'}), 401
+
+    return jsonify({
+        'metrics': metrics.snapshot(),
+        'extraction': extraction_stats(),
+        'context_cache': context_cache.stats(),
+        'routing': model_router.stats(),
+        'database': supabase_gateway.stats(),
+        'search': recipe_search.stats(),
+        'images': image_generation.stats(),
+        'caches': {
+            'transcriptions': transcription_cache.stats(),
+            'extractions': extraction_cache.stats(),
+            'credit_balances': credit_balances.stats()
+        }
     })
 
 
@@ -0,0 +1,423 @@
+"""
+In-memory audio decoding for uploaded recipe recordings.
+
+Uploads are piped straight through ffmpeg (stdin -> stdout) or decoded with
+soundfile from a BytesIO, so nothing is written to disk and two users uploading
+a file with the same name can never overwrite each other's audio.
+"""
+import io
+import os
+import subprocess
+from fractions import Fraction
+from functools import lru_cache
+
+import numpy as np
+import soundfile as sf
+from scipy import signal as scipy_signal
+
+# Google Speech-to-Text works best with 16 kHz mono LINEAR16
+TARGET_SAMPLE_RATE = 16000
+
+# Upload size cap (defaults to 25 MB, roughly 25+ minutes of browser Opus audio)
+MAX_AUDIO_UPLOAD_BYTES = int(os.getenv('MAX_AUDIO_UPLOAD_MB', '25')) * 1024 * 1024
+
+# Never let a malformed upload pin a worker inside ffmpeg
+FFMPEG_TIMEOUT_SECONDS = 60
+
+# Input samples per resampling block (~1 s at 48 kHz keeps the working set small)
+RESAMPLE_BLOCK_SIZE = 48000
+
+# Containers soundfile cannot read reliably; these go to ffmpeg first
+FFMPEG_FIRST_EXTENSIONS = {'.webm', '.opus', '.m4a', '.mp4', '.aac'}
+
+
+class AudioTooLargeError(Exception):
+    """Raised when an upload exceeds MAX_AUDIO_UPLOAD_BYTES"""
+
+
+class DecodedAudio:
+    """
+    Result of decoding an upload.
+
+    pcm holds 16 kHz mono int16 samples when decoding succeeded. If every
+    decoder failed, pcm is None and raw holds the original bytes so the caller
+    can still hand them to Speech-to-Text with an encoding guessed from file_ext.
+    """
+
+    def __init__(self, pcm=None, raw=None, file_ext=''):
+        self.pcm = pcm
+        self.raw = raw
+        self.file_ext = file_ext
+        self.sample_rate = TARGET_SAMPLE_RATE
+
+    @property
+    def duration(self):
+        """Duration in seconds (0 if the audio could not be decoded)"""
+        if self.pcm is None:
+            return 0.0
+        return len(self.pcm) / self.sample_rate
+
+    def pcm_bytes(self):
+        """Raw little-endian LINEAR16 bytes for the Speech API"""
+        return self.pcm.astype('<i2', copy=False).tobytes()
+
+
+def read_upload(file_storage, max_bytes=MAX_AUDIO_UPLOAD_BYTES):
+    """
+    Read an uploaded file into memory, enforcing the size cap.
+    Reads at most max_bytes + 1 bytes so oversize uploads are rejected cheaply.
+    """
+    data = file_storage.stream.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise AudioTooLargeError(
+            f"Audio file is too large. Maximum size is {max_bytes // (1024 * 1024)} MB."
+        )
+    return data
+
+
+def decode_audio(data, filename=''):
+    """
+    Decode uploaded audio bytes to 16 kHz mono int16 PCM without touching disk.
+
+    WebM/Opus and MP4-family uploads go through an ffmpeg pipe first (more
+    reliable than soundfile for browser recordings); everything else tries
+    soundfile first and falls back to ffmpeg.
+    """
+    file_ext = os.path.splitext(filename or '')[1].lower()
+    print(f"Decoding {len(data)} bytes of audio ({file_ext or 'unknown format'}) in memory")
+
+    if not data:
+        print("Error: Audio file is empty")
+        return DecodedAudio(raw=data, file_ext=file_ext)
+
+    if file_ext in FFMPEG_FIRST_EXTENSIONS:
+        decoders = (_decode_with_ffmpeg, _decode_with_soundfile)
+    else:
+        decoders = (_decode_with_soundfile, _decode_with_ffmpeg)
+
+    for decoder in decoders:
+        try:
+            pcm = decoder(data)
+            if pcm is not None and len(pcm) > 0:
+                print(f"✓ Decoded audio with {decoder.__name__}: {len(pcm)} samples at {TARGET_SAMPLE_RATE}Hz")
+                return DecodedAudio(pcm=pcm, file_ext=file_ext)
+        except FileNotFoundError:
+            print("⚠ ffmpeg not found, trying next decoder...")
+        except Exception as decode_error:
+            print(f"⚠ {decoder.__name__} failed: {decode_error}")
+
+    print("Audio decoding failed, falling back to raw upload bytes")
+    return DecodedAudio(raw=data, file_ext=file_ext)
+
+
+def _decode_with_ffmpeg(data):
+    """Pipe the upload through ffmpeg: stdin -> mono, 16kHz, 16-bit PCM on stdout"""
+    cmd = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        '-i', 'pipe:0',
+        '-f', 's16le',
+        '-acodec', 'pcm_s16le',
+        '-ar', str(TARGET_SAMPLE_RATE),
+        '-ac', '1',
+        'pipe:1'
+    ]
+
+    result = subprocess.run(cmd, input=data, capture_output=True, timeout=FFMPEG_TIMEOUT_SECONDS)
+
+    if result.returncode != 0:
+        raise Exception(f"ffmpeg conversion failed: {result.stderr.decode('utf-8', 'replace').strip()}")
+
+    return np.frombuffer(result.stdout, dtype='<i2')
+
+
+def _decode_with_soundfile(data):
+    """Decode with soundfile from memory, then downmix/resample to 16kHz int16"""
+    audio_data, sample_rate = sf.read(io.BytesIO(data), dtype='float32', always_2d=True)
+
+    print(f"Loaded audio: {audio_data.shape} at {sample_rate}Hz")
+
+    if len(audio_data) == 0:
+        return None
+
+    return resample_to_pcm16(audio_data, sample_rate)
+
+
+@lru_cache(maxsize=16)
+def _polyphase_filter(up, down):
+    """
+    Anti-aliasing FIR for an up/down rational resampler.
+    Same design as scipy's resample_poly default (Kaiser window, beta=5);
+    resample_poly applies the `up` gain itself.
+    """
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    taps = scipy_signal.firwin(2 * half_len + 1, 1.0 / max_rate, window=('kaiser', 5.0))
+    return taps.astype(np.float32), half_len
+
+
+def resample_to_pcm16(audio_data, sample_rate, target_rate=TARGET_SAMPLE_RATE, block_size=RESAMPLE_BLOCK_SIZE):
+    """
+    Downmix (frames x channels) float audio to mono and resample to target_rate
+    with rational-ratio polyphase filtering, writing int16 samples straight
+    into a preallocated output buffer.
+
+    The signal is processed in fixed-size blocks with enough filter context on
+    each side that the result matches a one-shot resample_poly, but memory stays
+    O(block) instead of the O(n) complex buffers of FFT resampling.
+    """
+    if audio_data.ndim == 1:
+        audio_data = audio_data[:, np.newaxis]
+
+    num_frames = audio_data.shape[0]
+    ratio = Fraction(target_rate, sample_rate)
+    up, down = ratio.numerator, ratio.denominator
+
+    output_len = -(-num_frames * up // down)  # ceil, same length as resample_poly
+    output = np.empty(output_len, dtype=np.int16)
+
+    if up == down:
+        taps, context = None, 0
+    else:
+        taps, half_len = _polyphase_filter(up, down)
+        # Input samples of context needed on each side, rounded to a multiple of
+        # `down` so every block's outputs land on whole output samples
+        context = -(-half_len // up) + 1
+        context = -(-context // down) * down
+
+    # Block boundaries must be multiples of `down` for the same reason
+    block_size = max(down, (block_size // down) * down)
+
+    for start in range(0, num_frames, block_size):
+        stop = min(start + block_size, num_frames)
+        lo = max(start - context, 0)
+        hi = min(stop + context, num_frames)
+
+        # Mono downmix of just this block (plus filter context)
+        segment = audio_data[lo:hi]
+        if segment.shape[1] > 1:
+            mono = segment.mean(axis=1, dtype=np.float32)
+        else:
+            mono = segment[:, 0].astype(np.float32)
+
+        out_start = start * up // down
+        out_stop = min(-(-stop * up // down), output_len)
+
+        if taps is None:
+            block_out = mono
+        else:
+            # Zero-pad where the context runs past the signal edges, exactly as
+            # resample_poly pads the whole signal
+            pad_left = context - (start - lo)
+            pad_right = context - (hi - stop)
+            if pad_left or pad_right:
+                mono = np.pad(mono, (pad_left, pad_right))
+            block_out = scipy_signal.resample_poly(mono, up, down, window=taps)
+            skip = context * up // down
+            block_out = block_out[skip:skip + (out_stop - out_start)]
+
+        # float -> int16 in place on the block, then into the output buffer
+        np.clip(block_out, -1.0, 1.0, out=block_out)
+        np.multiply(block_out, 32767, out=block_out)
+        output[out_start:out_stop] = block_out
+
+    if sample_rate != target_rate:
+        print(f"Resampled {sample_rate}Hz -> {target_rate}Hz (polyphase {up}/{down}), {output_len} samples")
+
+    return output
+
+
+# ============================================================================
+# LONG RECORDINGS: SILENCE-BASED CHUNKING
+# ============================================================================
+
+# Synchronous recognize accepts ~60 s of audio; stay safely under it
+MAX_CHUNK_SECONDS = float(os.getenv('STT_MAX_CHUNK_SECONDS', '50'))
+
+# Don't cut before this much audio, so chunks aren't tiny
+MIN_CHUNK_SECONDS = 15.0
+
+# Energy VAD frame size
+VAD_FRAME_MS = 30
+
+# When no pause is found we hard-cut with this much overlap, de-duplicated when stitching
+HARD_CUT_OVERLAP_SECONDS = 1.0
+
+
+def frame_energies(pcm, sample_rate=TARGET_SAMPLE_RATE, frame_ms=VAD_FRAME_MS):
+    """Per-frame RMS (in int16 units) of mono PCM, computed in one vectorized pass"""
+    frame_len = max(1, int(sample_rate * frame_ms / 1000))
+    num_frames = len(pcm) // frame_len
+    if num_frames == 0:
+        return np.zeros(0, dtype=np.float32), frame_len
+
+    frames = pcm[:num_frames * frame_len].reshape(num_frames, frame_len).astype(np.float32)
+    return np.sqrt(np.mean(frames * frames, axis=1)), frame_len
+
+
+def speech_threshold(energies):
+    """
+    Adaptive speech/silence threshold: well above the noise floor but below
+    typical speech energy (so continuous speech has no "quiet" frames), with
+    an absolute minimum for near-digital-silence recordings.
+    """
+    if len(energies) == 0:
+        return 0.0
+    noise_floor, median = np.percentile(energies, [10, 50])
+    return max(min(noise_floor * 3.0, median * 0.5), 300.0)
+
+
+def split_on_silence(pcm, sample_rate=TARGET_SAMPLE_RATE, max_chunk_seconds=MAX_CHUNK_SECONDS):
+    """
+    Split long PCM into (start, end) sample ranges no longer than max_chunk_seconds,
+    cutting at the quietest point (preferably a pause) near the end of each window.
+
+    If a window contains no pause at all, it is hard-cut with a short overlap so
+    words spanning the boundary are not lost; stitch_transcripts removes the
+    duplicated words afterwards.
+    """
+    total = len(pcm)
+    max_len = int(max_chunk_seconds * sample_rate)
+    if total <= max_len:
+        return [(0, total)]
+
+    energies, frame_len = frame_energies(pcm, sample_rate)
+    threshold = speech_threshold(energies)
+    min_len = int(min(MIN_CHUNK_SECONDS, max_chunk_seconds / 2) * sample_rate)
+    overlap = int(HARD_CUT_OVERLAP_SECONDS * sample_rate)
+
+    chunks = []
+    start = 0
+    while total - start > max_len:
+        # Search for a cut point in [start + min_len, start + max_len)
+        first_frame = (start + min_len) // frame_len
+        last_frame = (start + max_len) // frame_len
+        window = energies[first_frame:last_frame]
+
+        if len(window) and window.min() < threshold:
+            # Cut in the middle of the longest run of quiet frames, preferring later ones
+            quiet = window < threshold
+            best_mid, best_len, run_start = None, 0, None
+            for i, is_quiet in enumerate(np.append(quiet, False)):
+                if is_quiet and run_start is None:
+                    run_start = i
+                elif not is_quiet and run_start is not None:
+                    if i - run_start >= best_len:
+                        best_len, best_mid = i - run_start, (run_start + i) // 2
+                    run_start = None
+            cut = (first_frame + best_mid) * frame_len
+            chunks.append((start, cut))
+            start = cut
+        else:
+            # Continuous speech: hard cut with overlap
+            cut = start + max_len
+            chunks.append((start, cut))
+            start = cut - overlap
+
+    chunks.append((start, total))
+    return chunks
+
+
+def stitch_transcripts(parts, chunks=None, max_overlap_words=8):
+    """
+    Join chunk transcripts in order. Where a chunk overlaps the previous one
+    (a hard cut from split_on_silence), words repeated across the boundary are
+    dropped by matching the longest suffix/prefix run of normalized words.
+    """
+    def normalize(word):
+        return ''.join(ch for ch in word.lower() if ch.isalnum())
+
+    stitched = []
+    for i, part in enumerate(parts):
+        words = (part or '').split()
+        if not words:
+            continue
+
+        overlap = 0
+        if chunks and i > 0 and chunks[i][0] < chunks[i - 1][1]:
+            for n in range(min(max_overlap_words, len(stitched), len(words)), 0, -1):
+                tail = [normalize(w) for w in stitched[-n:]]
+                head = [normalize(w) for w in words[:n]]
+                if tail == head and any(tail):
+                    overlap = n
+                    break
+
+        stitched.extend(words[overlap:])
+
+    return ' '.join(stitched)
+
+
+# ============================================================================
+# PRE-FLIGHT ANALYSIS
+# ============================================================================
+
+MIN_DURATION_SECONDS = 1.0
+MIN_SPEECH_SECONDS = 0.5
+MIN_RMS_DBFS = -55.0
+MAX_CLIPPED_RATIO = 0.1
+
+# Silence kept around the speech when trimming, so first/last words aren't clipped
+TRIM_PADDING_MS = 300
+
+
+def analyze_pcm(pcm, sample_rate=TARGET_SAMPLE_RATE):
+    """
+    One vectorized pass over int16 PCM: duration, overall RMS (dBFS),
+    fraction of speech frames, clipped-sample ratio and the speech span.
+    """
+    energies, frame_len = frame_energies(pcm, sample_rate)
+    threshold = speech_threshold(energies)
+    speech_frames = np.flatnonzero(energies >= threshold) if len(energies) else np.zeros(0, dtype=int)
+
+    samples = pcm.astype(np.float32)
+    rms = float(np.sqrt(np.mean(samples * samples))) if len(pcm) else 0.0
+    clipped = int(np.count_nonzero(np.abs(samples) >= 32767 * 0.99))
+
+    return {
+        'duration': len(pcm) / sample_rate,
+        'rms_dbfs': 20 * np.log10(rms / 32768) if rms > 0 else float('-inf'),
+        'speech_ratio': len(speech_frames) / len(energies) if len(energies) else 0.0,
+        'speech_seconds': len(speech_frames) * frame_len / sample_rate,
+        'clipped_ratio': clipped / len(pcm) if len(pcm) else 0.0,
+        'speech_start': int(speech_frames[0] * frame_len) if len(speech_frames) else 0,
+        'speech_end': int((speech_frames[-1] + 1) * frame_len) if len(speech_frames) else 0,
+    }
+
+
+def preflight(decoded_audio):
+    """
+    Reject unusable audio before any paid call and trim leading/trailing
+    silence in place. Returns None if the audio is usable, otherwise a
+    short reason string (for logs; users get the standard help message).
+
+    Undecoded (raw fallback) audio can't be analyzed and always passes.
+    """
+    if decoded_audio.pcm is None:
+        return None
+
+    pcm = decoded_audio.pcm
+    sample_rate = decoded_audio.sample_rate
+    stats = analyze_pcm(pcm, sample_rate)
+
+    print(
+        f"Pre-flight: {stats['duration']:.1f}s, {stats['rms_dbfs']:.1f} dBFS, "
+        f"{stats['speech_ratio']:.0%} speech, {stats['clipped_ratio']:.1%} clipped"
+    )
+
+    if stats['duration'] < MIN_DURATION_SECONDS:
+        return f"too short ({stats['duration']:.2f}s)"
+    if stats['rms_dbfs'] < MIN_RMS_DBFS:
+        return f"too quiet ({stats['rms_dbfs']:.1f} dBFS)"
+    if stats['speech_seconds'] < MIN_SPEECH_SECONDS:
+        return f"no speech detected ({stats['speech_seconds']:.2f}s of speech)"
+    if stats['clipped_ratio'] > MAX_CLIPPED_RATIO:
+        return f"heavily clipped ({stats['clipped_ratio']:.0%} of samples)"
+
+    # Trim silence around the speech (keeping some padding)
+    padding = int(sample_rate * TRIM_PADDING_MS / 1000)
+    start = max(stats['speech_start'] - padding, 0)
+    end = min(stats['speech_end'] + padding, len(pcm))
+    if start > 0 or end < len(pcm):
+        decoded_audio.pcm = pcm[start:end]
+        print(f"Trimmed silence: {len(pcm) / sample_rate:.1f}s -> {decoded_audio.duration:.1f}s")
+
+    return None
@@ -0,0 +1,148 @@
+"""
+Supabase access-token verification with a verified-claims cache.
+
+Tokens signed with the legacy shared secret (HS256) are checked against
+SUPABASE_JWT_SECRET; tokens signed with Supabase's asymmetric signing keys
+(RS256/ES256) are checked against the project's JWKS, which is held in
+memory and refreshed on a background thread. A request never waits for a
+key fetch: a token whose key id isn't known yet is rejected and triggers a
+refresh.
+
+Verified claims are cached by a digest of the token until the token's own
+exp, so the burst of API calls the frontend makes with one token pays for
+signature verification once.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+
+import metrics
+import upstream_clients
+
+AUDIENCE = 'authenticated'
+ASYMMETRIC_ALGORITHMS = ('RS256', 'ES256')
+
+# Verified tokens remembered per worker
+MAX_CACHED_TOKENS = 4096
+
+# Background JWKS refresh interval, and the minimum gap between refreshes
+# triggered by unknown key ids
+JWKS_REFRESH_SECONDS = int(os.getenv('JWKS_REFRESH_SECONDS', '600'))
+JWKS_MIN_REFRESH_GAP = 30
+
+
+class TokenVerifier:
+
+    def __init__(self, jwt_secret=None, supabase_url=None):
+        self.jwt_secret = jwt_secret
+        self.jwks_url = f"{supabase_url}/auth/v1/.well-known/jwks.json" if supabase_url else None
+        self._claims = OrderedDict()  # token digest -> (exp, claims)
+        self._claims_lock = threading.Lock()
+        self._keys = {}  # kid -> PyJWK
+        self._keys_lock = threading.Lock()
+        self._refresh_wanted = threading.Event()
+        self._last_refresh = 0
+        self._pid = None
+
+    @property
+    def configured(self):
+        return bool(self.jwt_secret or self.jwks_url)
+
+    def start(self):
+        """Start the background JWKS refresher (once per process)"""
+        if not self.jwks_url or self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._keys = {}
+        threading.Thread(target=self._refresh_loop, name='jwks-refresh', daemon=True).start()
+
+    def verify(self, token):
+        """
+        Return the token's verified claims. Raises jwt.ExpiredSignatureError
+        or jwt.InvalidTokenError like jwt.decode.
+        """
+        digest = hashlib.sha256(token.encode('utf-8')).digest()
+        now = time.time()
+
+        with self._claims_lock:
+            entry = self._claims.get(digest)
+            if entry is not None:
+                exp, claims = entry
+                if exp > now:
+                    self._claims.move_to_end(digest)
+                    metrics.incr('auth.token_cache.hit')
+                    return claims
+                del self._claims[digest]
+                raise jwt.ExpiredSignatureError('Signature has expired')
+
+        metrics.incr('auth.token_cache.miss')
+        claims = self._decode(token)
+
+        exp = claims.get('exp')
+        if isinstance(exp, (int, float)):
+            with self._claims_lock:
+                self._claims[digest] = (exp, claims)
+                while len(self._claims) > MAX_CACHED_TOKENS:
+                    self._claims.popitem(last=False)
+        return claims
+
+    def _decode(self, token):
+        header = jwt.get_unverified_header(token)
+        algorithm = header.get('alg')
+
+        if algorithm == 'HS256':
+            if not self.jwt_secret:
+                raise jwt.InvalidTokenError('HS256 tokens are not accepted')
+            key = self.jwt_secret
+        elif algorithm in ASYMMETRIC_ALGORITHMS:
+            key = self._signing_key(header.get('kid'), algorithm)
+        else:
+            raise jwt.InvalidTokenError(f'Unsupported signing algorithm {algorithm}')
+
+        return jwt.decode(token, key, algorithms=[algorithm], audience=AUDIENCE)
+
+    def _signing_key(self, kid, algorithm):
+        self.start()  # no-op unless this process hasn't started the refresher yet
+        with self._keys_lock:
+            jwk = self._keys.get(kid)
+        if jwk is None:
+            # Possibly a rotated key: fetch in the background, don't make this request wait
+            self._refresh_wanted.set()
+            raise jwt.InvalidTokenError('Unknown signing key')
+        if jwk.algorithm_name != algorithm:
+            raise jwt.InvalidTokenError('Signing key does not match token algorithm')
+        return jwk.key
+
+    def _refresh_loop(self):
+        while True:
+            self._refresh_keys()
+            self._refresh_wanted.wait(timeout=JWKS_REFRESH_SECONDS)
+            self._refresh_wanted.clear()
+            # Don't let a stream of bogus key ids hammer the auth server
+            time.sleep(max(0, self._last_refresh + JWKS_MIN_REFRESH_GAP - time.time()))
+
+    def _refresh_keys(self):
+        self._last_refresh = time.time()
+        try:
+            response = upstream_clients.get_http_session().get(self.jwks_url, timeout=10)
+            response.raise_for_status()
+            keys = {}
+            for key_data in response.json().get('keys', []):
+                try:
+                    jwk = jwt.PyJWK(key_data)
+                except Exception as e:
+                    print(f"⚠ Skipping unusable JWKS key {key_data.get('kid')}: {str(e)}")
+                    continue
+                if jwk.key_id:
+                    keys[jwk.key_id] = jwk
+            with self._keys_lock:
+                self._keys = keys
+            metrics.incr('auth.jwks.refresh')
+        except Exception as e:
+            # Keep serving with the keys we already have
+            print(f"⚠ Failed to refresh JWKS: {str(e)}")
+            metrics.incr('auth.jwks.refresh_failed')
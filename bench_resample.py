@@ -0,0 +1,94 @@
+"""
+Benchmark: polyphase block resampler vs the old FFT resample path.
+
+Compares audio_pipeline.resample_to_pcm16 against the previous
+transcribe_audio conversion (np.mean downmix + scipy.signal.resample +
+float -> int16) for common browser/upload sample rates and durations.
+
+Usage:
+    python bench_resample.py                 # default rates and durations
+    python bench_resample.py --durations 10 60 600 --repeat 3
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+from scipy import signal as scipy_signal
+
+import audio_pipeline
+
+DEFAULT_RATES = [8000, 22050, 44100, 48000]
+DEFAULT_DURATIONS = [10, 60, 600]
+
+
+def fft_path(audio_data, sample_rate, target_rate=audio_pipeline.TARGET_SAMPLE_RATE):
+    """The conversion transcribe_audio used before the polyphase resampler"""
+    if audio_data.shape[1] > 1:
+        mono = np.mean(audio_data, axis=1)
+    else:
+        mono = audio_data[:, 0]
+    num_samples = int(len(mono) * target_rate / sample_rate)
+    resampled = scipy_signal.resample(mono, num_samples)
+    return (np.clip(resampled, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+def polyphase_path(audio_data, sample_rate):
+    return audio_pipeline.resample_to_pcm16(audio_data, sample_rate)
+
+
+def measure(fn, audio_data, sample_rate, repeat):
+    """Best-of-N wall time and peak traced memory for one conversion"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(audio_data, sample_rate)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn(audio_data, sample_rate)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def make_signal(sample_rate, seconds, channels=2):
+    """Speech-band noise plus a tone, odd length like real recordings"""
+    rng = np.random.default_rng(0)
+    frames = int(sample_rate * seconds) + 137
+    t = np.arange(frames, dtype=np.float32) / sample_rate
+    tone = 0.3 * np.sin(2 * np.pi * 220 * t, dtype=np.float32)
+    audio = (0.1 * rng.standard_normal((frames, channels))).astype(np.float32)
+    audio += tone[:, np.newaxis]
+    return audio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rates', type=int, nargs='+', default=DEFAULT_RATES)
+    parser.add_argument('--durations', type=float, nargs='+', default=DEFAULT_DURATIONS)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    # Keep per-call logging out of the timings
+    audio_pipeline.print = lambda *a, **k: None
+
+    header = f"{'rate':>7} {'dur(s)':>7} | {'fft ms':>9} {'fft MB':>8} | {'poly ms':>9} {'poly MB':>8} | {'speedup':>7}"
+    print(header)
+    print('-' * len(header))
+
+    for rate in args.rates:
+        for seconds in args.durations:
+            audio_data = make_signal(rate, seconds)
+            fft_time, fft_peak = measure(fft_path, audio_data, rate, args.repeat)
+            poly_time, poly_peak = measure(polyphase_path, audio_data, rate, args.repeat)
+            print(
+                f"{rate:>7} {seconds:>7g} | "
+                f"{fft_time * 1000:>9.1f} {fft_peak / 1e6:>8.1f} | "
+                f"{poly_time * 1000:>9.1f} {poly_peak / 1e6:>8.1f} | "
+                f"{fft_time / poly_time:>6.1f}x"
+            )
+
+
+if __name__ == '__main__':
+    main()
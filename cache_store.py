@@ -0,0 +1,215 @@
+"""
+Small two-tier cache used in front of paid upstream calls.
+
+Tier 1 is a bounded in-memory LRU per worker. Tier 2 is an optional directory
+of JSON files (CACHE_DIR) shared by every gunicorn worker on the machine and
+surviving restarts. Values must be JSON-serializable.
+
+The disk tier is swept at most every DISK_SWEEP_INTERVAL_SECONDS by whichever
+worker writes next: entries past their TTL are deleted (a file's mtime is
+when it was written or last hit), then the least recently used ones until
+the cache fits in max_disk_bytes.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+# Shared on-disk tier for all caches (disabled when unset)
+CACHE_DIR = os.getenv('CACHE_DIR')
+
+# Disk space per cache, and how often the disk tier is swept
+CACHE_DIR_MAX_BYTES = int(os.getenv('CACHE_DIR_MAX_MB', '256')) * 1024 * 1024
+DISK_SWEEP_INTERVAL_SECONDS = 5 * 60
+
+# Temp files older than this were left behind by a crashed write
+STALE_TMP_SECONDS = 60 * 60
+
+
+def hash_key(*parts):
+    """sha256 over the given parts (bytes or str), separated so ('ab','c') != ('a','bc')"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        digest.update(hashlib.sha256(part).digest())
+    return digest.hexdigest()
+
+
+class TieredCache:
+    """Bounded LRU in memory, optionally backed by a shared directory"""
+
+    def __init__(self, name, max_entries=256, ttl=None, disk_dir=CACHE_DIR, max_disk_bytes=CACHE_DIR_MAX_BYTES):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = os.path.join(disk_dir, name) if disk_dir else None
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        self._next_sweep = 0.0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def get(self, key):
+        """Return the cached value, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at is None or expires_at > now:
+                    self._entries.move_to_end(key)
+                    metrics.incr(f'cache.{self.name}.hit')
+                    return value
+                del self._entries[key]
+
+        if self.disk_dir:
+            entry = self._read_disk(key, now)
+            if entry is not None:
+                expires_at, value = entry
+                self._remember(key, value, expires_at)
+                metrics.incr(f'cache.{self.name}.hit')
+                metrics.incr(f'cache.{self.name}.disk_hit')
+                return value
+
+        metrics.incr(f'cache.{self.name}.miss')
+        return None
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl if self.ttl else None
+        self._remember(key, value, expires_at)
+        if self.disk_dir:
+            self._write_disk(key, value, expires_at)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.disk_dir:
+            try:
+                os.remove(self._disk_path(key))
+            except FileNotFoundError:
+                pass
+
+    def _remember(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f'{key}.json')
+
+    def _read_disk(self, key, now):
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"⚠ Cache {self.name}: unreadable entry {path}: {str(e)}")
+            return None
+
+        expires_at = entry.get('expires_at')
+        if expires_at is not None and expires_at <= now:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        try:
+            os.utime(path)  # mark as recently used for the sweep
+        except OSError:
+            pass
+        return expires_at, entry.get('value')
+
+    def _write_disk(self, key, value, expires_at):
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file and rename so other workers never read a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'expires_at': expires_at, 'value': value}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"⚠ Cache {self.name}: failed to write {path}: {str(e)}")
+        self._maybe_sweep()
+
+    def _maybe_sweep(self):
+        now = time.time()
+        if now < self._next_sweep or not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_sweep = now + DISK_SWEEP_INTERVAL_SECONDS
+            self._sweep(now)
+        except Exception as e:
+            print(f"⚠ Cache {self.name}: disk sweep failed: {str(e)}")
+        finally:
+            self._sweep_lock.release()
+
+    def _sweep(self, now):
+        """Delete expired entries, then least recently used ones beyond max_disk_bytes"""
+        files = []  # (mtime, size, path)
+        removed = 0
+        for directory, _, names in os.walk(self.disk_dir):
+            for file_name in names:
+                path = os.path.join(directory, file_name)
+                try:
+                    info = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                age = now - info.st_mtime
+                if file_name.endswith('.tmp'):
+                    expired = age > STALE_TMP_SECONDS
+                else:
+                    # mtime >= write time, so this never deletes early (reads check expires_at)
+                    expired = self.ttl is not None and age > self.ttl
+                if expired:
+                    removed += _remove(path)
+                elif not file_name.endswith('.tmp'):
+                    files.append((info.st_mtime, info.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        if self.max_disk_bytes and total > self.max_disk_bytes:
+            files.sort()
+            for _, size, path in files:
+                if total <= self.max_disk_bytes:
+                    break
+                removed += _remove(path)
+                total -= size
+
+        if removed:
+            metrics.incr(f'cache.{self.name}.disk_evicted', removed)
+            print(f"✓ Cache {self.name}: swept {removed} disk entries, {total // 1024} KB left")
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        counters = metrics.snapshot()['counters']
+        return {
+            'entries': size,
+            'max_entries': self.max_entries,
+            'hits': counters.get(f'cache.{self.name}.hit', 0),
+            'misses': counters.get(f'cache.{self.name}.miss', 0),
+            'disk': bool(self.disk_dir),
+            'max_disk_bytes': self.max_disk_bytes if self.disk_dir else None,
+        }
+
+
+def _remove(path):
+    """1 if path was deleted, 0 if it was already gone"""
+    try:
+        os.remove(path)
+        return 1
+    except FileNotFoundError:
+        return 0
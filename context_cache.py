@@ -0,0 +1,154 @@
+"""
+Gemini context caching for the fixed part of the extraction prompt.
+
+The extraction instructions depend only on the extraction mode and the
+output language, so each combination is registered once as a Gemini
+CachedContent and requests send just the transcription. Cached input
+tokens are billed at a discount and don't have to be processed again.
+
+Gemini only caches content above a minimum size, and the instruction
+blocks are usually below it, so the feature is off by default. When it is
+on, each block is measured once with count_tokens and a block under
+CONTEXT_CACHE_MIN_TOKENS is never sent to CachedContent.create, instead of
+paying for a create call that is bound to fail on a user's request.
+
+Entries are created on first use, extended whenever they are used within
+CONTEXT_CACHE_REFRESH_MARGIN of expiry, and simply allowed to expire when
+a language goes unused. If Gemini refuses to cache an instruction block
+anyway, that key is not retried for CONTEXT_CACHE_RETRY_SECONDS and
+callers fall back to sending the full prompt.
+"""
+import os
+import threading
+import time
+from datetime import timedelta
+
+import google.generativeai as genai
+
+import metrics
+
+GEMINI_CONTEXT_CACHE = os.getenv('GEMINI_CONTEXT_CACHE', 'false').lower() not in ('0', 'false', 'no')
+
+# Smallest block Gemini will cache (1024 tokens for 2.5 Flash, 4096 for 2.5 Pro)
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv('GEMINI_CONTEXT_CACHE_MIN_TOKENS', '1024'))
+
+# Lifetime of a cached instruction block, and how close to expiry it gets extended
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv('GEMINI_CONTEXT_CACHE_TTL', '3600'))
+CONTEXT_CACHE_REFRESH_MARGIN = 10 * 60
+
+# Wait this long before trying to cache a key again after Gemini refused it
+CONTEXT_CACHE_RETRY_SECONDS = 60 * 60
+
+_lock = threading.Lock()
+_entries = {}       # key -> _CacheEntry
+_key_locks = {}     # key -> Lock, so one slow create doesn't block other keys
+_failed_until = {}  # key -> timestamp
+_too_small = set()  # keys whose instructions are below CONTEXT_CACHE_MIN_TOKENS
+
+
+class _CacheEntry:
+    def __init__(self, cached_content, expires_at):
+        self.cached_content = cached_content
+        self.expires_at = expires_at
+        self.model = genai.GenerativeModel.from_cached_content(cached_content)
+
+
+def get_cached_model(key, model_name, system_instruction):
+    """
+    GenerativeModel bound to cached system_instruction for key, or None if
+    context caching is disabled or unavailable for this key.
+    """
+    if not GEMINI_CONTEXT_CACHE:
+        return None
+
+    now = time.time()
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and entry.expires_at - now > CONTEXT_CACHE_REFRESH_MARGIN:
+            metrics.incr('gemini.context_cache.hit')
+            return entry.model
+        if key in _too_small or _failed_until.get(key, 0) > now:
+            return None
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+
+    with key_lock:
+        with _lock:
+            entry = _entries.get(key)
+        now = time.time()
+        if entry is not None and entry.expires_at - now > CONTEXT_CACHE_REFRESH_MARGIN:
+            # Another thread refreshed it while we waited
+            metrics.incr('gemini.context_cache.hit')
+            return entry.model
+
+        if entry is not None and entry.expires_at > now and _extend(key, entry):
+            return entry.model
+
+        if entry is None and not _large_enough(key, model_name, system_instruction):
+            return None
+
+        return _create(key, model_name, system_instruction)
+
+
+def _large_enough(key, model_name, system_instruction):
+    """Whether the block can be cached at all; measured once per key"""
+    try:
+        tokens = genai.GenerativeModel(model_name).count_tokens(system_instruction).total_tokens
+    except Exception as e:
+        print(f"⚠ Context cache {key}: couldn't count tokens, sending full prompts: {str(e)}")
+        with _lock:
+            _failed_until[key] = time.time() + CONTEXT_CACHE_RETRY_SECONDS
+        return False
+
+    if tokens < CONTEXT_CACHE_MIN_TOKENS:
+        print(f"⚠ Context cache {key}: {tokens} tokens is below the {CONTEXT_CACHE_MIN_TOKENS} minimum, not caching")
+        metrics.incr('gemini.context_cache.too_small')
+        with _lock:
+            _too_small.add(key)
+        return False
+    return True
+
+
+def _extend(key, entry):
+    try:
+        entry.cached_content.update(ttl=timedelta(seconds=CONTEXT_CACHE_TTL_SECONDS))
+        entry.expires_at = time.time() + CONTEXT_CACHE_TTL_SECONDS
+        metrics.incr('gemini.context_cache.refresh')
+        return True
+    except Exception as e:
+        print(f"⚠ Context cache {key}: refresh failed, recreating: {str(e)}")
+        return False
+
+
+def _create(key, model_name, system_instruction):
+    try:
+        cached_content = genai.caching.CachedContent.create(
+            model=model_name,
+            display_name=f'recipediary-{key}',
+            system_instruction=system_instruction,
+            ttl=timedelta(seconds=CONTEXT_CACHE_TTL_SECONDS),
+        )
+        entry = _CacheEntry(cached_content, time.time() + CONTEXT_CACHE_TTL_SECONDS)
+    except Exception as e:
+        print(f"⚠ Context cache {key}: not available, sending full prompts: {str(e)}")
+        metrics.incr('gemini.context_cache.create_failed')
+        with _lock:
+            _entries.pop(key, None)
+            _failed_until[key] = time.time() + CONTEXT_CACHE_RETRY_SECONDS
+        return None
+
+    with _lock:
+        _entries[key] = entry
+    metrics.incr('gemini.context_cache.create')
+    print(f"✓ Context cache {key}: registered {cached_content.name}")
+    return entry.model
+
+
+def stats():
+    with _lock:
+        now = time.time()
+        return {
+            'enabled': GEMINI_CONTEXT_CACHE,
+            'entries': sorted(key for key, entry in _entries.items() if entry.expires_at > now),
+            'unavailable': sorted(key for key, until in _failed_until.items() if until > now),
+            'too_small': sorted(_too_small),
+        }
@@ -117,3 +117,164 @@ BEGIN
 END;
 $$;
 
+
+-- Step 8: Credit reservations
+-- A recipe holds its cost when the pipeline starts (reserve_credits), and the
+-- hold is either committed once the recipe is delivered or released if the
+-- pipeline fails. Holds are taken off the balance immediately, so concurrent
+-- requests can't spend the same credits twice. A hold that is neither
+-- committed nor released (e.g. the worker died) is released automatically
+-- after ttl_seconds: lazily on the user's next reservation, or by
+-- release_expired_credit_reservations() if you schedule it with pg_cron.
+CREATE TABLE IF NOT EXISTS credit_reservations (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    user_id UUID REFERENCES auth.users(id) ON DELETE CASCADE NOT NULL,
+    amount INTEGER NOT NULL CHECK (amount > 0),
+    status TEXT DEFAULT 'held' NOT NULL CHECK (status IN ('held', 'committed', 'released')),
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT timezone('utc'::text, now()) NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_credit_reservations_held
+ON credit_reservations (user_id, expires_at) WHERE status = 'held';
+
+ALTER TABLE credit_reservations ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Users can view own reservations" ON credit_reservations;
+CREATE POLICY "Users can view own reservations"
+ON credit_reservations FOR SELECT
+USING (auth.uid() = user_id);
+
+-- Hold `amount` credits for the current user
+CREATE OR REPLACE FUNCTION reserve_credits(amount INTEGER, ttl_seconds INTEGER DEFAULT 600)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  uid UUID;
+  refund INTEGER;
+  new_balance INTEGER;
+  reservation credit_reservations%ROWTYPE;
+BEGIN
+  uid := auth.uid();
+
+  IF uid IS NULL THEN
+    RETURN jsonb_build_object('success', false, 'error', 'Not authenticated');
+  END IF;
+
+  IF amount <= 0 THEN
+    RETURN jsonb_build_object('success', false, 'error', 'Invalid amount');
+  END IF;
+
+  -- Create the profile if missing, and lock it for the rest of the transaction
+  INSERT INTO profiles (id, credits) VALUES (uid, 10) ON CONFLICT (id) DO NOTHING;
+  PERFORM 1 FROM profiles WHERE id = uid FOR UPDATE;
+
+  -- Release this user's abandoned holds first
+  WITH expired AS (
+    UPDATE credit_reservations SET status = 'released'
+    WHERE user_id = uid AND status = 'held' AND expires_at < now()
+    RETURNING credit_reservations.amount
+  )
+  SELECT COALESCE(SUM(expired.amount), 0) INTO refund FROM expired;
+
+  UPDATE profiles SET credits = credits + refund, updated_at = now()
+  WHERE id = uid
+  RETURNING credits INTO new_balance;
+
+  IF new_balance < amount THEN
+    RETURN jsonb_build_object('success', false, 'error', 'Insufficient credits', 'current_balance', new_balance);
+  END IF;
+
+  UPDATE profiles SET credits = credits - amount, updated_at = now()
+  WHERE id = uid
+  RETURNING credits INTO new_balance;
+
+  INSERT INTO credit_reservations (user_id, amount, expires_at)
+  VALUES (uid, amount, now() + make_interval(secs => ttl_seconds))
+  RETURNING * INTO reservation;
+
+  RETURN jsonb_build_object(
+    'success', true,
+    'reservation_id', reservation.id,
+    'expires_at', reservation.expires_at,
+    'new_balance', new_balance
+  );
+END;
+$$;
+
+-- Keep a hold: the credits are spent. Idempotent, so the server can retry
+-- it safely; fails only if the hold was already released.
+CREATE OR REPLACE FUNCTION commit_credit_reservation(reservation_id UUID)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+  UPDATE credit_reservations SET status = 'committed'
+  WHERE id = reservation_id AND user_id = auth.uid() AND status IN ('held', 'committed');
+
+  IF NOT FOUND THEN
+    RETURN jsonb_build_object('success', false, 'error', 'Reservation not held');
+  END IF;
+
+  RETURN jsonb_build_object('success', true);
+END;
+$$;
+
+-- Give a hold back to the user
+CREATE OR REPLACE FUNCTION release_credit_reservation(reservation_id UUID)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  released_amount INTEGER;
+  new_balance INTEGER;
+BEGIN
+  UPDATE credit_reservations SET status = 'released'
+  WHERE id = reservation_id AND user_id = auth.uid() AND status = 'held'
+  RETURNING amount INTO released_amount;
+
+  IF released_amount IS NULL THEN
+    RETURN jsonb_build_object('success', false, 'error', 'Reservation not held');
+  END IF;
+
+  UPDATE profiles SET credits = credits + released_amount, updated_at = now()
+  WHERE id = auth.uid()
+  RETURNING credits INTO new_balance;
+
+  RETURN jsonb_build_object('success', true, 'new_balance', new_balance);
+END;
+$$;
+
+-- Release every expired hold (optional; e.g. every 5 minutes with pg_cron:
+--   SELECT cron.schedule('release-credit-holds', '*/5 * * * *', 'SELECT release_expired_credit_reservations()');
+-- ) Not callable by API users.
+CREATE OR REPLACE FUNCTION release_expired_credit_reservations()
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  released_count INTEGER;
+BEGIN
+  WITH expired AS (
+    UPDATE credit_reservations SET status = 'released'
+    WHERE status = 'held' AND expires_at < now()
+    RETURNING user_id, amount
+  ), refunds AS (
+    SELECT user_id, SUM(amount) AS total, COUNT(*) AS holds FROM expired GROUP BY user_id
+  ), updated AS (
+    UPDATE profiles SET credits = profiles.credits + refunds.total, updated_at = now()
+    FROM refunds WHERE profiles.id = refunds.user_id
+    RETURNING refunds.holds
+  )
+  SELECT COALESCE(SUM(holds), 0) INTO released_count FROM updated;
+
+  RETURN released_count;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION release_expired_credit_reservations() FROM PUBLIC, anon, authenticated;
@@ -0,0 +1,202 @@
+"""
+Recipe card image generation with hedged backends.
+
+Two backends can produce the image: the Gemini image preview model (AI
+Studio, GEMINI_API_KEY) and Vertex AI Imagen 3 (service account). The
+primary backend starts right away; if it hasn't produced an image after
+IMAGE_HEDGE_DELAY_SECONDS (or fails sooner) the secondary starts as well,
+and whichever returns a valid image first wins. The loser's HTTP request
+can't be aborted mid-flight, so it is left to finish in the background and
+its result is discarded (but still recorded).
+
+IMAGE_HEDGE_DELAY_SECONDS=0 races both immediately; IMAGE_HEDGE_MODE=sequential
+restores the old try-Gemini-then-Vertex behaviour.
+"""
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import metrics
+import upstream_clients
+
+BACKENDS = ('gemini', 'vertex')
+
+IMAGE_HEDGE_MODE = os.getenv('IMAGE_HEDGE_MODE', 'hedged').lower()
+IMAGE_HEDGE_DELAY_SECONDS = float(os.getenv('IMAGE_HEDGE_DELAY_SECONDS', '8'))
+
+# Per-backend HTTP timeout
+IMAGE_REQUEST_TIMEOUT = 30
+
+# Two backends per request; a loser may keep its thread until its timeout
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv('IMAGE_WORKERS', '8')), thread_name_prefix='image')
+
+_lock = threading.Lock()
+_started = {backend: 0 for backend in BACKENDS}
+_wins = {backend: 0 for backend in BACKENDS}
+
+
+class ImageBackendError(Exception):
+    """A backend returned an error or no image"""
+
+
+def _generate_image_gemini(prompt, api_key):
+    """Gemini 3 Pro Image Preview via the AI Studio API; returns base64 PNG data"""
+    # Preferred for "Preview" models as it bypasses some Vertex AI region restrictions
+    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-3-pro-image-preview:generateContent?key={api_key}"
+
+    headers = {"Content-Type": "application/json"}
+
+    payload = {
+        "contents": [{
+            "parts": [{"text": prompt}]
+        }],
+        "generationConfig": {
+            "responseModalities": ["IMAGE"],
+            "imageConfig": {
+                "aspectRatio": "3:4",
+                "imageSize": "2K"
+            }
+        }
+    }
+
+    response = upstream_clients.get_http_session().post(url, headers=headers, json=payload, timeout=IMAGE_REQUEST_TIMEOUT)
+
+    if response.status_code != 200:
+        raise ImageBackendError(f"Gemini API Error: {response.status_code} - {response.text}")
+
+    candidates = response.json().get('candidates', [])
+    if candidates:
+        parts = candidates[0].get('content', {}).get('parts', [])
+        for part in parts:
+            inline_data = part.get('inlineData') or part.get('inline_data')
+            if inline_data and inline_data.get('data'):
+                return inline_data['data']
+    raise ImageBackendError("Gemini API returned no image")
+
+
+def _generate_image_vertex(prompt):
+    """Imagen 3 via the Vertex AI REST API; returns base64 PNG data"""
+    # Cached service-account token, refreshed only shortly before expiry
+    token, project_id = upstream_clients.get_vertex_access_token()
+
+    # Vertex AI Endpoint for Imagen 3 (Stable)
+    url = f"https://us-central1-aiplatform.googleapis.com/v1/projects/{project_id}/locations/us-central1/publishers/google/models/imagen-3.0-generate-001:predict"
+
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json; charset=utf-8"
+    }
+
+    payload = {
+        "instances": [
+            {
+                "prompt": prompt
+            }
+        ],
+        "parameters": {
+            "sampleCount": 1,
+            "aspectRatio": "3:4",
+            "safetyFilterLevel": "block_some",
+            "personGeneration": "allow_adult"
+        }
+    }
+
+    response = upstream_clients.get_http_session().post(url, headers=headers, json=payload, timeout=IMAGE_REQUEST_TIMEOUT)
+
+    if response.status_code == 200:
+        predictions = response.json().get('predictions', [])
+        # Imagen 3 returns base64 encoded image in 'bytesBase64Encoded'
+        if predictions and predictions[0].get('bytesBase64Encoded'):
+            return predictions[0]['bytesBase64Encoded']
+    raise ImageBackendError(f"Vertex Error: {response.text}")
+
+
+def _run_backend(backend, prompt, api_key):
+    """Call one backend, recording its latency and outcome"""
+    with _lock:
+        _started[backend] += 1
+    metrics.incr(f'image.{backend}.calls')
+    started = time.time()
+    try:
+        if backend == 'gemini':
+            image = _generate_image_gemini(prompt, api_key)
+        else:
+            image = _generate_image_vertex(prompt)
+    except Exception as e:
+        metrics.incr(f'image.{backend}.errors')
+        print(f"Image backend {backend} failed after {time.time() - started:.1f}s: {str(e)}")
+        raise
+    metrics.observe(f'image.{backend}.latency_ms', (time.time() - started) * 1000)
+    return image
+
+
+def generate_image(prompt, gemini_api_key=None):
+    """
+    Generate an image for prompt. Returns (base64_png, backend).
+    Raises ImageBackendError with every backend's error if none succeeded.
+    """
+    backends = [backend for backend in BACKENDS if backend != 'gemini' or gemini_api_key]
+    started = time.time()
+    errors = {}
+
+    pending = {}  # future -> backend
+    queue = list(backends)
+
+    def start_next():
+        backend = queue.pop(0)
+        print(f"Starting image backend {backend}...")
+        pending[_executor.submit(_run_backend, backend, prompt, gemini_api_key)] = backend
+
+    start_next()
+    while pending:
+        if queue and IMAGE_HEDGE_MODE != 'sequential':
+            # Give the running backend a head start before hedging
+            done, _ = wait(pending, timeout=IMAGE_HEDGE_DELAY_SECONDS, return_when=FIRST_COMPLETED)
+            if not done:
+                metrics.incr('image.hedged')
+                start_next()
+                continue
+        else:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            backend = pending.pop(future)
+            try:
+                image = future.result()
+            except Exception as e:
+                errors[backend] = str(e)
+                continue
+
+            # First valid image wins; anything still running is ignored
+            for loser in pending:
+                loser.cancel()
+            with _lock:
+                _wins[backend] += 1
+            metrics.incr(f'image.{backend}.wins')
+            metrics.observe('image.latency_ms', (time.time() - started) * 1000)
+            print(f"✓ Image generated by {backend} in {time.time() - started:.1f}s")
+            return image, backend
+
+        if queue and not pending:
+            # Everything started so far failed: don't wait out the hedge delay
+            start_next()
+
+    raise ImageBackendError('; '.join(f"{backend}: {error}" for backend, error in errors.items()) or 'No image backend available')
+
+
+def stats():
+    """Per-backend win rates (wins / times started)"""
+    with _lock:
+        return {
+            'mode': IMAGE_HEDGE_MODE,
+            'hedge_delay_seconds': IMAGE_HEDGE_DELAY_SECONDS,
+            'backends': {
+                backend: {
+                    'started': _started[backend],
+                    'wins': _wins[backend],
+                    'win_rate': round(_wins[backend] / _started[backend], 4) if _started[backend] else None,
+                }
+                for backend in BACKENDS
+            },
+        }
@@ -0,0 +1,211 @@
+"""
+Content-addressed storage for generated images.
+
+Images are named by a hash of their bytes, so a stored image never changes
+and can be cached by browsers and CDNs forever. A small pointer object
+named by a hash of the prompt (<prompt key>.ref) records which image that
+prompt currently maps to, so the same recipe card prompt is served from the
+store instead of being generated (and paid for) again, and regenerating it
+just moves the pointer to a new, differently named image.
+
+Backends (IMAGE_STORE_BACKEND):
+  local     files under IMAGE_STORE_DIR, served by /api/images/<name>
+  supabase  a public Supabase Storage bucket (IMAGE_STORE_BUCKET), served by Supabase
+
+Other object stores plug in by subclassing ImageStore and adding a branch
+to create_store().
+"""
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import cache_store
+import upstream_clients
+
+IMAGE_STORE_BACKEND = os.getenv('IMAGE_STORE_BACKEND', 'local').lower()
+IMAGE_STORE_DIR = os.getenv(
+    'IMAGE_STORE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'generated_images')
+)
+IMAGE_STORE_BUCKET = os.getenv('IMAGE_STORE_BUCKET', 'recipe-images')
+
+# Not known to every platform's mimetypes table
+mimetypes.add_type('image/webp', '.webp')
+mimetypes.add_type('image/avif', '.avif')
+
+# Images are immutable, so clients may cache them for a year; pointers change
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+POINTER_CACHE_CONTROL = 'no-cache'
+
+# Image names: <sha256>.<ext>, optionally with a variant suffix such as -thumb
+_NAME_PATTERN = re.compile(r'^[0-9a-f]{64}(-[a-z0-9]+)?\.(png|webp|avif)$')
+_KEY_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# Locks for prompt keys being generated right now, with their waiter counts
+_key_locks = {}
+_key_locks_guard = threading.Lock()
+
+
+def image_key(prompt):
+    """Key of the prompt: names its pointer, not the image itself"""
+    return cache_store.hash_key('recipe-card', prompt)
+
+
+def content_key(data):
+    """Key of an image: a hash of its bytes"""
+    return cache_store.hash_key('recipe-card-png', data)
+
+
+def valid_name(name):
+    return bool(_NAME_PATTERN.match(name))
+
+
+def content_type(name):
+    return mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+
+@contextmanager
+def key_lock(key):
+    """
+    Held while generating for a prompt key, so identical concurrent requests
+    generate once. Each key has its own lock, so different prompts never wait
+    on each other; the lock is dropped when nobody holds or waits for it.
+    """
+    with _key_locks_guard:
+        entry = _key_locks.get(key)
+        if entry is None:
+            entry = _key_locks[key] = [threading.Lock(), 0]
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _key_locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _key_locks[key]
+
+
+class ImageStore:
+    """Interface for image backends; names are a key plus an extension"""
+
+    def exists(self, name):
+        raise NotImplementedError
+
+    def put(self, name, data, cache_control=IMMUTABLE_CACHE_CONTROL):
+        raise NotImplementedError
+
+    def read(self, name):
+        """Stored bytes, or None if there's no such object"""
+        raise NotImplementedError
+
+    def get(self, name):
+        """Bytes to serve through /api/images, or None if url() serves them"""
+        return None
+
+    def url(self, name):
+        raise NotImplementedError
+
+    def current(self, prompt_key):
+        """Content key of the image prompt_key currently points to, or None"""
+        data = self.read(f'{prompt_key}.ref')
+        if data is not None:
+            key = data.decode('ascii', 'ignore').strip()
+            return key if _KEY_PATTERN.match(key) else None
+        # Images stored before pointers existed were named by the prompt key
+        return prompt_key if self.exists(f'{prompt_key}.png') else None
+
+    def set_current(self, prompt_key, key):
+        self.put(f'{prompt_key}.ref', key.encode('ascii'), cache_control=POINTER_CACHE_CONTROL)
+
+
+class LocalImageStore(ImageStore):
+    """Files on local disk, shared by all workers on the machine"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name[:2], name)
+
+    def exists(self, name):
+        return os.path.exists(self._path(name))
+
+    def put(self, name, data, cache_control=IMMUTABLE_CACHE_CONTROL):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial image
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def read(self, name):
+        try:
+            with open(self._path(name), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    get = read
+
+    def url(self, name):
+        return f'/api/images/{name}'
+
+
+class SupabaseImageStore(ImageStore):
+    """
+    Public Supabase Storage bucket. Needs a key allowed to upload to the
+    bucket (SUPABASE_SERVICE_KEY, falling back to SUPABASE_KEY).
+    """
+
+    def __init__(self, supabase_url, api_key, bucket):
+        self.base_url = f"{supabase_url}/storage/v1/object"
+        self.api_key = api_key
+        self.bucket = bucket
+
+    def _headers(self):
+        return {'apikey': self.api_key, 'Authorization': f'Bearer {self.api_key}'}
+
+    def exists(self, name):
+        response = upstream_clients.get_http_session().head(
+            f"{self.base_url}/public/{self.bucket}/{name}", timeout=10
+        )
+        return response.status_code == 200
+
+    def put(self, name, data, cache_control=IMMUTABLE_CACHE_CONTROL):
+        headers = self._headers()
+        headers.update({'Content-Type': content_type(name), 'Cache-Control': cache_control, 'x-upsert': 'true'})
+        response = upstream_clients.get_http_session().post(
+            f"{self.base_url}/{self.bucket}/{name}", headers=headers, data=data, timeout=30
+        )
+        if response.status_code not in (200, 201):
+            raise Exception(f"Storage upload failed: {response.status_code} - {response.text}")
+
+    def read(self, name):
+        # Authenticated download, so a changed pointer isn't served from the CDN
+        response = upstream_clients.get_http_session().get(
+            f"{self.base_url}/{self.bucket}/{name}", headers=self._headers(), timeout=30
+        )
+        if response.status_code in (400, 404):
+            return None
+        if response.status_code != 200:
+            raise Exception(f"Storage download failed: {response.status_code} - {response.text}")
+        return response.content
+
+    def url(self, name):
+        return f"{self.base_url}/public/{self.bucket}/{name}"
+
+
+def create_store():
+    if IMAGE_STORE_BACKEND == 'supabase':
+        supabase_url = os.getenv('SUPABASE_URL')
+        api_key = os.getenv('SUPABASE_SERVICE_KEY') or os.getenv('SUPABASE_KEY')
+        if supabase_url and api_key:
+            return SupabaseImageStore(supabase_url, api_key, IMAGE_STORE_BUCKET)
+        print("⚠ IMAGE_STORE_BACKEND=supabase but Supabase is not configured; storing images locally")
+    return LocalImageStore(IMAGE_STORE_DIR)
@@ -0,0 +1,129 @@
+"""
+Compressed variants of generated images.
+
+Every stored recipe card PNG gets a full-size, a preview and a thumbnail
+version in WebP (and AVIF when Pillow supports it). They are built once on
+a small background executor right after the image is stored, so the
+request that generated the image never waits for re-encoding.
+
+Keys are content hashes, so an image that is regenerated gets a new key and
+fresh variants rather than stale ones under the old name.
+
+/api/images/<key>/<variant> picks the best format the client's Accept
+header lists, and serves the original PNG until the variant is ready.
+
+Pillow is optional: without it no variants are built and the PNG is served.
+"""
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, features
+except ImportError:  # Pillow not installed: variants disabled
+    Image = None
+    features = None
+
+import metrics
+
+# Longest edge in pixels (None = original size)
+VARIANTS = {
+    'full': None,
+    'preview': 1024,
+    'thumb': 320,
+}
+
+# (extension, Pillow format, mimetype, save options), most preferred first
+_FORMATS = [
+    ('avif', 'AVIF', 'image/avif', {'quality': 55, 'speed': 8}),
+    ('webp', 'WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+]
+
+ORIGINAL_MIMETYPE = 'image/png'
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='image-variants')
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def available_formats():
+    """Formats this Pillow build can encode"""
+    if Image is None:
+        return []
+    return [fmt for fmt in _FORMATS if features.check(fmt[0])]
+
+
+def variant_name(key, variant, ext):
+    return f'{key}-{variant}.{ext}'
+
+
+def schedule(store, key, png_bytes=None):
+    """
+    Build any missing variants of key in the background. png_bytes may be
+    omitted if the store can read the original back.
+    """
+    if Image is None:
+        return
+    with _pending_lock:
+        if key in _pending:
+            return
+        _pending.add(key)
+    _executor.submit(_build_variants, store, key, png_bytes)
+
+
+def _build_variants(store, key, png_bytes):
+    try:
+        missing = [
+            (variant, fmt)
+            for variant in VARIANTS
+            for fmt in available_formats()
+            if not store.exists(variant_name(key, variant, fmt[0]))
+        ]
+        if not missing:
+            return
+
+        if png_bytes is None:
+            png_bytes = store.read(f'{key}.png')
+            if png_bytes is None:
+                return
+
+        original = Image.open(io.BytesIO(png_bytes))
+        original.load()
+        if original.mode not in ('RGB', 'RGBA'):
+            original = original.convert('RGBA' if 'A' in original.getbands() else 'RGB')
+
+        resized = {}
+        for variant, (ext, pil_format, _, options) in missing:
+            image = resized.get(variant)
+            if image is None:
+                image = original
+                size = VARIANTS[variant]
+                if size and max(original.size) > size:
+                    image = original.copy()
+                    image.thumbnail((size, size), Image.LANCZOS)
+                resized[variant] = image
+
+            buffer = io.BytesIO()
+            image.save(buffer, format=pil_format, **options)
+            store.put(variant_name(key, variant, ext), buffer.getvalue())
+            metrics.incr(f'image.variants.{ext}')
+            print(f"✓ Image variant {variant}.{ext}: {len(png_bytes) // 1024} KB -> {buffer.tell() // 1024} KB")
+    except Exception as e:
+        print(f"⚠ Failed to build image variants for {key}: {str(e)}")
+    finally:
+        with _pending_lock:
+            _pending.discard(key)
+
+
+def negotiate(store, key, variant, accepted_mimetypes):
+    """
+    Pick what to serve for key/variant given the mimetypes the client
+    explicitly accepts. Returns (name, final): final is False when falling
+    back to the original PNG only because the variant isn't built yet.
+    """
+    acceptable = [fmt for fmt in available_formats() if fmt[2] in accepted_mimetypes]
+    for ext, _, _, _ in acceptable:
+        name = variant_name(key, variant, ext)
+        if store.exists(name):
+            return name, True
+    return f'{key}.png', not acceptable
@@ -0,0 +1,171 @@
+"""
+Live transcription sessions for recordings that are still in progress.
+
+The browser's MediaRecorder chunks are POSTed as they are produced and fed
+into a Speech-to-Text streaming_recognize call running on a background thread,
+so by the time the user stops recording the transcript is (almost) complete.
+
+Sessions live in the memory of the worker that created them. A request that
+lands on a worker without the session gets a 404 and the client falls back to
+the regular upload flow.
+"""
+import os
+import queue
+import threading
+import time
+import uuid
+
+from google.cloud import speech_v1p1beta1 as speech
+
+# Concurrent live sessions per worker (each holds one streaming gRPC call)
+MAX_LIVE_SESSIONS = int(os.getenv('MAX_LIVE_SESSIONS', '20'))
+
+# Abandoned sessions are dropped after this long without activity
+SESSION_IDLE_TIMEOUT = 10 * 60
+
+# Streaming recognize accepts ~5 minutes of audio, matching the recorder limit
+MAX_STREAM_BYTES = 25 * 1024 * 1024
+
+# MediaRecorder container -> Speech encoding (Opus is always 48 kHz)
+STREAMING_ENCODINGS = {
+    'audio/webm': speech.RecognitionConfig.AudioEncoding.WEBM_OPUS,
+    'audio/ogg': speech.RecognitionConfig.AudioEncoding.OGG_OPUS,
+}
+
+_STREAM_END = object()
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class LiveSessionError(Exception):
+    """Raised when a live session cannot be created or used"""
+
+
+class LiveTranscriptionSession:
+    """One in-progress recording streamed into Speech-to-Text"""
+
+    def __init__(self, user_id, language_code, mime_type, client_factory):
+        base_type = (mime_type or '').split(';')[0].strip().lower()
+        if base_type not in STREAMING_ENCODINGS:
+            raise LiveSessionError(f"Live transcription does not support {mime_type or 'this format'}")
+
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.language_code = language_code
+        self.mime_type = base_type
+        self.encoding = STREAMING_ENCODINGS[base_type]
+        self.last_activity = time.time()
+
+        self._client_factory = client_factory
+        self._chunks = queue.Queue()
+        self._audio = bytearray()  # Kept so a failed stream can be re-transcribed from the full upload
+        self._closed = False
+        self._finals = []
+        self._error = None
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'live-stt-{self.id[:8]}', daemon=True)
+        self._thread.start()
+
+    @property
+    def failed(self):
+        return self._error is not None
+
+    def feed(self, data):
+        """Forward one MediaRecorder chunk to the stream"""
+        if self._closed:
+            raise LiveSessionError("Recording already stopped")
+        if len(self._audio) + len(data) > MAX_STREAM_BYTES:
+            raise LiveSessionError("Recording is too large for live transcription")
+
+        self.last_activity = time.time()
+        self._audio.extend(data)
+        self._chunks.put(bytes(data))
+
+    def close(self):
+        """Signal end of audio; Speech returns the final results shortly after"""
+        if not self._closed:
+            self._closed = True
+            self._chunks.put(_STREAM_END)
+        self.last_activity = time.time()
+
+    def wait_transcript(self, timeout=15):
+        """Close the stream and wait for the final transcript (None if streaming failed)"""
+        self.close()
+        if not self._done.wait(timeout):
+            print(f"⚠ Live session {self.id}: timed out waiting for final transcript")
+            return None
+        if self._error:
+            return None
+        return ' '.join(self._finals).strip() or None
+
+    def audio_bytes(self):
+        """Everything received so far, as one container stream"""
+        return bytes(self._audio)
+
+    def _requests(self):
+        while True:
+            chunk = self._chunks.get()
+            if chunk is _STREAM_END:
+                return
+            yield speech.StreamingRecognizeRequest(audio_content=chunk)
+
+    def _run(self):
+        try:
+            config = speech.RecognitionConfig(
+                encoding=self.encoding,
+                sample_rate_hertz=48000,
+                language_code=self.language_code,
+                enable_automatic_punctuation=True,
+                model='default',
+            )
+            streaming_config = speech.StreamingRecognitionConfig(config=config, interim_results=False)
+
+            client = self._client_factory()
+            responses = client.streaming_recognize(config=streaming_config, requests=self._requests())
+            for response in responses:
+                for result in response.results:
+                    if result.is_final and result.alternatives:
+                        self._finals.append(result.alternatives[0].transcript.strip())
+        except Exception as e:
+            print(f"⚠ Live session {self.id} streaming error: {str(e)}")
+            self._error = e
+        finally:
+            self._done.set()
+
+
+def create_session(user_id, language_code, mime_type, client_factory):
+    """Start a live session, evicting idle ones first"""
+    _expire_idle_sessions()
+    with _sessions_lock:
+        if len(_sessions) >= MAX_LIVE_SESSIONS:
+            raise LiveSessionError("Live transcription is busy, please upload instead")
+        session = LiveTranscriptionSession(user_id, language_code, mime_type, client_factory)
+        _sessions[session.id] = session
+    print(f"✓ Live session {session.id} started ({session.mime_type}, {language_code})")
+    return session
+
+
+def get_session(session_id, user_id):
+    """Look up a session owned by user_id (None if unknown, expired or someone else's)"""
+    with _sessions_lock:
+        session = _sessions.get(session_id)
+    if session is None or session.user_id != user_id:
+        return None
+    return session
+
+
+def discard_session(session_id):
+    with _sessions_lock:
+        session = _sessions.pop(session_id, None)
+    if session:
+        session.close()
+
+
+def _expire_idle_sessions():
+    cutoff = time.time() - SESSION_IDLE_TIMEOUT
+    with _sessions_lock:
+        expired = [sid for sid, s in _sessions.items() if s.last_activity < cutoff]
+    for sid in expired:
+        print(f"Expiring idle live session {sid}")
+        discard_session(sid)
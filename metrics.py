@@ -0,0 +1,39 @@
+"""
+In-process counters and timings for this worker, exposed through /api/metrics.
+"""
+import threading
+from collections import defaultdict
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_timings = {}  # name -> {'count', 'sum', 'max'}
+
+
+def incr(name, amount=1):
+    with _lock:
+        _counters[name] += amount
+
+
+def observe(name, value):
+    """Record one measurement (e.g. a latency in ms)"""
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            timing = _timings[name] = {'count': 0, 'sum': 0.0, 'max': 0.0}
+        timing['count'] += 1
+        timing['sum'] += value
+        timing['max'] = max(timing['max'], value)
+
+
+def snapshot():
+    """Copy of all metrics, safe to serialize"""
+    with _lock:
+        timings = {
+            name: {
+                'count': t['count'],
+                'avg': round(t['sum'] / t['count'], 2),
+                'max': round(t['max'], 2),
+            }
+            for name, t in _timings.items()
+        }
+        return {'counters': dict(_counters), 'timings': timings}
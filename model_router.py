@@ -0,0 +1,168 @@
+"""
+Latency-aware routing for recipe extraction.
+
+Picks the Gemini model tier and request timeout for each extraction from
+the transcript length and the recent latency/error history of each tier,
+then records how the call went so the policy can be tuned from real data
+(see /api/metrics).
+
+Short dictations go to the fast tier (a Flash-Lite model without thinking);
+long transcripts, or any transcript while the fast tier is slower or
+failing, go to the standard tier. The output budget is not routed: Gemini
+2.5 Flash's thinking tokens count against max_output_tokens and can't be
+capped with this SDK, so a tight budget only truncates recipes.
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+
+import metrics
+
+# Model tiers
+TIERS = {
+    'fast': {
+        'model': os.getenv('GEMINI_FAST_MODEL', 'models/gemini-2.5-flash-lite'),
+    },
+    'standard': {
+        'model': os.getenv('GEMINI_STANDARD_MODEL', 'models/gemini-2.5-flash'),
+    },
+}
+
+# Transcripts up to this many words are routed to the fast tier
+FAST_MAX_WORDS = int(os.getenv('ROUTER_FAST_MAX_WORDS', '250'))
+
+# Timeout = p95 latency of the tier times this multiplier, within these bounds
+TIMEOUT_P95_MULTIPLIER = 2.0
+MIN_TIMEOUT_SECONDS = 20
+MAX_TIMEOUT_SECONDS = 60
+
+# Latency history per tier, and how much of it is needed before it's trusted
+HISTORY_SIZE = 200
+MIN_SAMPLES = 10
+
+# Stop using the fast tier while more than this share of recent calls failed
+MAX_ERROR_RATE = 0.2
+
+_lock = threading.Lock()
+_history = {tier: deque(maxlen=HISTORY_SIZE) for tier in TIERS}  # (latency_ms, ok)
+_decisions = deque(maxlen=50)
+
+
+class RouteDecision:
+    """Model and timeout chosen for one extraction"""
+
+    def __init__(self, tier, words, output_language, timeout, reason):
+        self.tier = tier
+        self.model = TIERS[tier]['model']
+        self.words = words
+        self.output_language = output_language
+        self.timeout = timeout
+        self.reason = reason
+        self.started = time.time()
+
+    def start(self):
+        """Mark the moment the model call is sent (latency is measured from here)"""
+        self.started = time.time()
+
+    def to_dict(self):
+        return {
+            'tier': self.tier,
+            'model': self.model,
+            'words': self.words,
+            'output_language': self.output_language,
+            'timeout': self.timeout,
+            'reason': self.reason,
+        }
+
+
+def route(transcription, output_language='en'):
+    """Choose tier and timeout for extracting this transcription"""
+    words = len(transcription.split())
+
+    if not TIERS['fast']['model']:
+        tier, reason = 'standard', 'fast tier disabled'
+    elif words > FAST_MAX_WORDS:
+        tier, reason = 'standard', f'{words} words > {FAST_MAX_WORDS}'
+    else:
+        tier, reason = 'fast', f'{words} words'
+        fast_p95 = percentile('fast', 0.95)
+        standard_p95 = percentile('standard', 0.95)
+        if error_rate('fast') > MAX_ERROR_RATE:
+            tier, reason = 'standard', 'fast tier failing'
+        elif fast_p95 is not None and standard_p95 is not None and fast_p95 > standard_p95:
+            tier, reason = 'standard', 'fast tier slower'
+
+    p95 = percentile(tier, 0.95)
+    if p95 is None:
+        timeout = MAX_TIMEOUT_SECONDS
+    else:
+        timeout = int(math.ceil(p95 * TIMEOUT_P95_MULTIPLIER / 1000))
+        timeout = max(MIN_TIMEOUT_SECONDS, min(MAX_TIMEOUT_SECONDS, timeout))
+
+    return RouteDecision(tier, words, output_language, timeout, reason)
+
+
+def record(decision, ok, prompt_tokens=0, output_tokens=0, truncated=False):
+    """Record the outcome of a routed call"""
+    latency_ms = (time.time() - decision.started) * 1000
+    with _lock:
+        _history[decision.tier].append((latency_ms, ok))
+        entry = decision.to_dict()
+        entry.update({
+            'latency_ms': round(latency_ms),
+            'prompt_tokens': prompt_tokens,
+            'output_tokens': output_tokens,
+            'ok': ok,
+            'truncated': truncated,
+        })
+        _decisions.append(entry)
+
+    prefix = f'router.{decision.tier}.'
+    metrics.incr(prefix + 'calls')
+    if not ok:
+        metrics.incr(prefix + 'errors')
+    if truncated:
+        metrics.incr(prefix + 'truncated')
+    metrics.incr(prefix + 'prompt_tokens', prompt_tokens)
+    metrics.incr(prefix + 'output_tokens', output_tokens)
+    metrics.observe(prefix + 'latency_ms', latency_ms)
+    print(f"Route {decision.tier} ({decision.reason}): {latency_ms:.0f} ms, "
+          f"{output_tokens} output tokens, ok={ok}")
+
+
+def percentile(tier, q):
+    """q-th latency percentile (ms) of recent successful calls, or None without enough data"""
+    with _lock:
+        latencies = sorted(latency for latency, ok in _history[tier] if ok)
+    if len(latencies) < MIN_SAMPLES:
+        return None
+    return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+
+def error_rate(tier):
+    with _lock:
+        outcomes = [ok for _, ok in _history[tier]]
+    if len(outcomes) < MIN_SAMPLES:
+        return 0.0
+    return outcomes.count(False) / len(outcomes)
+
+
+def stats():
+    """Per-tier latency percentiles and error rates, plus the most recent decisions"""
+    tiers = {}
+    for tier, config in TIERS.items():
+        with _lock:
+            samples = len(_history[tier])
+        p50, p95 = percentile(tier, 0.5), percentile(tier, 0.95)
+        tiers[tier] = {
+            'model': config['model'],
+            'samples': samples,
+            'p50_ms': round(p50) if p50 is not None else None,
+            'p95_ms': round(p95) if p95 is not None else None,
+            'error_rate': round(error_rate(tier), 4),
+        }
+    with _lock:
+        recent = list(_decisions)
+    return {'tiers': tiers, 'recent': recent}
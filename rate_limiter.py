@@ -0,0 +1,219 @@
+"""
+Token-bucket rate limiting per user and endpoint.
+
+Each (limit name, user) pair has a bucket holding up to `capacity` tokens
+that refills continuously at capacity/period tokens per second; a request
+takes one token. State is two numbers per key, and a key whose bucket has
+refilled completely is indistinguishable from a new one, so idle keys can
+be dropped at any time.
+
+Backends (RATE_LIMIT_BACKEND):
+  memory  per worker process, LRU-bounded (default; fine for one gunicorn worker)
+  sqlite  a SQLite file shared by all workers on the machine (RATE_LIMIT_SQLITE_PATH)
+  redis   any Redis-compatible server shared by all machines (RATE_LIMIT_REDIS_URL;
+          needs the optional `redis` package)
+
+If the shared backend fails, requests are allowed (and counted in metrics)
+rather than turning a limiter outage into an API outage.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # Only needed for RATE_LIMIT_BACKEND=redis
+    redis = None
+
+import metrics
+
+# name -> (capacity, period_seconds); override with RATE_LIMIT_<NAME>="5/60"
+DEFAULT_LIMITS = {
+    'process-recipe': (5, 60),
+    'translate': (10, 60),
+    'generate-image': (3, 60),
+}
+
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory').lower()
+RATE_LIMIT_SQLITE_PATH = os.getenv('RATE_LIMIT_SQLITE_PATH', '/tmp/recipediary-ratelimit.sqlite3')
+RATE_LIMIT_REDIS_URL = os.getenv('RATE_LIMIT_REDIS_URL', 'redis://localhost:6379/0')
+
+# Memory backend bound (keys beyond this evict the least recently used)
+MAX_MEMORY_KEYS = 100000
+
+
+def _load_limits():
+    limits = {}
+    for name, default in DEFAULT_LIMITS.items():
+        value = os.getenv('RATE_LIMIT_' + name.upper().replace('-', '_'))
+        try:
+            capacity, period = (float(part) for part in value.split('/')) if value else default
+        except ValueError:
+            print(f"⚠ Ignoring invalid rate limit {name}={value!r}, expected 'requests/seconds'")
+            capacity, period = default
+        limits[name] = (capacity, period)
+    return limits
+
+
+LIMITS = _load_limits()
+
+
+def _take(tokens, updated_at, now, capacity, rate):
+    """Refill and try to take one token. Returns (allowed, tokens_left, retry_after)"""
+    if tokens is None:
+        tokens = capacity
+    else:
+        tokens = min(capacity, tokens + max(0.0, now - updated_at) * rate)
+    if tokens >= 1:
+        return True, tokens - 1, 0.0
+    return False, tokens, (1 - tokens) / rate
+
+
+class MemoryBackend:
+    """Buckets in this process, in an LRU that also sheds fully refilled keys"""
+
+    def __init__(self, max_keys=MAX_MEMORY_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at, full_at)
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, now):
+        with self._lock:
+            entry = self._buckets.pop(key, None)
+            tokens, updated_at = (entry[0], entry[1]) if entry else (None, None)
+            allowed, tokens, retry_after = _take(tokens, updated_at, now, capacity, rate)
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+            self._evict(now)
+            return allowed, retry_after
+
+    def _evict(self, now):
+        # Least recently used first: drop while they're full again (or over the bound)
+        while self._buckets:
+            key, (_, _, full_at) = next(iter(self._buckets.items()))
+            if full_at > now and len(self._buckets) <= self.max_keys:
+                break
+            del self._buckets[key]
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SQLiteBackend:
+    """Buckets in a SQLite file, shared by every worker process on the machine"""
+
+    CLEANUP_EVERY = 1000  # calls between deletes of fully refilled rows
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._calls = 0
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS buckets '
+            '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, full_at REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS buckets_full_at ON buckets (full_at)')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def take(self, key, capacity, rate, now):
+        conn = self._connection()
+        # IMMEDIATE takes the write lock up front so read-modify-write is atomic across processes
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated_at FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated_at = row if row else (None, None)
+            allowed, tokens, retry_after = _take(tokens, updated_at, now, capacity, rate)
+            conn.execute(
+                'INSERT OR REPLACE INTO buckets (key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?)',
+                (key, tokens, now, now + (capacity - tokens) / rate)
+            )
+            self._calls += 1
+            if self._calls % self.CLEANUP_EVERY == 0:
+                conn.execute('DELETE FROM buckets WHERE full_at < ?', (now,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed, retry_after
+
+
+class RedisBackend:
+    """Buckets in Redis; a Lua script keeps each update atomic and expires idle keys"""
+
+    SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(state[1])
+if tokens == nil then
+  tokens = capacity
+else
+  tokens = math.min(capacity, tokens + math.max(0, now - tonumber(state[2])) * rate)
+end
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+else
+  retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+return {allowed, tostring(retry_after)}
+"""
+
+    def __init__(self, url):
+        if redis is None:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis needs the 'redis' package")
+        self.client = redis.Redis.from_url(url, socket_timeout=1)
+        self.script = self.client.register_script(self.SCRIPT)
+
+    def take(self, key, capacity, rate, now):
+        allowed, retry_after = self.script(keys=[f'ratelimit:{key}'], args=[capacity, rate, now])
+        return bool(allowed), float(retry_after)
+
+
+def _create_backend():
+    try:
+        if RATE_LIMIT_BACKEND == 'sqlite':
+            return SQLiteBackend(RATE_LIMIT_SQLITE_PATH)
+        if RATE_LIMIT_BACKEND == 'redis':
+            return RedisBackend(RATE_LIMIT_REDIS_URL)
+    except Exception as e:
+        print(f"⚠ Rate limiter backend '{RATE_LIMIT_BACKEND}' unavailable, using memory: {str(e)}")
+    return MemoryBackend()
+
+
+_backend = _create_backend()
+
+
+def hit(name, key):
+    """
+    Take one request from the `name` limit for `key` (e.g. a user id).
+    Returns (allowed, retry_after_seconds).
+    """
+    capacity, period = LIMITS[name]
+    rate = capacity / period
+    try:
+        allowed, retry_after = _backend.take(f'{name}:{key}', capacity, rate, time.time())
+    except Exception as e:
+        print(f"⚠ Rate limiter error, allowing request: {str(e)}")
+        metrics.incr('ratelimit.backend_error')
+        return True, 0
+
+    if not allowed:
+        metrics.incr(f'ratelimit.{name}.limited')
+    return allowed, int(math.ceil(retry_after))
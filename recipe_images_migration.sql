@@ -0,0 +1,12 @@
+-- ============================================================================
+-- RECIPE IMAGES MIGRATION
+-- Run this in your Supabase SQL Editor so gallery cards show recipe images
+-- ============================================================================
+
+-- Content key of the last recipe card image generated for a saved recipe.
+-- The gallery loads /api/images/<image_key>/thumb (or /preview on wide
+-- screens), which serves a compressed WebP/AVIF variant of the PNG.
+-- A regenerated image has a new key, so the column is simply overwritten.
+ALTER TABLE recipes ADD COLUMN IF NOT EXISTS image_key TEXT;
+
+-- Existing RLS policies on recipes already restrict reads and updates to the owner.
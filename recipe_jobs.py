@@ -0,0 +1,182 @@
+"""
+Background recipe jobs.
+
+/api/process-recipe accepts the upload, returns 202 with a job id and runs the
+STT + Gemini + credits + save pipeline on a bounded executor, so a slow
+Gemini call no longer pins a request worker. Clients follow progress through
+/api/jobs/<id> (polling) or /api/jobs/<id>/events (Server-Sent Events).
+
+Jobs live in the memory of the worker process that accepted them.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Pipeline stages, in order
+STAGES = ['queued', 'decoding', 'transcribing', 'extracting', 'saving']
+
+# Concurrent pipelines per worker, and how many may wait behind them
+MAX_JOB_WORKERS = int(os.getenv('RECIPE_JOB_WORKERS', '4'))
+MAX_PENDING_JOBS = int(os.getenv('MAX_PENDING_RECIPE_JOBS', '32'))
+
+# Finished jobs are kept this long for clients to collect the result
+FINISHED_JOB_TTL = 30 * 60
+
+_executor = ThreadPoolExecutor(max_workers=MAX_JOB_WORKERS, thread_name_prefix='recipe-job')
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+class JobQueueFullError(Exception):
+    """Raised when too many jobs are already queued or running"""
+
+
+class JobFailed(Exception):
+    """Raised inside a pipeline to fail the job with an HTTP-style status and body"""
+
+    def __init__(self, payload, status=500):
+        super().__init__(payload.get('error', 'Job failed'))
+        self.payload = payload
+        self.status = status
+
+
+class RecipeJob:
+    """
+    State of one pipeline run. Every change is also appended to an event log
+    ('progress', 'field', 'done') that SSE listeners replay from any offset.
+    """
+
+    def __init__(self, user_id):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.status = 'queued'  # queued -> running -> succeeded | failed
+        self.stage = 'queued'
+        self.result = None
+        self.error = None
+        self.http_status = 202
+        self.created_at = time.time()
+        self.finished_at = None
+        self.partial = {}  # Recipe fields streamed so far
+        self._events = []
+        self._changed = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in ('succeeded', 'failed')
+
+    def set_stage(self, stage):
+        with self._changed:
+            self.status = 'running'
+            self.stage = stage
+            self._emit('progress', {'status': self.status, 'stage': stage})
+
+    def add_field(self, kind, key, value):
+        """Record a streamed recipe field ('field') or list element ('item')"""
+        with self._changed:
+            if kind == 'item':
+                self.partial.setdefault(key, []).append(value)
+            else:
+                self.partial[key] = value
+            self._emit('field', {'kind': kind, 'key': key, 'value': value})
+
+    def succeed(self, result):
+        with self._changed:
+            self.status = 'succeeded'
+            self.result = result
+            self.http_status = 200
+            self.finished_at = time.time()
+            self._emit('done', self._snapshot())
+
+    def fail(self, payload, status=500):
+        with self._changed:
+            self.status = 'failed'
+            self.error = payload
+            self.http_status = status
+            self.finished_at = time.time()
+            self._emit('done', self._snapshot())
+
+    def _emit(self, event, data):
+        self._events.append((event, data))
+        self._changed.notify_all()
+
+    def events_since(self, offset, timeout):
+        """Events after offset, waiting up to timeout for at least one (may return [])"""
+        with self._changed:
+            self._changed.wait_for(lambda: len(self._events) > offset, timeout=timeout)
+            return self._events[offset:]
+
+    def to_dict(self):
+        with self._changed:
+            return self._snapshot()
+
+    def _snapshot(self):
+        """Job state as a dict; caller holds self._changed"""
+        data = {
+            'job_id': self.id,
+            'status': self.status,
+            'stage': self.stage,
+            'stages': STAGES,
+            'http_status': self.http_status,
+            'created_at': self.created_at,
+        }
+        if self.result is not None:
+            data['result'] = self.result
+        elif self.partial:
+            data['partial'] = dict(self.partial)
+        if self.error is not None:
+            data['error'] = self.error
+        return data
+
+
+def submit(user_id, pipeline, *args, **kwargs):
+    """
+    Queue pipeline(job, *args, **kwargs) on the executor. The pipeline
+    returns the result dict or raises JobFailed; any other exception fails
+    the job with a generic 500 message.
+    """
+    _expire_finished_jobs()
+    with _jobs_lock:
+        active = sum(1 for job in _jobs.values() if not job.finished)
+        if active >= MAX_JOB_WORKERS + MAX_PENDING_JOBS:
+            raise JobQueueFullError("The server is busy. Please try again in a minute.")
+        job = RecipeJob(user_id)
+        _jobs[job.id] = job
+
+    _executor.submit(_run, job, pipeline, args, kwargs)
+    print(f"Queued recipe job {job.id}")
+    return job
+
+
+def get_job(job_id, user_id):
+    """Look up a job owned by user_id (None if unknown, expired or someone else's)"""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is None or job.user_id != user_id:
+        return None
+    return job
+
+
+def _run(job, pipeline, args, kwargs):
+    started = time.time()
+    try:
+        result = pipeline(job, *args, **kwargs)
+        job.succeed(result)
+        print(f"✓ Recipe job {job.id} finished in {time.time() - started:.1f}s")
+    except JobFailed as e:
+        print(f"Recipe job {job.id} failed at {job.stage}: {e.payload.get('error')}")
+        job.fail(e.payload, e.status)
+    except Exception as e:
+        print(f"Error in recipe job {job.id}: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        job.fail({'error': f'We encountered an issue generating your recipe. Please try again. (Error: {str(e)})'}, 500)
+
+
+def _expire_finished_jobs():
+    cutoff = time.time() - FINISHED_JOB_TTL
+    with _jobs_lock:
+        expired = [jid for jid, job in _jobs.items() if job.finished and job.finished_at < cutoff]
+        for jid in expired:
+            del _jobs[jid]
@@ -0,0 +1,241 @@
+"""
+Incremental parsing of the recipe JSON that Gemini streams back.
+
+RecipeStreamParser is fed text chunks as they arrive and reports each
+top-level recipe field as soon as its value is complete, plus each array
+element (ingredient, instruction, tip) as soon as that element is complete,
+so the client can render the recipe while the model is still writing it.
+
+The same scanner is used to parse the final reply. Because it only ever
+keeps values that were completely written, a reply cut off by MAX_TOKENS
+(or followed by stray text, or missing its closing braces) still yields
+every finished field and every finished list element; parse_recipe()
+closes whatever was left open and validate_recipe() checks the result
+against the recipe shape.
+"""
+import json
+
+# Top-level fields whose values are lists rendered item by item
+LIST_FIELDS = ('ingredients', 'instructions', 'tips')
+
+# Top-level fields holding a single line of text
+TEXT_FIELDS = ('recipe_name', 'author', 'description', 'prep_time', 'cook_time', 'yield')
+
+
+class RecipeStreamParser:
+    """
+    Single-pass scanner over a growing JSON text.
+
+    feed() returns a list of events:
+      ('field', key, value)  a top-level value finished (arrays included)
+      ('item', key, value)   one element of a top-level array finished
+    Anything before the first '{' (such as a ```json fence) and anything
+    after the matching '}' is ignored. salvage() returns everything
+    complete so far as a dict.
+    """
+
+    def __init__(self):
+        self.text = ''
+        self._pos = 0
+        self._started = False
+        self._done = False
+        self._stack = []          # open containers: '{' or '['
+        self._in_string = False
+        self._escape = False
+        self._expect_key = False  # at depth 1: next string is a key
+        self._key = None          # current top-level key
+        self._key_start = None
+        self._value_start = None  # start of the current top-level value
+        self._item_start = None   # start of the current top-level array element
+        self._fields = {}         # completed top-level values
+        self._items = {}          # completed elements of top-level arrays, by key
+
+    @property
+    def done(self):
+        return self._done
+
+    def salvage(self):
+        """
+        The recipe as far as it was written: every completed field, plus the
+        completed elements of an array that is still open (i.e. the open
+        array and object are closed). Half-written values are dropped.
+        """
+        recipe = dict(self._fields)
+        key = self._key
+        if not self._done and key is not None and key not in recipe and key in self._items:
+            recipe[key] = list(self._items[key])
+        return recipe
+
+    def feed(self, chunk):
+        self.text += chunk
+        events = []
+        text = self.text
+
+        while self._pos < len(text) and not self._done:
+            i = self._pos
+            c = text[i]
+            self._pos += 1
+
+            if not self._started:
+                if c == '{':
+                    self._started = True
+                    self._stack.append('{')
+                    self._expect_key = True
+                continue
+
+            depth = len(self._stack)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._string_closed(i, depth, events)
+                continue
+
+            if c == '"':
+                self._in_string = True
+                if depth == 1 and self._expect_key:
+                    self._key_start = i
+                elif depth == 1 and self._value_start is None:
+                    self._value_start = i
+                elif depth == 2 and self._stack[-1] == '[' and self._item_start is None:
+                    self._item_start = i
+            elif c in '{[':
+                if depth == 1 and self._value_start is None:
+                    self._value_start = i
+                elif depth == 2 and self._stack[-1] == '[' and self._item_start is None:
+                    self._item_start = i
+                self._stack.append(c)
+            elif c in '}]':
+                if depth == 2 and self._stack[-1] == '[' and self._item_start is not None:
+                    # Last scalar element of a top-level array
+                    self._emit_item(text[self._item_start:i], events)
+                if depth == 1 and self._value_start is not None:
+                    # Last scalar field of the object
+                    self._emit_field(text[self._value_start:i], events)
+                self._stack.pop()
+                depth = len(self._stack)
+                if depth == 2 and self._stack[-1] == '[' and self._item_start is not None:
+                    self._emit_item(text[self._item_start:i + 1], events)
+                elif depth == 1 and self._value_start is not None:
+                    self._emit_field(text[self._value_start:i + 1], events)
+                elif depth == 0:
+                    self._done = True
+            elif c == ':' and depth == 1:
+                self._expect_key = False
+            elif c == ',':
+                if depth == 1:
+                    if self._value_start is not None:
+                        self._emit_field(text[self._value_start:i], events)
+                    self._expect_key = True
+                elif depth == 2 and self._stack[-1] == '[' and self._item_start is not None:
+                    self._emit_item(text[self._item_start:i], events)
+            elif not c.isspace():
+                # Bare literal (number, true, false, null)
+                if depth == 1 and not self._expect_key and self._value_start is None:
+                    self._value_start = i
+                elif depth == 2 and self._stack[-1] == '[' and self._item_start is None:
+                    self._item_start = i
+
+        return events
+
+    def _string_closed(self, i, depth, events):
+        if depth == 1 and self._expect_key and self._key_start is not None:
+            self._key = _loads(self.text[self._key_start:i + 1])
+            self._key_start = None
+            self._items.pop(self._key, None)
+        elif depth == 1 and self._value_start is not None:
+            self._emit_field(self.text[self._value_start:i + 1], events)
+        elif depth == 2 and self._stack[-1] == '[' and self._item_start is not None:
+            self._emit_item(self.text[self._item_start:i + 1], events)
+
+    def _emit_field(self, raw, events):
+        self._value_start = None
+        value = _loads(raw)
+        if value is _INVALID and raw.lstrip().startswith('[') and self._key in self._items:
+            # e.g. a trailing comma; the elements themselves were all valid
+            value = list(self._items[self._key])
+        if self._key is not None and value is not _INVALID:
+            self._fields[self._key] = value
+            events.append(('field', self._key, value))
+
+    def _emit_item(self, raw, events):
+        self._item_start = None
+        value = _loads(raw)
+        if self._key is not None and value is not _INVALID:
+            self._items.setdefault(self._key, []).append(value)
+            events.append(('item', self._key, value))
+
+
+def parse_recipe(text):
+    """
+    Parse a complete or truncated model reply.
+
+    Returns (recipe, complete): recipe is the validated recipe dict (None if
+    nothing usable was found) and complete is False when the JSON object was
+    cut off and had to be closed.
+    """
+    parser = RecipeStreamParser()
+    parser.feed(text)
+    return validate_recipe(parser.salvage()), parser.done
+
+
+def validate_recipe(data):
+    """
+    Coerce parsed JSON into the recipe shape: text fields become strings,
+    list fields become lists of non-empty strings, unknown keys are dropped.
+    Returns None if there's no name, ingredient or instruction to show.
+    """
+    if not isinstance(data, dict):
+        return None
+
+    recipe = {}
+    for key in TEXT_FIELDS:
+        text = _as_text(data.get(key))
+        if text:
+            recipe[key] = text
+    for key in LIST_FIELDS:
+        value = data.get(key)
+        if value is None:
+            continue
+        if not isinstance(value, list):
+            value = [value]
+        items = [_as_text(item) for item in value]
+        recipe[key] = [item for item in items if item]
+
+    if not (recipe.get('recipe_name') or recipe.get('ingredients') or recipe.get('instructions')):
+        return None
+    return recipe
+
+
+def _as_text(value):
+    """A JSON value as a single string ('' if it has no sensible text form)"""
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, bool) or value is None:
+        return ''
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, list):
+        return ' '.join(filter(None, (_as_text(v) for v in value)))
+    if isinstance(value, dict):
+        # e.g. {"quantity": "2 cups", "item": "flour"}
+        return ' '.join(filter(None, (_as_text(v) for v in value.values())))
+    return ''
+
+
+_INVALID = object()
+
+
+def _loads(raw):
+    raw = raw.strip()
+    if not raw:
+        return _INVALID
+    try:
+        # strict=False accepts raw newlines/tabs inside strings, which models emit
+        return json.loads(raw, strict=False)
+    except ValueError:
+        return _INVALID
@@ -0,0 +1,380 @@
+"""
+In-process full-text search over each user's recipes.
+
+The first search by a user loads all of their recipes once and builds an
+inverted index over every text field (name, author, description,
+ingredients, instructions, tips). Results are ranked with BM25, with fields
+weighted so a match in the name counts for more than one in a tip.
+
+Matching is forgiving:
+  * text is NFKC-normalized and casefolded, Latin accents are ignored, and
+    other scripts keep their combining marks, so Devanagari and Tamil words
+    tokenize intact
+  * a query word that isn't in the user's vocabulary is expanded to similar
+    words (trigram overlap), which covers typos ("tumeric" -> "turmeric")
+    and prefixes while typing ("cardam" -> "cardamom")
+  * every query word must match (itself or one of its expansions)
+
+Indexes are kept current by upsert()/remove() from the write paths, rebuilt
+after INDEX_MAX_AGE_SECONDS to pick up changes made elsewhere, and the least
+recently used ones are evicted when idle or beyond MAX_INDEXED_USERS.
+"""
+import math
+import os
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict, defaultdict
+
+import metrics
+
+# Field weights: a term in the name counts three times one in the instructions
+FIELD_WEIGHTS = {
+    'recipe_name': 3.0,
+    'author': 1.5,
+    'description': 1.0,
+    'ingredients': 1.5,
+    'instructions': 1.0,
+    'tips': 0.5,
+}
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Fuzzy expansion: minimum trigram similarity (Dice) and expansions per query word
+FUZZY_MIN_SIMILARITY = 0.45
+PREFIX_SIMILARITY = 0.8
+MAX_EXPANSIONS = 5
+
+# Index lifecycle
+MAX_INDEXED_USERS = int(os.getenv('RECIPE_SEARCH_MAX_USERS', '200'))
+INDEX_IDLE_SECONDS = int(os.getenv('RECIPE_SEARCH_IDLE_SECONDS', '1800'))
+INDEX_MAX_AGE_SECONDS = int(os.getenv('RECIPE_SEARCH_MAX_AGE_SECONDS', '600'))
+
+# Highlight snippet length (characters) around the first match in a field
+SNIPPET_CHARS = 80
+MAX_HIGHLIGHTS = 3
+
+
+def _is_word_char(c):
+    return unicodedata.category(c)[0] in 'LNM'
+
+
+def tokenize(text):
+    """[(term, start, end)] for each word in text; terms are normalized, spans index text"""
+    tokens = []
+    start = None
+    for i, c in enumerate(text):
+        if _is_word_char(c):
+            if start is None:
+                start = i
+        elif start is not None:
+            tokens.append((normalize(text[start:i]), start, i))
+            start = None
+    if start is not None:
+        tokens.append((normalize(text[start:]), start, len(text)))
+    return tokens
+
+
+def normalize(word):
+    """
+    NFKC + casefold, with accents dropped from Latin letters ("crème" ->
+    "creme"). Marks on other scripts are kept: Indic vowel signs are part
+    of the word.
+    """
+    word = unicodedata.normalize('NFKC', word).casefold()
+    if word.isascii():
+        return word
+    folded = []
+    for c in unicodedata.normalize('NFD', word):
+        if unicodedata.combining(c) and folded and folded[-1] < '\u0250':
+            continue
+        folded.append(c)
+    return unicodedata.normalize('NFC', ''.join(folded))
+
+
+def trigrams(term):
+    padded = f' {term} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def field_texts(recipe):
+    """(field, text) for every searchable value; list fields yield one text per item"""
+    for field in FIELD_WEIGHTS:
+        value = recipe.get(field)
+        if isinstance(value, list):
+            for item in value:
+                if isinstance(item, str) and item:
+                    yield field, item
+        elif isinstance(value, str) and value:
+            yield field, value
+
+
+class RecipeSearchIndex:
+    """Inverted index over one user's recipes"""
+
+    def __init__(self, recipes=()):
+        self.built_at = time.time()
+        self.used_at = self.built_at
+        self._lock = threading.Lock()
+        self._docs = {}                      # recipe id -> (recipe, weighted term counts, length)
+        self._postings = defaultdict(dict)   # term -> {recipe id: weighted term frequency}
+        self._trigrams = defaultdict(set)    # trigram -> terms containing it
+        self._total_length = 0.0
+        for recipe in recipes:
+            self._add(recipe)
+
+    def __len__(self):
+        return len(self._docs)
+
+    def upsert(self, recipe):
+        with self._lock:
+            self._remove(recipe.get('id'))
+            self._add(recipe)
+
+    def remove(self, recipe_id):
+        with self._lock:
+            self._remove(recipe_id)
+
+    def _add(self, recipe):
+        recipe_id = recipe.get('id')
+        if recipe_id is None:
+            return
+        counts = Counter()
+        for field, text in field_texts(recipe):
+            weight = FIELD_WEIGHTS[field]
+            for term, _, _ in tokenize(text):
+                counts[term] += weight
+        length = sum(counts.values())
+
+        self._docs[recipe_id] = (recipe, counts, length)
+        self._total_length += length
+        for term, tf in counts.items():
+            postings = self._postings[term]
+            if not postings:
+                for gram in trigrams(term):
+                    self._trigrams[gram].add(term)
+            postings[recipe_id] = tf
+
+    def _remove(self, recipe_id):
+        doc = self._docs.pop(recipe_id, None)
+        if doc is None:
+            return
+        _, counts, length = doc
+        self._total_length -= length
+        for term in counts:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(recipe_id, None)
+            if not postings:
+                del self._postings[term]
+                for gram in trigrams(term):
+                    terms = self._trigrams.get(gram)
+                    if terms is not None:
+                        terms.discard(term)
+                        if not terms:
+                            del self._trigrams[gram]
+
+    def _expand(self, term):
+        """{indexed term: match weight} for one query word"""
+        if term in self._postings:
+            return {term: 1.0}
+        if len(term) < 3:
+            # Too short for trigrams to mean much; allow prefixes only
+            return {t: PREFIX_SIMILARITY for t in self._postings if t.startswith(term)}
+
+        grams = trigrams(term)
+        shared = Counter()
+        for gram in grams:
+            for candidate in self._trigrams.get(gram, ()):
+                shared[candidate] += 1
+
+        matches = {}
+        for candidate, count in shared.items():
+            similarity = 2 * count / (len(grams) + len(trigrams(candidate)))
+            if candidate.startswith(term):
+                similarity = max(similarity, PREFIX_SIMILARITY)
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                matches[candidate] = similarity
+        best = sorted(matches.items(), key=lambda item: item[1], reverse=True)[:MAX_EXPANSIONS]
+        return dict(best)
+
+    def search(self, query):
+        """
+        Recipes matching every word of query, best first, as
+        [(recipe, score, highlights)]. highlights is a list of
+        {'field', 'text', 'matches': [[start, end], ...]} snippets.
+        """
+        words = list(dict.fromkeys(term for term, _, _ in tokenize(query)))
+        if not words:
+            return []
+
+        with self._lock:
+            self.used_at = time.time()
+            doc_count = len(self._docs)
+            if not doc_count:
+                return []
+            average_length = self._total_length / doc_count or 1.0
+
+            scores = None
+            matched_terms = set()
+            for word in words:
+                expansions = self._expand(word)
+                word_scores = {}
+                for term, weight in expansions.items():
+                    postings = self._postings[term]
+                    idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for recipe_id, tf in postings.items():
+                        length = self._docs[recipe_id][2]
+                        norm = tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length))
+                        # A recipe matching several expansions of one word scores its best one
+                        word_scores[recipe_id] = max(word_scores.get(recipe_id, 0.0), weight * idf * norm)
+                matched_terms.update(expansions)
+
+                if scores is None:
+                    scores = word_scores
+                else:
+                    scores = {rid: score + word_scores[rid] for rid, score in scores.items() if rid in word_scores}
+                if not scores:
+                    return []
+
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            results = [(self._docs[rid][0], score) for rid, score in ranked]
+
+        return [(recipe, round(score, 4), highlight(recipe, matched_terms)) for recipe, score in results]
+
+
+def highlight(recipe, terms):
+    """Snippets of the fields where terms occur, with the matched spans"""
+    highlights = []
+    for field, text in field_texts(recipe):
+        spans = [[start, end] for term, start, end in tokenize(text) if term in terms]
+        if not spans:
+            continue
+        # Window around the first match, shifted so spans stay relative to the snippet
+        offset = max(0, spans[0][0] - SNIPPET_CHARS // 4)
+        snippet = text[offset:offset + SNIPPET_CHARS]
+        matches = [[start - offset, end - offset] for start, end in spans if end - offset <= len(snippet)]
+        highlights.append({
+            'field': field,
+            'text': snippet,
+            'prefix': offset > 0,
+            'suffix': offset + SNIPPET_CHARS < len(text),
+            'matches': matches,
+        })
+        if len(highlights) >= MAX_HIGHLIGHTS:
+            break
+    return highlights
+
+
+_lock = threading.Lock()
+_indexes = OrderedDict()   # user id -> RecipeSearchIndex, least recently used first
+_building = {}             # user id -> writes seen while that user's index is being built
+_build_locks = {}          # user id -> Lock held while that user's index is built
+
+
+def search(user_id, query, load_recipes):
+    """
+    Rank user_id's recipes against query. load_recipes() returns all of the
+    user's recipes and is only called when there's no current index.
+    """
+    started = time.perf_counter()
+    index = _get_index(user_id, load_recipes)
+    results = index.search(query)
+    metrics.observe('recipe_search.query_ms', (time.perf_counter() - started) * 1000)
+    return results
+
+
+def upsert(user_id, recipe):
+    """Add or replace a recipe in the user's index (if one is loaded)"""
+    _apply(user_id, ('upsert', recipe))
+
+
+def remove(user_id, recipe_id):
+    _apply(user_id, ('remove', recipe_id))
+
+
+def _apply(user_id, op):
+    with _lock:
+        pending = _building.get(user_id)
+        if pending is not None:
+            pending.append(op)
+        index = _indexes.get(user_id)
+    if index is not None:
+        _replay(index, [op])
+
+
+def _replay(index, ops):
+    for action, value in ops:
+        if action == 'upsert':
+            index.upsert(value)
+        else:
+            index.remove(value)
+
+
+def _get_index(user_id, load_recipes):
+    now = time.time()
+    with _lock:
+        _evict(now)
+        index = _indexes.get(user_id)
+        if index is not None and now - index.built_at < INDEX_MAX_AGE_SECONDS:
+            _indexes.move_to_end(user_id)
+            metrics.incr('recipe_search.index_hit')
+            return index
+
+        build_lock = _build_locks.get(user_id)
+        if build_lock is None:
+            build_lock = _build_locks[user_id] = threading.Lock()
+
+    # One build per user at a time; concurrent searches wait for it
+    with build_lock:
+        with _lock:
+            index = _indexes.get(user_id)
+            if index is not None and now - index.built_at < INDEX_MAX_AGE_SECONDS:
+                _indexes.move_to_end(user_id)
+                return index
+            _building[user_id] = []
+
+        started = time.perf_counter()
+        try:
+            index = RecipeSearchIndex(load_recipes())
+        except Exception:
+            with _lock:
+                _building.pop(user_id, None)
+                # No index to evict it with later; waiters still hold a reference
+                if user_id not in _indexes:
+                    _build_locks.pop(user_id, None)
+            raise
+
+        with _lock:
+            # Writes that raced with the load are applied on top of it
+            _replay(index, _building.pop(user_id, []))
+            _indexes[user_id] = index
+            _indexes.move_to_end(user_id)
+            _evict(time.time())
+
+    metrics.incr('recipe_search.index_build')
+    metrics.observe('recipe_search.build_ms', (time.perf_counter() - started) * 1000)
+    print(f"✓ Built search index for {len(index)} recipes in {(time.perf_counter() - started) * 1000:.0f}ms")
+    return index
+
+
+def _evict(now):
+    """Drop idle indexes and the least recently used beyond MAX_INDEXED_USERS; caller holds _lock"""
+    for user_id in [uid for uid, index in _indexes.items() if now - index.used_at > INDEX_IDLE_SECONDS]:
+        del _indexes[user_id]
+        _build_locks.pop(user_id, None)
+    while len(_indexes) > MAX_INDEXED_USERS:
+        user_id, _ = _indexes.popitem(last=False)
+        _build_locks.pop(user_id, None)
+
+
+def stats():
+    with _lock:
+        return {
+            'indexed_users': len(_indexes),
+            'indexed_recipes': sum(len(index) for index in _indexes.values()),
+            'max_users': MAX_INDEXED_USERS,
+        }
@@ -0,0 +1,17 @@
+-- ============================================================================
+-- RECIPE LISTING MIGRATION
+-- Run this in your Supabase SQL Editor so paginated /api/recipes stays fast
+-- ============================================================================
+
+-- GET /api/recipes pages through a user's recipes newest first, resuming
+-- after the (created_at, id) of the last recipe on the previous page.
+-- This index serves both the filter and the sort without scanning older pages.
+CREATE INDEX IF NOT EXISTS idx_recipes_user_created_id
+ON recipes (user_id, created_at DESC, id DESC);
+
+-- Optional: trigram indexes for the ?search= filter (ILIKE on name, author
+-- and description). Worth adding once users have thousands of recipes.
+-- CREATE EXTENSION IF NOT EXISTS pg_trgm;
+-- CREATE INDEX IF NOT EXISTS idx_recipes_name_trgm ON recipes USING gin (recipe_name gin_trgm_ops);
+-- CREATE INDEX IF NOT EXISTS idx_recipes_author_trgm ON recipes USING gin (author gin_trgm_ops);
+-- CREATE INDEX IF NOT EXISTS idx_recipes_description_trgm ON recipes USING gin (description gin_trgm_ops);
@@ -0,0 +1,195 @@
+"""
+Single entry point for Supabase table and RPC calls (PostgREST over HTTPS).
+
+Every call goes through the shared keep-alive pool in upstream_clients with
+the same connect/read timeouts, so a hung PostgREST request fails after
+SUPABASE_TIMEOUT_SECONDS instead of pinning a gunicorn worker. Failures that
+are safe to repeat are retried a bounded number of times, and the latency of
+each table/RPC is recorded as a histogram for /api/metrics.
+
+Requests run in an auth context: as_user(token) forwards the user's JWT so
+row level security applies, as_service() uses SUPABASE_SERVICE_KEY (falling
+back to SUPABASE_KEY) for server-side RPCs such as add_credits.
+"""
+import os
+import threading
+import time
+
+import requests
+
+import metrics
+import upstream_clients
+
+# Connect timeout is short: a PostgREST that can't accept a connection is down
+SUPABASE_CONNECT_TIMEOUT = float(os.getenv('SUPABASE_CONNECT_TIMEOUT_SECONDS', '3'))
+SUPABASE_TIMEOUT_SECONDS = float(os.getenv('SUPABASE_TIMEOUT_SECONDS', '10'))
+
+# Extra attempts after the first one, with exponential backoff between them
+SUPABASE_MAX_RETRIES = int(os.getenv('SUPABASE_MAX_RETRIES', '2'))
+RETRY_BACKOFF_SECONDS = 0.2
+
+# Reads may be retried on any gateway error; writes only when PostgREST
+# reports it never reached the database
+RETRYABLE_READ_STATUSES = (502, 503, 504)
+RETRYABLE_WRITE_STATUSES = (503,)
+
+# Latency histogram bucket upper bounds (ms); the last bucket is open-ended
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_lock = threading.Lock()
+_histograms = {}  # call name ('table:recipes', 'rpc:add_credits') -> stats
+
+
+class SupabaseError(Exception):
+    """A PostgREST call failed; status is the HTTP status (None if none arrived)"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class SupabaseGateway:
+    """Builds auth-context clients for one Supabase project"""
+
+    def __init__(self, url, anon_key, service_key=None):
+        self.url = url.rstrip('/') if url else None
+        self.anon_key = anon_key
+        self.service_key = service_key or anon_key
+
+    @property
+    def configured(self):
+        return bool(self.url and self.anon_key)
+
+    def as_user(self, token):
+        """Client acting as the signed-in user (row level security applies)"""
+        return SupabaseClient(self, token)
+
+    def as_service(self):
+        """Client acting with the server's key, for privileged RPCs"""
+        return SupabaseClient(self, self.service_key, api_key=self.service_key)
+
+
+class SupabaseClient:
+    """
+    Thin PostgREST client bound to one bearer token. filters are column ->
+    value pairs matched with eq; params passes any other PostgREST query
+    parameters (order, limit, or, lt, ...) through unchanged.
+    """
+
+    def __init__(self, gateway, token, api_key=None):
+        self.gateway = gateway
+        self.headers = {
+            "apikey": api_key or gateway.anon_key,
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json",
+        }
+
+    def select(self, table, filters=None, columns='*', params=None):
+        query = {'select': columns, **_eq(filters), **(params or {})}
+        return self._call('GET', f'table:{table}', f'/rest/v1/{table}', params=query)
+
+    def insert(self, table, row):
+        return self._call('POST', f'table:{table}', f'/rest/v1/{table}', json=row,
+                          prefer='return=representation')
+
+    def update(self, table, values, filters):
+        return self._call('PATCH', f'table:{table}', f'/rest/v1/{table}', params=_eq(filters), json=values,
+                          prefer='return=representation')
+
+    def delete(self, table, filters):
+        return self._call('DELETE', f'table:{table}', f'/rest/v1/{table}', params=_eq(filters),
+                          prefer='return=representation')
+
+    def rpc(self, name, args=None):
+        return self._call('POST', f'rpc:{name}', f'/rest/v1/rpc/{name}', json=args or {})
+
+    def _call(self, method, name, path, params=None, json=None, prefer=None):
+        """Run one request with timeouts and retries; returns the decoded JSON body"""
+        if not self.gateway.configured:
+            raise SupabaseError("Supabase is not configured")
+
+        headers = dict(self.headers, Prefer=prefer) if prefer else self.headers
+        read_only = method == 'GET'
+        retryable = RETRYABLE_READ_STATUSES if read_only else RETRYABLE_WRITE_STATUSES
+        session = upstream_clients.get_http_session()
+
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                response = session.request(
+                    method, f"{self.gateway.url}{path}",
+                    headers=headers, params=params, json=json,
+                    timeout=(SUPABASE_CONNECT_TIMEOUT, SUPABASE_TIMEOUT_SECONDS)
+                )
+            except requests.RequestException as e:
+                _record(name, started, ok=False)
+                # A write that got as far as sending may already have been applied
+                if attempt < SUPABASE_MAX_RETRIES and (read_only or isinstance(e, requests.ConnectTimeout)):
+                    attempt = _backoff(name, attempt)
+                    continue
+                raise SupabaseError(f"{name} failed: {str(e)}") from e
+
+            _record(name, started, ok=response.status_code < 500)
+            if response.status_code in retryable and attempt < SUPABASE_MAX_RETRIES:
+                attempt = _backoff(name, attempt)
+                continue
+            if response.status_code >= 400:
+                raise SupabaseError(f"{name} failed: {response.status_code} - {response.text[:300]}",
+                                    response.status_code)
+            if response.status_code == 204 or not response.content:
+                return None
+            try:
+                return response.json()
+            except ValueError as e:
+                raise SupabaseError(f"{name} returned invalid JSON", response.status_code) from e
+
+
+def _eq(filters):
+    return {column: f'eq.{value}' for column, value in (filters or {}).items()}
+
+
+def _backoff(name, attempt):
+    metrics.incr(f'supabase.{name}.retry')
+    time.sleep(RETRY_BACKOFF_SECONDS * (2 ** attempt))
+    return attempt + 1
+
+
+def _record(name, started, ok):
+    elapsed_ms = (time.monotonic() - started) * 1000
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = {
+                'count': 0, 'errors': 0, 'sum': 0.0, 'max': 0.0,
+                'buckets': [0] * (len(LATENCY_BUCKETS_MS) + 1),
+            }
+        histogram['count'] += 1
+        histogram['sum'] += elapsed_ms
+        histogram['max'] = max(histogram['max'], elapsed_ms)
+        if not ok:
+            histogram['errors'] += 1
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                histogram['buckets'][i] += 1
+                break
+        else:
+            histogram['buckets'][-1] += 1
+
+
+def stats():
+    """Latency histogram (ms) and error count per table and RPC"""
+    labels = [f'le_{bound}' for bound in LATENCY_BUCKETS_MS] + ['inf']
+    counters = metrics.snapshot()['counters']
+    with _lock:
+        return {
+            name: {
+                'count': h['count'],
+                'errors': h['errors'],
+                'retries': counters.get(f'supabase.{name}.retry', 0),
+                'avg_ms': round(h['sum'] / h['count'], 2),
+                'max_ms': round(h['max'], 2),
+                'buckets': dict(zip(labels, h['buckets'])),
+            }
+            for name, h in _histograms.items()
+        }
@@ -0,0 +1,12 @@
+-- ============================================================================
+-- RECIPE TRANSLATIONS MIGRATION
+-- Run this in your Supabase SQL Editor to enable /api/recipes/<id>/translate
+-- ============================================================================
+
+-- Translated versions of each recipe, keyed by language code:
+-- { "hi": { "recipe_name": "...", "ingredients": [...], ..., "source_hash": "..." } }
+-- source_hash identifies the recipe text a translation was made from, so
+-- translations of an edited recipe are redone instead of served stale.
+ALTER TABLE recipes ADD COLUMN IF NOT EXISTS translations JSONB DEFAULT '{}'::jsonb NOT NULL;
+
+-- Existing RLS policies on recipes already restrict reads and updates to the owner.
@@ -0,0 +1,195 @@
+"""
+Process-wide registry of long-lived upstream clients.
+
+Creating a Speech client, reloading service-account credentials or opening a
+fresh TLS connection on every request costs hundreds of milliseconds. This
+module owns one instance of each client per worker process, caches OAuth
+access tokens until shortly before they expire, and warms connections when
+the worker boots.
+
+Everything is created lazily and rebuilt automatically if the process forks
+(e.g. gunicorn --preload), since gRPC channels and sockets must not be shared
+across processes.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import google.auth
+import google.auth.transport.requests
+import google.generativeai as genai
+import requests
+from google.cloud import speech_v1p1beta1 as speech
+from requests.adapters import HTTPAdapter
+
+DEFAULT_GEMINI_MODEL = 'models/gemini-2.5-flash'
+
+CLOUD_PLATFORM_SCOPE = 'https://www.googleapis.com/auth/cloud-platform'
+
+# Refresh cached OAuth tokens this long before they actually expire
+TOKEN_REFRESH_MARGIN_SECONDS = 5 * 60
+
+# Keep-alive connections per upstream host (one pool per host)
+HTTP_POOL_CONNECTIONS = 10
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '20'))
+
+_lock = threading.RLock()
+_token_lock = threading.Lock()  # Separate so a token refresh never blocks other client lookups
+_pid = None
+_speech_client = None
+_gemini_models = {}
+_http_session = None
+_vertex_credentials = None
+_vertex_project_id = None
+
+
+def _ensure_current_process():
+    """Drop every client inherited from a parent process after a fork"""
+    global _pid, _speech_client, _gemini_models, _http_session, _vertex_credentials, _vertex_project_id
+    if _pid != os.getpid():
+        _pid = os.getpid()
+        _speech_client = None
+        _gemini_models = {}
+        _http_session = None
+        _vertex_credentials = None
+        _vertex_project_id = None
+
+
+def get_speech_client():
+    """Shared Speech-to-Text client (gRPC clients are thread-safe)"""
+    global _speech_client
+    with _lock:
+        _ensure_current_process()
+        if _speech_client is None:
+            _speech_client = speech.SpeechClient()
+        return _speech_client
+
+
+def get_gemini_model(model_name=DEFAULT_GEMINI_MODEL):
+    """Shared GenerativeModel per model name (genai must already be configured)"""
+    with _lock:
+        _ensure_current_process()
+        model = _gemini_models.get(model_name)
+        if model is None:
+            model = genai.GenerativeModel(model_name)
+            _gemini_models[model_name] = model
+        return model
+
+
+def get_http_session():
+    """Shared requests.Session with keep-alive connection pools per host"""
+    global _http_session
+    with _lock:
+        _ensure_current_process()
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _http_session = session
+        return _http_session
+
+
+def _load_vertex_credentials():
+    """Load service-account (or default) credentials and the project id once"""
+    global _vertex_credentials, _vertex_project_id
+
+    creds_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
+    project_id = os.getenv('GOOGLE_CLOUD_PROJECT')
+
+    if creds_path and os.path.exists(creds_path):
+        print(f"Loading credentials from file: {creds_path}")
+        # Import here to avoid top-level dependency issues
+        from google.oauth2 import service_account
+        credentials = service_account.Credentials.from_service_account_file(
+            creds_path,
+            scopes=[CLOUD_PLATFORM_SCOPE]
+        )
+        # Try to get project_id from credentials if not set in env
+        if not project_id and hasattr(credentials, 'project_id'):
+            project_id = credentials.project_id
+    else:
+        print("Using google.auth.default()...")
+        credentials, auth_project_id = google.auth.default(scopes=[CLOUD_PLATFORM_SCOPE])
+        if not project_id:
+            project_id = auth_project_id
+
+    _vertex_credentials = credentials
+    _vertex_project_id = project_id
+
+
+def _token_expiring(credentials):
+    if not credentials.token or not credentials.expiry:
+        return True
+    expiry = credentials.expiry
+    if expiry.tzinfo is None:
+        # google-auth stores naive UTC datetimes
+        expiry = expiry.replace(tzinfo=timezone.utc)
+    remaining = (expiry - datetime.now(timezone.utc)).total_seconds()
+    return remaining < TOKEN_REFRESH_MARGIN_SECONDS
+
+
+def get_vertex_access_token():
+    """
+    Return (access_token, project_id) for Vertex AI, refreshing the cached
+    token only when it is missing or close to expiry.
+    """
+    with _token_lock:
+        with _lock:
+            _ensure_current_process()
+        if _vertex_credentials is None:
+            _load_vertex_credentials()
+
+        if not _vertex_project_id:
+            raise Exception("Could not determine Google Cloud Project ID. Please set GOOGLE_CLOUD_PROJECT environment variable.")
+
+        if _token_expiring(_vertex_credentials):
+            auth_req = google.auth.transport.requests.Request(session=get_http_session())
+            _vertex_credentials.refresh(auth_req)
+            print(f"✓ Refreshed Vertex AI access token (expires {_vertex_credentials.expiry})")
+
+        return _vertex_credentials.token, _vertex_project_id
+
+
+def warm_up(supabase_url=None, gemini_api_key=None):
+    """
+    Create clients and open connections before the first request arrives.
+    Failures are only logged; every client is created lazily anyway.
+    """
+    started = time.time()
+    session = get_http_session()
+
+    try:
+        get_speech_client()
+    except Exception as e:
+        print(f"⚠ Warm-up: Speech client unavailable: {str(e)}")
+
+    if gemini_api_key:
+        try:
+            get_gemini_model()
+            # Opens a pooled TLS connection for the REST image endpoint
+            session.head('https://generativelanguage.googleapis.com/', timeout=5)
+        except Exception as e:
+            print(f"⚠ Warm-up: Gemini endpoint unreachable: {str(e)}")
+
+    if supabase_url:
+        try:
+            session.head(f"{supabase_url}/rest/v1/", timeout=5)
+        except Exception as e:
+            print(f"⚠ Warm-up: Supabase unreachable: {str(e)}")
+
+    if os.getenv('GOOGLE_APPLICATION_CREDENTIALS') or os.getenv('GOOGLE_CLOUD_PROJECT'):
+        try:
+            get_vertex_access_token()
+        except Exception as e:
+            print(f"⚠ Warm-up: Vertex AI token unavailable: {str(e)}")
+
+    print(f"✓ Upstream clients warmed up in {time.time() - started:.2f}s")
+
+
+def start_warm_up(**kwargs):
+    """Warm up on a background thread so worker boot isn't delayed"""
+    if os.getenv('WARM_UP_CLIENTS', 'true').lower() in ('0', 'false', 'no'):
+        return
+    threading.Thread(target=warm_up, kwargs=kwargs, name='client-warm-up', daemon=True).start()